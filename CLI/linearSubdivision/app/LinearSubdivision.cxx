@@ -35,6 +35,7 @@ int main(int argc, char *argv[])
 
   //Subdivide mesh
   subdivisionFilter->SetNumberOfSubdivisions(subdivisions);
+  subdivisionFilter->SetUseSMP(useSMP);
   subdivisionFilter->SetInputData(triangles->GetOutput());
   subdivisionFilter->Update();
 
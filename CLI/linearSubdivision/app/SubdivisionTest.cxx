@@ -3,6 +3,7 @@
 #include <vtkCellData.h>
 #include <vtkCellArray.h>
 #include <vtkDoubleArray.h>
+#include <vtkDataSetAttributes.h>
 #include <vtkPoints.h>
 #include <vtkTriangle.h>
 #include <vtkPolyData.h>
@@ -16,6 +17,7 @@
 #include <vtkRenderWindow.h>
 #include <vtkRenderer.h>
 #include <vtkRenderWindowInteractor.h>
+#include <vtkTimerLog.h>
 
 #include <string>
 
@@ -25,10 +27,131 @@
 
 #include "vtkLinearSubdivisionFilter2.h"
 
+// Compare two point data or cell data (same arrays, same values bitwise)
+bool CompareData(vtkDataSetAttributes *data1, vtkDataSetAttributes *data2, const char *name)
+{
+  if (data1->GetNumberOfArrays() != data2->GetNumberOfArrays())
+  {
+    std::cerr << "    Different number of " << name << " arrays" << std::endl;
+    return false;
+  }
+
+  for (int a = 0; a < data1->GetNumberOfArrays(); a++)
+  {
+    vtkDataArray *array1 = data1->GetArray(a);
+    vtkDataArray *array2 = data2->GetArray(a);
+    if (!array1 || !array2 ||
+        array1->GetNumberOfTuples() != array2->GetNumberOfTuples() ||
+        array1->GetNumberOfComponents() != array2->GetNumberOfComponents())
+    {
+      std::cerr << "    Different " << name << " array " << a << std::endl;
+      return false;
+    }
+
+    for (vtkIdType i = 0; i < array1->GetNumberOfTuples(); i++)
+    {
+      for (int c = 0; c < array1->GetNumberOfComponents(); c++)
+      {
+        if (array1->GetComponent(i, c) != array2->GetComponent(i, c))
+        {
+          std::cerr << "    Different " << name << " array " << a << " tuple " << i << std::endl;
+          return false;
+        }
+      }
+    }
+  }
+
+  return true;
+}
+
+// Compare the outputs of the serial and the parallel (SMP) code paths of
+// vtkLinearSubdivisionFilter2: same points (bitwise), same cells, same point data and same cell data
+bool CompareSerialAndSMP(vtkPolyData *mesh, int numberOfSubdivisions)
+{
+  vtkSmartPointer<vtkPolyData> outputs[2];
+  double times[2];
+  for (int smp = 0; smp < 2; smp++)
+  {
+    vtkSmartPointer<vtkLinearSubdivisionFilter2> subdivisionFilter =
+      vtkSmartPointer<vtkLinearSubdivisionFilter2>::New();
+    subdivisionFilter->SetNumberOfSubdivisions(numberOfSubdivisions);
+    subdivisionFilter->SetUseSMP(smp);
+    subdivisionFilter->SetInputData(mesh);
+
+    vtkSmartPointer<vtkTimerLog> timer =
+      vtkSmartPointer<vtkTimerLog>::New();
+    timer->StartTimer();
+    subdivisionFilter->Update();
+    timer->StopTimer();
+
+    times[smp] = timer->GetElapsedTime();
+    outputs[smp] = subdivisionFilter->GetOutput();
+  }
+
+  std::cout << "    Level " << numberOfSubdivisions << ": serial " << times[0]
+            << " s, SMP " << times[1] << " s" << std::endl;
+
+  vtkPolyData *serial = outputs[0];
+  vtkPolyData *parallel = outputs[1];
+  if (serial->GetNumberOfPoints() != parallel->GetNumberOfPoints() ||
+      serial->GetNumberOfPolys() != parallel->GetNumberOfPolys())
+  {
+    std::cerr << "    Different number of points or cells" << std::endl;
+    return false;
+  }
+
+  //the cell data of the input mesh must be copied to the subdivided cells
+  if (mesh->GetCellData()->GetNumberOfArrays() > 0 &&
+      serial->GetCellData()->GetNumberOfArrays() == 0)
+  {
+    std::cerr << "    The cell data is not copied" << std::endl;
+    return false;
+  }
+
+  for (vtkIdType i = 0; i < serial->GetNumberOfPoints(); i++)
+  {
+    double p1[3], p2[3];
+    serial->GetPoint(i, p1);
+    parallel->GetPoint(i, p2);
+    if (p1[0] != p2[0] || p1[1] != p2[1] || p1[2] != p2[2])
+    {
+      std::cerr << "    Different point " << i << std::endl;
+      return false;
+    }
+  }
+
+  vtkIdType npts1, npts2;
+  vtkIdType *pts1, *pts2;
+  vtkCellArray *polys1 = serial->GetPolys();
+  vtkCellArray *polys2 = parallel->GetPolys();
+  polys1->InitTraversal();
+  polys2->InitTraversal();
+  for (vtkIdType cellId = 0; polys1->GetNextCell(npts1, pts1); cellId++)
+  {
+    polys2->GetNextCell(npts2, pts2);
+    if (npts1 != npts2 || pts1[0] != pts2[0] || pts1[1] != pts2[1] || pts1[2] != pts2[2])
+    {
+      std::cerr << "    Different cell " << cellId << std::endl;
+      return false;
+    }
+  }
+
+  return CompareData(serial->GetPointData(), parallel->GetPointData(), "point data") &&
+         CompareData(serial->GetCellData(), parallel->GetCellData(), "cell data");
+}
+
 int main(int argc, char *argv[])
 {
   vtkSmartPointer<vtkPolyData> originalMesh;
 
+  //--compare: only compare the serial and the SMP subdivisions (no rendering)
+  bool compareOnly = argc > 1 && std::string(argv[1]) == "--compare";
+  if (compareOnly)
+  {
+    argc--;
+    argv++;
+  }
+
   if(argc > 1) //If a file name is specified, open and use the file.
   {
     vtkSmartPointer<vtkPolyDataReader> reader =
@@ -62,6 +185,32 @@ int main(int argc, char *argv[])
   std::cout << "    There are " << originalMesh->GetNumberOfPolys()
             << " triangles." << std::endl;
 
+  //cell data to check that it is copied to the subdivided cells
+  vtkSmartPointer<vtkDoubleArray> cellIds =
+    vtkSmartPointer<vtkDoubleArray>::New();
+  cellIds->SetName("CellIds");
+  cellIds->SetNumberOfTuples(originalMesh->GetNumberOfCells());
+  for (vtkIdType cellId = 0; cellId < originalMesh->GetNumberOfCells(); cellId++)
+  {
+    cellIds->SetValue(cellId, cellId);
+  }
+  originalMesh->GetCellData()->AddArray(cellIds);
+
+  std::cout << "Comparing the serial and the SMP subdivisions" << std::endl;
+  for (int level = 1; level <= 10; level++)
+  {
+    if (!CompareSerialAndSMP(originalMesh, level))
+    {
+      std::cerr << "The serial and the SMP subdivisions differ at level " << level << std::endl;
+      return EXIT_FAILURE;
+    }
+  }
+
+  if (compareOnly)
+  {
+    return EXIT_SUCCESS;
+  }
+
   double numberOfViewports = 3.;
 
   vtkSmartPointer<vtkRenderWindow> renderWindow =
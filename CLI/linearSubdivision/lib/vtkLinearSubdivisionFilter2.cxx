@@ -19,13 +19,139 @@
 #include "vtkObjectFactory.h"
 #include "vtkPointData.h"
 #include "vtkPolyData.h"
+#include "vtkIdTypeArray.h"
+#include "vtkSMPTools.h"
+#include "vtkSmartPointer.h"
 #include <string>
 #include <sstream>
+#include <vector>
 
 #include "vtkCleanPolyData.h"
 
 vtkStandardNewMacro(vtkLinearSubdivisionFilter2);
 
+namespace
+{
+
+//Generate the weights used to interpolate the points of a subdivided cell,
+//in the order of the points of the cell
+std::vector< std::vector< double> > SubdivisionWeights(int subdivisions)
+{
+  std::vector< std::vector< double> > weight_array;
+  for (int i = 0 ; i <= subdivisions; i++){
+    for (int j = 0 ; j <= subdivisions-i; j++){
+      int k= subdivisions - i - j;
+      std::vector< double> w(3);
+
+      w[0] = ((double) i) / subdivisions;
+      w[1] = ((double) j) / subdivisions;
+      w[2] = ((double) k) / subdivisions;
+
+      weight_array.push_back(w);
+    }
+  }
+  return weight_array;
+}
+
+//Generate the triangles of a subdivided cell (ids of the points of the cell),
+//in the order of the cells of the subdivided cell
+std::vector<vtkIdType> SubdivisionTriangles(int subdivisions)
+{
+  std::vector<vtkIdType> triangles;
+  int id1 = -1;
+  int id2, id3, id4;
+  for (int i = 0 ; i < subdivisions; i++){
+    id1++;
+    for (int j = 0 ; j < subdivisions-i; j++){
+
+      id2 = id1 + 1;
+      id3 = id1 + subdivisions + 1 - i;
+      id4 = id3 + 1;
+
+      triangles.push_back(id1);
+      triangles.push_back(id2);
+      triangles.push_back(id3);
+
+      if (j < subdivisions - i - 1){
+        triangles.push_back(id2);
+        triangles.push_back(id4);
+        triangles.push_back(id3);
+      }
+      id1++;
+    }
+  }
+  return triangles;
+}
+
+//Interpolate the points of the input cells [begin, end[
+//the points of the cell cellId are written from cellId*(number of weights) in the preallocated points
+struct SubdivisionPointsWorker
+{
+  vtkPoints *InputPts;
+  vtkPoints *OutputPts;
+  const std::vector<vtkIdType> &Cells;
+  const std::vector< std::vector< double> > &Weights;
+
+  void operator()(vtkIdType begin, vtkIdType end)
+  {
+    vtkIdType pointsPerCell = static_cast<vtkIdType>(this->Weights.size());
+    double cellPts[3][3];
+
+    for (vtkIdType cellId = begin; cellId < end; cellId++)
+    {
+      for (int k = 0; k < 3; k++)
+      {
+        this->InputPts->GetPoint(this->Cells[3*cellId+k], cellPts[k]);
+      }
+
+      for (vtkIdType i = 0; i < pointsPerCell; i++)
+      {
+        //same operations as vtkInterpolatingSubdivisionFilter::InterpolatePosition
+        double x[3] = {0.0, 0.0, 0.0};
+        for (int k = 0; k < 3; k++)
+        {
+          for (int j = 0; j < 3; j++)
+          {
+            x[j] += cellPts[k][j] * this->Weights[i][k];
+          }
+        }
+
+        this->OutputPts->SetPoint(cellId*pointsPerCell + i, x);
+      }
+    }
+  }
+};
+
+//Generate the cells of the subdivided input cells [begin, end[ in a preallocated
+//cell array (legacy layout: number of points followed by the point ids)
+struct SubdivisionCellsWorker
+{
+  const std::vector<vtkIdType> &Triangles;
+  vtkIdType PointsPerCell;
+  vtkIdType *Cells;
+
+  void operator()(vtkIdType begin, vtkIdType end)
+  {
+    vtkIdType cellsPerCell = static_cast<vtkIdType>(this->Triangles.size()/3);
+
+    for (vtkIdType cellId = begin; cellId < end; cellId++)
+    {
+      vtkIdType firstId = cellId*this->PointsPerCell;
+      vtkIdType *cell = this->Cells + 4*cellId*cellsPerCell;
+      for (vtkIdType i = 0; i < cellsPerCell; i++)
+      {
+        //same order as GenerateSubdivisionCells
+        *cell++ = 3;
+        *cell++ = firstId + this->Triangles[3*i+2];
+        *cell++ = firstId + this->Triangles[3*i+1];
+        *cell++ = firstId + this->Triangles[3*i];
+      }
+    }
+  }
+};
+
+}
+
 
 
 int vtkLinearSubdivisionFilter2::RequestData(vtkInformation * request, 
@@ -88,11 +214,10 @@ int vtkLinearSubdivisionFilter2::RequestData(vtkInformation * request,
 
 
 
-  // Copy celldata structure from input
+  // Copy celldata structure from input (both code paths copy the cell data
+  // of every input cell to its subdivided cells)
   outputCD = vtkCellData::New();
-  // outputCD->CopyAllocate(inputDS->GetCellData(),factor*numCells);
-
-  // outputCD->Allocate(inputDS->GetCellData(),factor*numCells);
+  outputCD->CopyAllocate(inputDS->GetCellData(),factor*numCells);
 
   // Create triangles
   outputPolys = vtkCellArray::New();
@@ -103,7 +228,17 @@ int vtkLinearSubdivisionFilter2::RequestData(vtkInformation * request,
   edgeData->SetNumberOfComponents(3);
   //edgeData->SetNumberOfTuples(factor*numCells);
 
-  if (this->GenerateSubdivisionPoints (inputDS, edgeData, outputPts, outputPD) == 0)
+  int generated;
+  if (this->UseSMP)
+  {
+    generated = this->GenerateSubdivisionPointsSMP (inputDS, outputPts, outputPD);
+  }
+  else
+  {
+    generated = this->GenerateSubdivisionPoints (inputDS, edgeData, outputPts, outputPD);
+  }
+
+  if (generated == 0)
   {
     outputPts->Delete();
     outputPD->Delete();
@@ -115,7 +250,14 @@ int vtkLinearSubdivisionFilter2::RequestData(vtkInformation * request,
     return 0;
   }
 
-  this->GenerateSubdivisionCells (inputDS, edgeData, outputPolys, outputCD);
+  if (this->UseSMP)
+  {
+    this->GenerateSubdivisionCellsSMP (inputDS, outputPolys, outputCD);
+  }
+  else
+  {
+    this->GenerateSubdivisionCells (inputDS, edgeData, outputPolys, outputCD);
+  }
 
   // start the next iteration with the input set to the output we just created
   edgeData->Delete();
@@ -227,19 +369,7 @@ int vtkLinearSubdivisionFilter2::GenerateSubdivisionPoints (vtkPolyData *inputDS
   double curr = 0;
 
   //Generate the weights matrix that will be used to interpolate the points
-  std::vector< std::vector< double> > weight_array;
-  for (int i = 0 ; i <= subdivisions; i++){
-    for (int j = 0 ; j <= subdivisions-i; j++){
-      int k= subdivisions - i - j;
-      std::vector< double> w(3);
-
-      w[0] = ((double) i) / subdivisions;
-      w[1] = ((double) j) / subdivisions;
-      w[2] = ((double) k) / subdivisions;
-
-      weight_array.push_back(w);
-    }
-  }
+  std::vector< std::vector< double> > weight_array = SubdivisionWeights(subdivisions);
 
   //for each cell
   for (cellId=0, inputPolys->InitTraversal();
@@ -297,6 +427,96 @@ int vtkLinearSubdivisionFilter2::GenerateSubdivisionPoints (vtkPolyData *inputDS
 
 
 
+int vtkLinearSubdivisionFilter2::GenerateSubdivisionPointsSMP (vtkPolyData *inputDS,
+                                                                  vtkPoints *outputPts,
+                                                                  vtkPointData *outputPD)
+{
+  vtkIdType *ptsIds = nullptr;
+  vtkIdType npts;
+
+  vtkCellArray *inputPolys=inputDS->GetPolys();
+
+  int subdivisions = this->GetNumberOfSubdivisions();
+
+  std::vector< std::vector< double> > weight_array = SubdivisionWeights(subdivisions);
+
+  //point ids of the input cells, so the cells can be read concurrently
+  vtkIdType numCells = inputPolys->GetNumberOfCells();
+  std::vector<vtkIdType> cells;
+  cells.reserve(3*numCells);
+  for (inputPolys->InitTraversal(); inputPolys->GetNextCell(npts, ptsIds);)
+  {
+    cells.push_back(ptsIds[0]);
+    cells.push_back(ptsIds[1]);
+    cells.push_back(ptsIds[2]);
+  }
+
+  //preallocate the points, every cell writes its own points
+  vtkIdType pointsPerCell = static_cast<vtkIdType>(weight_array.size());
+  outputPts->SetNumberOfPoints(numCells*pointsPerCell);
+
+  SubdivisionPointsWorker worker = {inputDS->GetPoints(), outputPts, cells, weight_array};
+  vtkSMPTools::For(0, numCells, worker);
+
+  //the point data is interpolated afterwards, in the same order as GenerateSubdivisionPoints
+  //(vtkDataSetAttributes::InterpolatePoint can not be called concurrently)
+  vtkPointData *inputPD=inputDS->GetPointData();
+  if (outputPD->GetNumberOfArrays() > 0)
+  {
+    vtkSmartPointer<vtkIdList> pointIds =
+      vtkSmartPointer<vtkIdList>::New();
+    pointIds->SetNumberOfIds(3);
+
+    for (vtkIdType cellId = 0; cellId < numCells; cellId++)
+    {
+      pointIds->SetId(0,cells[3*cellId]);
+      pointIds->SetId(1,cells[3*cellId+1]);
+      pointIds->SetId(2,cells[3*cellId+2]);
+
+      for (vtkIdType i = 0; i < pointsPerCell; i++)
+      {
+        double weights[3] = {weight_array[i][0],weight_array[i][1],weight_array[i][2]};
+        outputPD->InterpolatePoint(inputPD,cellId*pointsPerCell + i,pointIds,weights);
+      }
+    }
+  }
+
+  this->UpdateProgress(1.0);
+
+  return 1;
+}
+
+
+void vtkLinearSubdivisionFilter2::GenerateSubdivisionCellsSMP (vtkPolyData *inputDS,
+                                                                 vtkCellArray *outputPolys,
+                                                                 vtkCellData *outputCD)
+{
+  vtkIdType numCells = inputDS->GetNumberOfCells();
+  vtkCellData *inputCD = inputDS->GetCellData();
+
+  int subdivisions = this->GetNumberOfSubdivisions();
+  //number of subcell generated for each cell
+  vtkIdType nbr_gen_cell = subdivisions*subdivisions;
+
+  std::vector<vtkIdType> triangles = SubdivisionTriangles(subdivisions);
+
+  vtkSmartPointer<vtkIdTypeArray> cells =
+    vtkSmartPointer<vtkIdTypeArray>::New();
+  cells->SetNumberOfValues(4*numCells*nbr_gen_cell);
+
+  SubdivisionCellsWorker worker = {triangles, (subdivisions+1)*(subdivisions+2)/2, cells->GetPointer(0)};
+  vtkSMPTools::For(0, numCells, worker);
+
+  outputPolys->SetCells(numCells*nbr_gen_cell, cells);
+
+  //the cell data (allocated in RequestData) is copied as in GenerateSubdivisionCells
+  for (vtkIdType i = 0 ; i < numCells*nbr_gen_cell; i++)
+  {
+    outputCD->CopyData (inputCD, i/nbr_gen_cell, i);
+  }
+}
+
+
 int vtkLinearSubdivisionFilter2::vtkSubdivisionFilterRequestData(
   vtkInformation *vtkNotUsed(request),
   vtkInformationVector **inputVector,
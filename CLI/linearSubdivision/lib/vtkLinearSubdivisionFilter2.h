@@ -17,6 +17,12 @@
  * subdividing its input polydata. Each subdivision iteration create 4
  * new triangles for each triangle in the polydata.
  *
+ * With UseSMPOn the cells are subdivided in parallel (vtkSMPTools): the
+ * points and the cells of every input cell are written at precomputed
+ * offsets of preallocated arrays, which gives exactly the same output
+ * (points, cells, point data and cell data) as the serial code path
+ * (the default).
+ *
  * @par Thanks:
  * This work was supported by PHS Research Grant No. 1 P41 RR13218-01
  * from the National Center for Research Resources.
@@ -56,8 +62,18 @@ public:
   vtkTypeMacro(vtkLinearSubdivisionFilter2,vtkInterpolatingSubdivisionFilter);
   //@}
 
+  //@{
+  /**
+   * Turn on/off the parallel subdivision of the cells (off by default).
+   * Both code paths give the same output.
+   */
+  vtkSetMacro(UseSMP, vtkTypeBool);
+  vtkGetMacro(UseSMP, vtkTypeBool);
+  vtkBooleanMacro(UseSMP, vtkTypeBool);
+  //@}
+
 protected:
-  vtkLinearSubdivisionFilter2 () {}
+  vtkLinearSubdivisionFilter2 () : UseSMP(0) {}
   ~vtkLinearSubdivisionFilter2 () override {}
 
   int RequestData(vtkInformation *, 
@@ -80,6 +96,20 @@ protected:
                                       vtkInformationVector **, 
                                       vtkInformationVector *);
 
+  // Parallel versions of GenerateSubdivisionPoints and GenerateSubdivisionCells:
+  // the points (and cells) of the input cell cellId are the points (and cells)
+  // cellId*(subdivisions+1)*(subdivisions+2)/2 (and cellId*subdivisions^2) onwards,
+  // so every input cell is processed independently
+  int GenerateSubdivisionPointsSMP (vtkPolyData *inputDS,
+                                    vtkPoints *outputPts,
+                                    vtkPointData *outputPD);
+
+  void GenerateSubdivisionCellsSMP (vtkPolyData *inputDS,
+                                    vtkCellArray *outputPolys,
+                                    vtkCellData *outputCD);
+
+  vtkTypeBool UseSMP;
+
 private:
   vtkLinearSubdivisionFilter2(const vtkLinearSubdivisionFilter2&) = delete;
   void operator=(const vtkLinearSubdivisionFilter2&) = delete;
@@ -1,11 +1,22 @@
-import vtk
 import numpy as np
+#only the vtk modules used are imported, vtk versions without vtkmodules only provide the whole vtk package
+try:
+	from vtkmodules import vtkCommonCore, vtkCommonDataModel
+	from vtkmodules.util.numpy_support import vtk_to_numpy, numpy_to_vtk, numpy_to_vtkIdTypeArray
+except ImportError:
+	import vtk as vtkCommonCore
+	import vtk as vtkCommonDataModel
+	from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk, numpy_to_vtkIdTypeArray
+
+# numpy type of the vtkIdType values
+ID_TYPE = np.int64 if vtkCommonCore.vtkIdTypeArray().GetDataTypeSize() == 8 else np.int32
 
 class LinearSubdivisionFilter:
 
 	InputData = None
 	Output = None
 	NumberOfSubdivisions = 1
+	MaximumEdgeLength = None
 
 	def SetInputData(self, polydata):
 		
@@ -19,6 +30,12 @@ class LinearSubdivisionFilter:
 
 		self.NumberOfSubdivisions = subdivisions
 
+	# Adaptive subdivision: every triangle is divided only as much as needed for its edges to be
+	# shorter than the given length (None: every triangle is divided NumberOfSubdivisions times)
+	def SetMaximumEdgeLength(self, length):
+
+		self.MaximumEdgeLength = length
+
 	def Update(self):
 
 		self.GenerateData()
@@ -27,79 +44,204 @@ class LinearSubdivisionFilter:
 
 		if self.InputData:
 
-			inputpolydata = self.InputData
-			subdivisionlevel = self.NumberOfSubdivisions
-			inputpolydata_points = inputpolydata.GetPoints()
-			appendpoly = vtk.vtkAppendPolyData()
-
-			# Iterate over the cells in the polydata
-			# The idea is to linearly divide every cell according to the subdivision level
-			for cellid in range(inputpolydata.GetNumberOfCells()):
-				idlist = vtk.vtkIdList()
-				inputpolydata.GetCellPoints(cellid, idlist)
-				
-				# For every cell we create a new poly data, i.e, bigger triangle with the interpolated triangles inside
-				subdiv_poly = vtk.vtkPolyData()
-				subdiv_points = vtk.vtkPoints()
-				subdiv_cellarray = vtk.vtkCellArray()
-				
-				if(idlist.GetNumberOfIds() != 3):
-					raise Exception("Only triangle meshes are supported. Convert your mesh to triangles!", idlist.GetNumberOfIds())
-
-				# Get the triangle points from the current cell
-				p1 = np.array(inputpolydata_points.GetPoint(idlist.GetId(0)))
-				p2 = np.array(inputpolydata_points.GetPoint(idlist.GetId(1)))
-				p3 = np.array(inputpolydata_points.GetPoint(idlist.GetId(2)))
-
-				# Calculate the derivatives according to the level
-				dp12 = (p2 - p1)/subdivisionlevel
-				dp13 = (p3 - p1)/subdivisionlevel
-				
-				# Interpolate the points
-				for s13 in range(0, subdivisionlevel + 1):
-					for s12 in range(0, subdivisionlevel + 1 - s13):
-						interp = p1 + s12*dp12 + s13*dp13
-						subdiv_points.InsertNextPoint(interp[0], interp[1], interp[2])
-
-				# Using the interpolated points, create the cells, i.e., triangles
-				id1 = -1
-				for s13 in range(0, subdivisionlevel):
-					id1 += 1
-					for s12 in range(0, subdivisionlevel - s13):
-						
-						id2 = id1 + 1
-						id3 = id1 + subdivisionlevel + 1 - s13
-						id4 = id3 + 1
-
-						triangle = vtk.vtkTriangle()
-						triangle.GetPointIds().SetId(0, id1);
-						triangle.GetPointIds().SetId(1, id2);
-						triangle.GetPointIds().SetId(2, id3);
-
-						subdiv_cellarray.InsertNextCell(triangle)
-
-						if s12 < subdivisionlevel - s13 - 1:
-							triangle = vtk.vtkTriangle()
-							triangle.GetPointIds().SetId(0, id2);
-							triangle.GetPointIds().SetId(1, id4);
-							triangle.GetPointIds().SetId(2, id3);
-							subdiv_cellarray.InsertNextCell(triangle)
-
-						id1 += 1
-				
-				#Set all the interpolated points and generated cells to the polydata
-				subdiv_poly.SetPoints(subdiv_points)
-				subdiv_poly.SetPolys(subdiv_cellarray)
-				# Append the current interpolated triangle to the 'appendPolyDataFilter'
-				appendpoly.AddInputData(subdiv_poly)
-
-			# All interpolated triangles now from a single polydata
-			appendpoly.Update()
-
-			# Remove duplicate points (if you were paying attention, you know there are a lot of repetitions in every triangle edge)
-			cleanpoly = vtk.vtkCleanPolyData()
-			cleanpoly.SetInputData(appendpoly.GetOutput())
-			cleanpoly.Update()
+			triangles, inputpoints = self.GetTriangles(self.InputData)
+
+			if self.MaximumEdgeLength:
+				points, connectivity = self.AdaptiveSubdivision(triangles, inputpoints, self.MaximumEdgeLength)
+			else:
+				points, connectivity = self.UniformSubdivision(triangles, inputpoints, self.NumberOfSubdivisions)
+
+			subdiv_points = vtkCommonCore.vtkPoints()
+			subdiv_points.SetData(numpy_to_vtk(points.astype(np.float32), deep=1))
+
+			subdiv_cellarray = vtkCommonDataModel.vtkCellArray()
+			offsets = np.arange(0, len(connectivity) + 1, 3)
+			subdiv_cellarray.SetData(numpy_to_vtkIdTypeArray(offsets.astype(ID_TYPE), deep=1), numpy_to_vtkIdTypeArray(connectivity.astype(ID_TYPE), deep=1))
 
 			# Return the subdivied polydata
-			self.Output = cleanpoly.GetOutput()
\ No newline at end of file
+			self.Output = vtkCommonDataModel.vtkPolyData()
+			self.Output.SetPoints(subdiv_points)
+			self.Output.SetPolys(subdiv_cellarray)
+
+	# Return the point ids of the triangles (one row per cell) and the points of the polydata
+	def GetTriangles(self, inputpolydata):
+
+		# Only triangle meshes are supported
+		polys = inputpolydata.GetPolys()
+		if polys.GetNumberOfCells() != inputpolydata.GetNumberOfCells():
+			raise Exception("Only triangle meshes are supported. Convert your mesh to triangles!", inputpolydata.GetNumberOfCells() - polys.GetNumberOfCells())
+		sizes = np.diff(vtk_to_numpy(polys.GetOffsetsArray()))
+		if np.any(sizes != 3):
+			raise Exception("Only triangle meshes are supported. Convert your mesh to triangles!", int(sizes[sizes != 3][0]))
+		triangles = vtk_to_numpy(polys.GetConnectivityArray()).astype(np.int64).reshape(-1, 3)
+
+		inputpoints = vtk_to_numpy(inputpolydata.GetPoints().GetData()).astype(np.float64)
+
+		return triangles, inputpoints
+
+	# Divide every triangle subdivisionlevel times
+	# Return the points and the connectivity of the subdivided triangles
+	def UniformSubdivision(self, triangles, inputpoints, subdivisionlevel):
+
+		# The idea is to linearly divide every cell according to the subdivision level
+		# All the cells are divided at once: every cell has the same grid of interpolated points
+		# p1 + s12*dp12 + s13*dp13, with s12 + s13 <= subdivisionlevel
+		s12, s13, subtriangles = self.SubdivisionGrid(subdivisionlevel)
+		gridsize = len(s12)
+		ncells = len(triangles)
+
+		# Points on the edges and the corners of the cells are shared with the neighbouring cells
+		# They are identified by the topology: the input point for a corner, the edge and the
+		# position on the edge for an edge point. The interior points belong to one cell.
+		boundary, boundarykeys = self.BoundaryKeys(triangles, s12, s13, subdivisionlevel)
+
+		first = np.ones(ncells*gridsize, dtype=bool)
+		boundaryslots = (np.arange(ncells)[:, np.newaxis]*gridsize + boundary).ravel()
+		_, firstboundary, inverse = np.unique(boundarykeys.ravel(), return_index=True, return_inverse=True)
+		first[boundaryslots] = False
+		first[boundaryslots[firstboundary]] = True
+
+		slotids = np.cumsum(first) - 1
+		slotids[boundaryslots] = slotids[boundaryslots[firstboundary]][inverse.ravel()]
+
+		# Using the interpolated points, create the cells, i.e., triangles
+		slots = (np.arange(ncells)[:, np.newaxis, np.newaxis]*gridsize + subtriangles).reshape(-1)
+		connectivity, firstuse = self.FirstUse(slotids[slots], np.count_nonzero(first))
+		firstslots = slots[firstuse]
+
+		# Interpolate the points from the cell that first uses them
+		cells = triangles[firstslots//gridsize]
+		local = firstslots%gridsize
+		p1 = inputpoints[cells[:, 0]]
+		dp12 = (inputpoints[cells[:, 1]] - p1)/subdivisionlevel
+		dp13 = (inputpoints[cells[:, 2]] - p1)/subdivisionlevel
+		interp = p1 + s12[local, np.newaxis]*dp12 + s13[local, np.newaxis]*dp13
+
+		return interp, connectivity
+
+	# Divide every triangle just enough for the new edges to be shorter than maximumedgelength, by conforming
+	# longest edge bisection: the triangles whose longest edge is too long are divided at the middle of this
+	# edge, from the opposite corner. A triangle sharing a divided edge is divided too: at the middle of its
+	# longest edge first (which keeps the triangles well shaped), then at the middle of its other divided
+	# edges, so both triangles of an edge use the same points. The edges get shorter at every round, the
+	# rounds are repeated until none is longer than maximumedgelength.
+	# Return the points and the connectivity of the subdivided triangles
+	def AdaptiveSubdivision(self, triangles, inputpoints, maximumedgelength):
+
+		# The output points are stored as float32: the edges are kept a little shorter than the maximum
+		maximumedgelength = maximumedgelength*(1 - 1e-6)
+
+		points = inputpoints
+		while len(triangles):
+
+			# Edges of the triangles (1-2, 2-3, 3-1), identified by their sorted point ids
+			npoints = np.int64(len(points))
+			a = triangles
+			b = triangles[:, [1, 2, 0]]
+			edges, edgeindex = np.unique(np.minimum(a, b)*npoints + np.maximum(a, b), return_inverse=True)
+			edgeindex = edgeindex.reshape(-1, 3)
+			edgelow = edges//npoints
+			edgehigh = edges%npoints
+			lengths = np.linalg.norm(points[edgehigh] - points[edgelow], axis=1)[edgeindex]
+			longest = np.argmax(lengths, axis=1)
+			longestedge = edgeindex[np.arange(len(triangles)), longest]
+
+			divided = np.zeros(len(edges), dtype=bool)
+			divided[longestedge[np.max(lengths, axis=1) > maximumedgelength]] = True
+			if not np.any(divided):
+				break
+			while True:
+				spread = np.any(divided[edgeindex], axis=1) & ~divided[longestedge]
+				if not np.any(spread):
+					break
+				divided[longestedge[spread]] = True
+
+			# New points at the middle of the divided edges
+			middle = np.full(len(edges), -1, dtype=np.int64)
+			middle[divided] = npoints + np.arange(np.count_nonzero(divided))
+			points = np.concatenate((points, (points[edgelow[divided]] + points[edgehigh[divided]])/2))
+
+			# Triangles (a, b, c) starting from their longest edge a-b, with the middle points m of a-b,
+			# mb of b-c and mc of c-a (-1 if the edge is not divided)
+			order = (longest[:, np.newaxis] + np.arange(3))%3
+			a, b, c = np.take_along_axis(triangles, order, axis=1).T
+			m, mb, mc = middle[np.take_along_axis(edgeindex, order, axis=1)].T
+
+			# Up to four triangles replace each one, in the same orientation
+			children = np.stack((
+				np.where(m < 0, (a, b, c), np.where(mc < 0, (a, m, c), (a, m, mc))).T,
+				np.where(mb < 0, (m, b, c), (m, b, mb)).T,
+				np.stack((m, mb, c), axis=1),
+				np.stack((mc, m, c), axis=1)), axis=1)
+			valid = np.stack((np.ones(len(triangles), dtype=bool), m >= 0, (m >= 0) & (mb >= 0), (m >= 0) & (mc >= 0)), axis=1)
+			triangles = children[valid]
+
+		# Only keep the points used by the triangles
+		used, pointids = np.unique(triangles, return_inverse=True)
+		pointids = pointids.ravel()
+		connectivity, firstuse = self.FirstUse(pointids, len(used))
+
+		return points[used[pointids[firstuse]]], connectivity
+
+	# Number the points in the order the cells first use them, which gives the same mesh as
+	# appending the divided cells and removing the duplicate points
+	# Return the new connectivity and, for every point, the position of its first use in the connectivity
+	def FirstUse(self, connectivity, npoints):
+
+		firstuse = np.empty(npoints, dtype=np.int64)
+		firstuse[connectivity[::-1]] = np.arange(len(connectivity) - 1, -1, -1)
+		order = np.argsort(firstuse)
+		renumber = np.empty_like(order)
+		renumber[order] = np.arange(len(order))
+
+		return renumber[connectivity], firstuse[order]
+
+	# Return the grid of interpolated points of a cell (s12 and s13 coordinates, in the order they are created)
+	# and the sub-triangles made of these points (local point ids)
+	def SubdivisionGrid(self, subdivisionlevel):
+		s13, s12 = np.nonzero(np.add.outer(np.arange(subdivisionlevel + 1), np.arange(subdivisionlevel + 1)) <= subdivisionlevel)
+
+		subtriangles = list()
+		id1 = -1
+		for s in range(0, subdivisionlevel):
+			id1 += 1
+			for t in range(0, subdivisionlevel - s):
+				id2 = id1 + 1
+				id3 = id1 + subdivisionlevel + 1 - s
+				id4 = id3 + 1
+				subtriangles.append((id1, id2, id3))
+				if t < subdivisionlevel - s - 1:
+					subtriangles.append((id2, id4, id3))
+				id1 += 1
+
+		return s12.astype(np.float64), s13.astype(np.float64), np.array(subtriangles, dtype=np.int64)
+
+	# Return the local ids of the points on the boundary of a cell and, for every cell, the keys
+	# identifying these points: the input point id for a corner, and for an edge point a key made of
+	# the edge (sorted point ids) and of the position of the point on it
+	def BoundaryKeys(self, triangles, s12, s13, subdivisionlevel):
+		n = subdivisionlevel
+		s12 = s12.astype(np.int64)
+		s13 = s13.astype(np.int64)
+		boundary = np.nonzero((s12 == 0) | (s13 == 0) | (s12 + s13 == n))[0]
+		i = s12[boundary]
+		j = s13[boundary]
+
+		npoints = np.int64(triangles.max() + 1) if len(triangles) else np.int64(1)
+		keys = np.empty((len(triangles), len(boundary)), dtype=np.int64)
+
+		# corners
+		for corner, mask in enumerate(((i == 0) & (j == 0), (i == n) & (j == 0), (i == 0) & (j == n))):
+			keys[:, mask] = triangles[:, corner, np.newaxis]
+
+		# edges, from the point a to the point b, at the position t
+		edges = (((i > 0) & (i < n) & (j == 0), 0, 1, i), ((i == 0) & (j > 0) & (j < n), 0, 2, j), ((i + j == n) & (j > 0) & (j < n), 1, 2, j))
+		for mask, a, b, t in edges:
+			pa = triangles[:, a, np.newaxis]
+			pb = triangles[:, b, np.newaxis]
+			low = np.minimum(pa, pb)
+			high = np.maximum(pa, pb)
+			position = np.where(pa < pb, t[mask], n - t[mask])
+			keys[:, mask] = npoints + (low*npoints + high)*n + position
+
+		return boundary, keys
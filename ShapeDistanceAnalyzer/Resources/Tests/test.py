@@ -4,10 +4,25 @@ import unittest
 import sys
 sys.path.append('../../')
 sys.path.append('./')
+sys.path.append('../LinearSubdivisionFilter')
 import ShapeStatistics
+import ShapeStatisticsServer
+import LinearSubdivisionFilter
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
 import csv
 import numpy as np
 import math
+import os
+import json
+import shutil
+import stat
+import tempfile
+import threading
+import multiprocessing
+import time
+import subprocess
+import socket
 
 
 
@@ -95,6 +110,1126 @@ class ShapeStatisticsTesting(unittest.TestCase):
 		    		self.assertAlmostEqual(value,str(stats[key]),delta=0.00001)
 		    	print('ok')
 		
+	def test_Batch(self):
+		print('')
+		print('Testing batch mode',end=' ... ')
+		sys.stdout.flush()
+
+		directory=tempfile.mkdtemp()
+		try:
+			manifest=os.path.join(directory,'manifest.json')
+			with open(manifest,'w') as jsonfile:
+				json.dump([{'fileA':os.path.abspath('./File_A.vtk'),'fileB':os.path.abspath('./File_B.vtk'),'signed':True},
+				           {'fileA':os.path.abspath('./File_A.vtk'),'fileB':'missing.vtk'},
+				           {'fileA':os.path.abspath('./File_B.vtk'),'fileB':os.path.abspath('./File_A.vtk'),'bins':64}],jsonfile)
+
+			valmet=ShapeStatistics.StatisticsLogic()
+			jobs=valmet.ReadManifest(manifest)
+			results=valmet.ComputeBatch(jobs,workers=2)
+
+			self.assertEqual([result['status'] for result in results],['ok','failed','ok'])
+			self.assertEqual(results[2]['results'][0]['number_of_bins'],64)
+
+			valmet.Set('A','./File_A.vtk')
+			valmet.Set('B','./File_B.vtk')
+			stats=valmet.ComputeValues(signed=True)
+			for result in results[0]['results']:
+				self.assertEqual(result['mean'],stats[result['mode']]['mean'])
+				self.assertEqual(result['iqr'],stats[result['mode']]['iqr'])
+
+			#the subdivisions, the threads and the Hausdorff option are given to every job, the entries can override them
+			jobs=valmet.ReadManifest(manifest,subdivisions=2,hausdorf=True,threads=2)
+			self.assertEqual([(job['subdivisions'],job['hausdorf'],job['threads']) for job in jobs],[(2,True,2)]*3)
+			results=valmet.ComputeBatch(jobs[:1],workers=1)
+			valmet.linearSample(2)
+			hausdorf=valmet.ComputeHausdorf()
+			for result in results[0]['results']:
+				self.assertEqual(result['hausdorf'],hausdorf[result['mode']]['hausdorf'])
+				self.assertNotIn('mean',result)
+		finally:
+			shutil.rmtree(directory)
+
+		print('ok')
+
+	def test_LocatorCache(self):
+		print('')
+		print('Testing locator cache',end=' ... ')
+		sys.stdout.flush()
+
+		valmet=ShapeStatistics.StatisticsLogic()
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+
+		stats=valmet.ComputeValues(signed=True)
+		locators=[locator for locator,size in valmet.locator_cache.locators.values()]
+		self.assertEqual(len(locators),2)
+
+		#the same shapes loaded again reuse the cached locators
+		valmet.Set('A','./File_A.vtk')
+		stats_again=valmet.ComputeValues(signed=True)
+		self.assertEqual([locator for locator,size in valmet.locator_cache.locators.values()],locators)
+		self.assertEqual(stats['A->B & B->A']['mean'],stats_again['A->B & B->A']['mean'])
+
+		#same distances as vtkDistancePolyDataFilter
+		for inverse,mode in ((False,'A->B'),(True,'B->A')):
+			distancefilter=vtk.vtkDistancePolyDataFilter()
+			distancefilter.SetInputData(int(inverse),valmet.getPolydata('A'))
+			distancefilter.SetInputData(1-int(inverse),valmet.getPolydata('B'))
+			distancefilter.SetSignedDistance(True)
+			distancefilter.Update()
+			expected=vtk_to_numpy(distancefilter.GetOutput().GetPointData().GetScalars())
+			self.assertTrue(np.array_equal(np.array(stats[mode]['distances'][0]),expected))
+
+		#least recently used locators are released above the memory cap
+		cache=ShapeStatistics.LocatorCache(max_memory=1)
+		cache.Get('A',valmet.getPolydata('A'))
+		cache.Get('B',valmet.getPolydata('B'))
+		self.assertEqual(list(cache.locators.keys()),[('vtk','B')])
+
+		print('ok')
+
+	def test_SignedCorrespondence(self):
+		print('')
+		print('Testing signed correspondence distances',end=' ... ')
+		sys.stdout.flush()
+
+		valmet=ShapeStatistics.StatisticsLogic()
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+
+		unsigned=np.array(valmet.CorrespondenceDistance(signed=False))
+		for inverse in (False,True):
+			dist=np.array(valmet.CorrespondenceDistance(signed=True,inverse=inverse))
+
+			enclosed_points=vtk.vtkSelectEnclosedPoints()
+			enclosed_points.SetInputData(valmet.getPolydata('B' if inverse else 'A'))
+			enclosed_points.SetSurfaceData(valmet.getPolydata('A' if inverse else 'B'))
+			enclosed_points.SetTolerance(0.000000001)
+			enclosed_points.Update()
+
+			for i in range(len(dist)):
+				if enclosed_points.IsInside(i):
+					self.assertEqual(dist[i],-unsigned[i])
+				else:
+					self.assertEqual(dist[i],unsigned[i])
+
+		print('ok')
+
+	def test_ExactStatistics(self):
+		print('')
+		print('Testing exact statistics',end=' ... ')
+		sys.stdout.flush()
+
+		valmet=ShapeStatistics.StatisticsLogic()
+
+		rand=[np.random.normal(0,1,10001),np.random.normal(3,2,5000)]
+		values=np.concatenate(rand)
+
+		quantiles=[0,0.1,0.25,0.5,0.75,0.99,1.0]
+		self.assertTrue(np.allclose(valmet.Quantiles(rand,quantiles),np.percentile(values,np.array(quantiles)*100),rtol=0,atol=1e-12))
+
+		minimum, maximum, mean, sigma, MSD, MAD, median, IQR, IQR_Q1, IQR_Q3 = valmet.ExactStatistics(rand)
+		self.assertEqual(minimum,np.min(values))
+		self.assertEqual(maximum,np.max(values))
+		self.assertAlmostEqual(mean,np.mean(values),places=10)
+		self.assertAlmostEqual(sigma,np.std(values),places=10)
+		self.assertAlmostEqual(MSD,np.mean(values**2),places=10)
+		self.assertAlmostEqual(MAD,np.mean(np.abs(values)),places=10)
+		self.assertEqual(median,np.median(values))
+		self.assertAlmostEqual(IQR,IQR_Q3-IQR_Q1,places=12)
+
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+		stats=valmet.ComputeValues(signed=True,stats_engine='exact')['A->B & B->A']
+		values=np.concatenate(stats['distances'])
+		self.assertEqual(stats['median'],np.median(values))
+		self.assertEqual(stats['hausdorf'],np.max(np.abs(values)))
+
+		print('ok')
+
+	def test_SaveStats(self):
+		print('')
+		print('Testing results serialization',end=' ... ')
+		sys.stdout.flush()
+
+		valmet=ShapeStatistics.StatisticsLogic()
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+		stats=valmet.ComputeValues(signed=True)['A->B & B->A']
+
+		#distances are kept as numpy arrays until serialization
+		self.assertTrue(all(isinstance(dist,np.ndarray) for dist in stats['distances']))
+
+		directory=tempfile.mkdtemp()
+		try:
+			json_path=os.path.join(directory,'stats.json')
+			valmet.SaveStatsAsJSON(json_path,[stats])
+			with open(json_path,'r') as jsonfile:
+				saved=json.load(jsonfile)[0]
+			self.assertEqual(saved['mean'],stats['mean'])
+			for dist,saved_dist in zip(stats['distances'],saved['distances']):
+				self.assertTrue(np.array_equal(dist,np.array(saved_dist)))
+
+			csv_path=os.path.join(directory,'stats.csv')
+			valmet.SaveStatsAsCSV(csv_path,[stats])
+			with open(csv_path,'r') as csvfile:
+				saved=next(csv.DictReader(csvfile))
+			for dist,saved_dist in zip(stats['distances'],json.loads(saved['distances'])):
+				self.assertTrue(np.array_equal(dist,np.array(saved_dist)))
+
+			for path in (json_path,os.path.join(directory,'stats.npz')):
+				if path.endswith('.npz'):
+					valmet.SaveStatsAsNPZ(path,[stats])
+				saved=valmet.LoadStats(path)[0]
+				self.assertEqual(saved['iqr'],stats['iqr'])
+				self.assertTrue(np.array_equal(saved['histogram'],stats['histogram']))
+				for dist,saved_dist in zip(stats['distances'],saved['distances']):
+					self.assertTrue(np.array_equal(dist,saved_dist))
+
+				summary=valmet.LoadStats(path,distances=False)[0]
+				self.assertEqual(summary['median'],stats['median'])
+				self.assertNotIn('distances',summary)
+		finally:
+			shutil.rmtree(directory)
+
+		print('ok')
+
+	def test_MemoryMappedDistances(self):
+		print('')
+		print('Testing memory mapped distances',end=' ... ')
+		sys.stdout.flush()
+
+		valmet=ShapeStatistics.StatisticsLogic()
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+
+		directory=tempfile.mkdtemp()
+		try:
+			mapped=ShapeStatistics.StatisticsLogic()
+			mapped.SetDistancesDirectory(directory)
+			mapped.chunk_size=100
+			mapped.Set('A','./File_A.vtk')
+			mapped.Set('B','./File_B.vtk')
+
+			for correspondence in (False,True):
+				for stats_engine in ('histogram','exact'):
+					stats=valmet.ComputeValues(signed=True,correspondence=correspondence,stats_engine=stats_engine)
+					mapped_stats=mapped.ComputeValues(signed=True,correspondence=correspondence,stats_engine=stats_engine)
+					for mode in stats.keys():
+						for dist,mapped_dist in zip(stats[mode]['distances'],mapped_stats[mode]['distances']):
+							self.assertIsInstance(mapped_dist,np.memmap)
+							self.assertTrue(np.array_equal(dist,mapped_dist))
+						for key in ('minimum','maximum','median','iqr'):
+							self.assertEqual(stats[mode][key],mapped_stats[mode][key])
+						self.assertAlmostEqual(stats[mode]['mean'],mapped_stats[mode]['mean'],places=12)
+						self.assertTrue(np.array_equal(stats[mode]['histogram'],mapped_stats[mode]['histogram']))
+					#the files are removed once mapped (the distances and the copies partitioned by Quantiles),
+					#the mapped distances stay readable
+					if os.name == 'posix':
+						self.assertEqual(os.listdir(directory),[])
+			del mapped_stats
+			del mapped
+		finally:
+			shutil.rmtree(directory)
+
+		print('ok')
+
+	def test_SymmetricClosestPoint(self):
+		print('')
+		print('Testing symmetric closest point',end=' ... ')
+		sys.stdout.flush()
+
+		valmet=ShapeStatistics.StatisticsLogic()
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+
+		for signed in (False,True):
+			distab=valmet.ClosestPoint(signed=signed,inverse=False)
+			distba=valmet.ClosestPoint(signed=signed,inverse=True)
+
+			for threads in (1,2):
+				valmet.threads=threads
+				symab,symba,(mini,maxi)=valmet.SymmetricClosestPoint(signed=signed)
+				self.assertTrue(np.array_equal(symab,distab))
+				self.assertTrue(np.array_equal(symba,distba))
+				self.assertEqual(mini,min(np.min(distab),np.min(distba)))
+				self.assertEqual(maxi,max(np.max(distab),np.max(distba)))
+
+		print('ok')
+
+	def test_ThreadedClosestPoint(self):
+		print('')
+		print('Testing threaded closest point',end=' ... ')
+		sys.stdout.flush()
+
+		valmet=ShapeStatistics.StatisticsLogic()
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+
+		reference,minimum,maximum=valmet.ClosestPointAndRange(signed=True)
+
+		#small chunks so that every thread gets several of them
+		valmet.chunk_size=100
+		for threads in (2,3,0):
+			valmet.threads=threads
+			dist,mini,maxi=valmet.ClosestPointAndRange(signed=True)
+			self.assertTrue(np.array_equal(dist,reference))
+			self.assertEqual((mini,maxi),(minimum,maximum))
+
+		#each thread has its own vtk locator
+		self.assertEqual(len(valmet.GetLocators('B',3)),3)
+		self.assertEqual(len(set(map(id,valmet.GetLocators('B',3)))),3)
+
+		#the copies use at most half of the memory of the locator cache, fewer threads are used
+		size=ShapeStatistics.LocatorCache.Size(valmet.getPolydata('B'))
+		valmet.locator_cache=ShapeStatistics.LocatorCache(max_memory=4*size)
+		self.assertEqual(len(valmet.GetLocators('B',3)),2)
+		valmet.threads=3
+		dist,mini,maxi=valmet.ClosestPointAndRange(signed=True)
+		self.assertTrue(np.array_equal(dist,reference))
+
+		print('ok')
+
+	#benchmark of the threads computing the distances of a pair (one vtk locator per thread),
+	#only run when SHAPESTATISTICS_BENCHMARK is set
+	@unittest.skipUnless(os.environ.get('SHAPESTATISTICS_BENCHMARK'),'set SHAPESTATISTICS_BENCHMARK to run the benchmarks')
+	def test_ThreadsTime(self):
+		print('')
+		print('Timing threaded closest point',end=' ... ')
+		sys.stdout.flush()
+
+		valmet=ShapeStatistics.StatisticsLogic()
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+		valmet.linearSample(8)
+
+		reference=None
+		for threads in sorted(set((1,2,4,multiprocessing.cpu_count()))):
+			valmet.threads=threads
+			#the locators are built first, only the distances are timed
+			valmet.GetLocators('B',threads)
+			start=time.time()
+			dist,minimum,maximum=valmet.ClosestPointAndRange(signed=True)
+			print('%d threads %.2fs' % (threads,time.time()-start),end=' ... ')
+			if reference is None:
+				reference=dist
+			self.assertTrue(np.array_equal(dist,reference))
+
+		print('ok')
+
+	def test_ReadPolyData(self):
+		print('')
+		print('Testing polydata reader',end=' ... ')
+		sys.stdout.flush()
+
+		reader=vtk.vtkPolyDataReader()
+		reader.SetFileName('./File_A.vtk')
+		reader.Update()
+		expected=reader.GetOutput()
+
+		directory=tempfile.mkdtemp()
+		try:
+			writer=vtk.vtkPolyDataWriter()
+			writer.SetInputData(expected)
+			files=['./File_A.vtk']
+			for version in (42,51):
+				writer.SetFileVersion(version)
+				writer.SetFileName(os.path.join(directory,'shape_%d.vtk' % version))
+				writer.Write()
+				files.append(writer.GetFileName())
+
+			for file_path in files:
+				polydata=ShapeStatistics.ReadPolyData(file_path,geometry_only=True)
+				points=vtk_to_numpy(polydata.GetPoints().GetData())
+				self.assertEqual(points.dtype,np.float32)
+				self.assertTrue(np.array_equal(points,vtk_to_numpy(expected.GetPoints().GetData())))
+				self.assertEqual(polydata.GetNumberOfPolys(),expected.GetNumberOfPolys())
+				for cell_id in (0,expected.GetNumberOfPolys()//2,expected.GetNumberOfPolys()-1):
+					self.assertEqual(polydata.GetCell(cell_id).GetPointIds().GetId(2),expected.GetCell(cell_id).GetPointIds().GetId(2))
+
+			#the point data and the binary files are read by vtkPolyDataReader
+			self.assertIsNone(ShapeStatistics._ParseLegacyPolyData('./File_A.vtk',False))
+			polydata=ShapeStatistics.ReadPolyData('./File_A.vtk')
+			self.assertEqual(polydata.GetPointData().GetNumberOfArrays(),expected.GetPointData().GetNumberOfArrays())
+
+			writer.SetFileTypeToBinary()
+			writer.SetFileName(os.path.join(directory,'binary.vtk'))
+			writer.Write()
+			self.assertIsNone(ShapeStatistics._ParseLegacyPolyData(writer.GetFileName(),True))
+			self.assertEqual(ShapeStatistics.ReadPolyData(writer.GetFileName()).GetNumberOfPolys(),expected.GetNumberOfPolys())
+		finally:
+			shutil.rmtree(directory)
+
+		print('ok')
+
+	def test_MeshCache(self):
+		print('')
+		print('Testing mesh cache',end=' ... ')
+		sys.stdout.flush()
+
+		directory=tempfile.mkdtemp()
+		try:
+			reference=ShapeStatistics.StatisticsLogic()
+			reference.Set('A','./File_A.vtk')
+			reference.Set('B','./File_B.vtk')
+			expected=reference.ComputeValues(signed=True)
+
+			valmet=ShapeStatistics.StatisticsLogic()
+			valmet.SetMeshCache(directory)
+			cache=valmet.mesh_cache
+			self.assertIsNone(cache.Get('./File_A.vtk'))
+			for i in range(2):
+				valmet.Set('A','./File_A.vtk')
+				valmet.Set('B','./File_B.vtk')
+				stats=valmet.ComputeValues(signed=True)
+				self.assertEqual(stats['A->B & B->A']['mean'],expected['A->B & B->A']['mean'])
+
+			#the shapes are read from the cache
+			cached=cache.Get('./File_A.vtk')
+			self.assertTrue(np.array_equal(vtk_to_numpy(cached.GetPoints().GetData()),vtk_to_numpy(reference.getPolydata('A').GetPoints().GetData())))
+			self.assertEqual(cached.GetNumberOfPolys(),reference.getPolydata('A').GetNumberOfPolys())
+
+			#the least recently used shape is removed above the size of the cache
+			entry=os.path.join(directory,'meshes',cache.ContentHash('./File_B.vtk'))
+			cache.max_size=sum(os.path.getsize(os.path.join(entry,array)) for array in os.listdir(entry))
+			cache.Get('./File_B.vtk')
+			cache.Evict()
+			self.assertIsNone(cache.Get('./File_A.vtk'))
+			self.assertIsNotNone(cache.Get('./File_B.vtk'))
+		finally:
+			shutil.rmtree(directory)
+
+		print('ok')
+
+	def test_Hausdorf(self):
+		print('')
+		print('Testing Hausdorff distances',end=' ... ')
+		sys.stdout.flush()
+
+		valmet=ShapeStatistics.StatisticsLogic()
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+
+		for correspondence in (False,True):
+			stats=valmet.ComputeValues(signed=False,correspondence=correspondence,stats_engine='exact')
+			hausdorf=valmet.ComputeHausdorf(correspondence=correspondence,seed=0)
+			self.assertEqual(sorted(hausdorf.keys()),sorted(stats.keys()))
+
+			for mode in stats.keys():
+				self.assertAlmostEqual(hausdorf[mode]['hausdorf'],stats[mode]['hausdorf'])
+
+				#the distance of the vertex attaining it
+				distances=stats[mode]['distances'][0 if hausdorf[mode]['shape'] == 'A' else -1]
+				self.assertAlmostEqual(distances[hausdorf[mode]['point_id']],hausdorf[mode]['hausdorf'])
+
+		#the points that cannot beat the maximum are skipped
+		hausdorf=valmet.ComputeHausdorf(seed=0)
+		self.assertLess(hausdorf['A->B']['evaluated_points'],valmet.getPolydata('A').GetNumberOfPoints())
+
+		print('ok')
+
+	def test_ProgressiveValues(self):
+		print('')
+		print('Testing progressive values',end=' ... ')
+		sys.stdout.flush()
+
+		valmet=ShapeStatistics.StatisticsLogic()
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+
+		for correspondence in (False,True):
+			steps=list(valmet.ProgressiveValues(signed=True,correspondence=correspondence,stats_engine='exact',fractions=(0.2,1.0),seed=0))
+			self.assertEqual(len(steps),3)
+			sample,full,exact=steps
+
+			for mode in exact.keys():
+				self.assertTrue(sample[mode]['approximate'])
+				self.assertLess(sample[mode]['sample_size'],sample[mode]['number_of_points'])
+				for key,(lower,upper) in sample[mode]['confidence_intervals'].items():
+					self.assertTrue(lower <= exact[mode][key] <= upper)
+
+				#a sample of all the points gives the exact values
+				self.assertEqual(full[mode]['sample_size'],full[mode]['number_of_points'])
+				for key in ('minimum','maximum','mean','median','iqr'):
+					self.assertAlmostEqual(full[mode][key],exact[mode][key])
+
+		#computed in a background thread
+		progressive=ShapeStatistics.ProgressiveStatistics(ShapeStatistics.StatisticsLogic(),'./File_A.vtk','./File_B.vtk',fractions=(0.1,),exact=False,seed=0)
+		progressive.start()
+		progressive.join()
+		self.assertIsNone(progressive.error)
+		step,results=progressive.GetResults()
+		self.assertEqual(step,1)
+		expected=list(valmet.ProgressiveValues(fractions=(0.1,),exact=False,seed=0))[0]
+		self.assertEqual(results['A->B']['mean'],expected['A->B']['mean'])
+
+		#sampled from the subdivided shapes, as the exact values
+		progressive=ShapeStatistics.ProgressiveStatistics(ShapeStatistics.StatisticsLogic(),'./File_A.vtk','./File_B.vtk',subdivisions=2,fractions=(0.1,),exact=False,seed=0)
+		progressive.start()
+		progressive.join()
+		self.assertIsNone(progressive.error)
+		valmet.linearSample(2)
+		self.assertEqual(progressive.GetResults()[1]['A->B']['number_of_points'],valmet.getPolydata('A').GetNumberOfPoints())
+
+		print('ok')
+
+	def test_KDTreeEngine(self):
+		print('')
+		print('Testing kdtree closest point engine',end=' ... ')
+		sys.stdout.flush()
+
+		valmet=ShapeStatistics.StatisticsLogic()
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+
+		#the engine is not registered, it gives the distances of the vtk engine
+		self.assertRaises(ValueError,valmet.SetEngine,'kdtree')
+		for subdivisions in (0,3):
+			if subdivisions:
+				valmet.linearSample(subdivisions)
+			for source,target in (('A','B'),('B','A')):
+				points=vtk_to_numpy(valmet.getPolydata(source).GetPoints().GetData())
+				reference=ShapeStatistics.VTKDistanceEngine(valmet.getPolydata(target)).Evaluate(points)
+				dist=ShapeStatistics.KDTreeDistanceEngine(valmet.getPolydata(target)).Evaluate(points)
+				self.assertTrue(np.allclose(dist,reference,rtol=0,atol=1e-9))
+
+		#once registered, it is used by the computations
+		ShapeStatistics.DISTANCE_ENGINES['kdtree']=ShapeStatistics.KDTreeDistanceEngine
+		try:
+			for signed in (False,True):
+				valmet.SetEngine('vtk')
+				reference=valmet.ClosestPoint(signed=signed)
+				valmet.SetEngine('kdtree')
+				self.assertTrue(np.allclose(valmet.ClosestPoint(signed=signed),reference,rtol=0,atol=1e-9))
+		finally:
+			del ShapeStatistics.DISTANCE_ENGINES['kdtree']
+
+		self.assertRaises(ValueError,valmet.SetEngine,'unknown')
+
+		print('ok')
+
+	#benchmark of the kdtree engine on more than 100000 points, only run when SHAPESTATISTICS_BENCHMARK is set
+	@unittest.skipUnless(os.environ.get('SHAPESTATISTICS_BENCHMARK'),'set SHAPESTATISTICS_BENCHMARK to run the benchmarks')
+	def test_KDTreeEngineTime(self):
+		print('')
+		print('Timing kdtree closest point engine',end=' ... ')
+		sys.stdout.flush()
+
+		valmet=ShapeStatistics.StatisticsLogic()
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+		valmet.linearSample(10)
+		points=vtk_to_numpy(valmet.getPolydata('A').GetPoints().GetData())
+		self.assertTrue(len(points) >= 100000)
+
+		distances=dict()
+		for engine in (ShapeStatistics.VTKDistanceEngine,ShapeStatistics.KDTreeDistanceEngine):
+			start=time.time()
+			locator=engine(valmet.getPolydata('B'))
+			built=time.time()
+			distances[engine]=locator.Evaluate(points)
+			print('%s build %.2fs query %.2fs' % (engine.__name__,built-start,time.time()-built),end=' ... ')
+
+		self.assertTrue(np.allclose(distances[ShapeStatistics.KDTreeDistanceEngine],distances[ShapeStatistics.VTKDistanceEngine],rtol=0,atol=1e-9))
+
+		print('ok')
+
+	def test_LinearSubdivisionFilter(self):
+		print('')
+		print('Testing linear subdivision filter',end=' ... ')
+		sys.stdout.flush()
+
+		reader=vtk.vtkPolyDataReader()
+		reader.SetFileName('./File_A.vtk')
+		reader.Update()
+		polydata=reader.GetOutput()
+
+		for level in (1,3):
+			subdivfilter=LinearSubdivisionFilter.LinearSubdivisionFilter()
+			subdivfilter.SetInputData(polydata)
+			subdivfilter.SetNumberOfSubdivisions(level)
+			subdivfilter.Update()
+			output=subdivfilter.GetOutput()
+
+			#reference: every cell divided on its own, then the duplicated points merged
+			append=vtk.vtkAppendPolyData()
+			for cellid in range(polydata.GetNumberOfCells()):
+				cell=vtk.vtkPolyData()
+				cell.SetPoints(polydata.GetPoints())
+				cell.Allocate(1)
+				cell.InsertNextCell(vtk.VTK_TRIANGLE,polydata.GetCell(cellid).GetPointIds())
+				cellfilter=LinearSubdivisionFilter.LinearSubdivisionFilter()
+				cellfilter.SetInputData(cell)
+				cellfilter.SetNumberOfSubdivisions(level)
+				cellfilter.Update()
+				append.AddInputData(cellfilter.GetOutput())
+			append.Update()
+			clean=vtk.vtkCleanPolyData()
+			clean.SetInputData(append.GetOutput())
+			clean.Update()
+			reference=clean.GetOutput()
+
+			self.assertTrue(np.array_equal(vtk_to_numpy(output.GetPoints().GetData()),vtk_to_numpy(reference.GetPoints().GetData())))
+			self.assertTrue(np.array_equal(vtk_to_numpy(output.GetPolys().GetConnectivityArray()),vtk_to_numpy(reference.GetPolys().GetConnectivityArray())))
+
+		#points shared by topology: no crack even where the interpolated coordinates differ
+		icosahedron=vtk.vtkPlatonicSolidSource()
+		icosahedron.SetSolidTypeToIcosahedron()
+		icosahedron.Update()
+		for level in range(1,8):
+			subdivfilter.SetInputData(icosahedron.GetOutput())
+			subdivfilter.SetNumberOfSubdivisions(level)
+			subdivfilter.Update()
+			self.assertEqual(subdivfilter.GetOutput().GetNumberOfPoints(),10*level**2+2)
+			self.assertEqual(subdivfilter.GetOutput().GetNumberOfPolys(),20*level**2)
+
+		cube=vtk.vtkCubeSource()
+		cube.Update()
+		subdivfilter.SetInputData(cube.GetOutput())
+		self.assertRaises(Exception,subdivfilter.Update)
+
+		print('ok')
+
+	def test_AdaptiveSubdivision(self):
+		print('')
+		print('Testing adaptive subdivision',end=' ... ')
+		sys.stdout.flush()
+
+		#sphere with small triangles near the poles and long ones at the equator
+		sphere=vtk.vtkSphereSource()
+		sphere.SetThetaResolution(40)
+		sphere.SetPhiResolution(9)
+		sphere.Update()
+		polydata=sphere.GetOutput()
+
+		def area(polydata):
+			points=vtk_to_numpy(polydata.GetPoints().GetData()).astype(np.float64)
+			triangles=vtk_to_numpy(polydata.GetPolys().GetConnectivityArray()).reshape(-1,3)
+			return np.linalg.norm(np.cross(points[triangles[:,1]]-points[triangles[:,0]],points[triangles[:,2]]-points[triangles[:,0]]),axis=1)/2
+
+		subdivfilter=LinearSubdivisionFilter.LinearSubdivisionFilter()
+		subdivfilter.SetInputData(polydata)
+
+		#long edge length: the mesh is not divided
+		subdivfilter.SetMaximumEdgeLength(10.0)
+		subdivfilter.Update()
+		self.assertEqual(subdivfilter.GetOutput().GetNumberOfPoints(),polydata.GetNumberOfPoints())
+		self.assertEqual(subdivfilter.GetOutput().GetNumberOfPolys(),polydata.GetNumberOfPolys())
+
+		for length in (0.1,0.05,0.02):
+			subdivfilter.SetMaximumEdgeLength(length)
+			subdivfilter.Update()
+			output=subdivfilter.GetOutput()
+
+			#the surface is the same, and still closed: every edge is shared by two triangles
+			triangles=vtk_to_numpy(output.GetPolys().GetConnectivityArray()).reshape(-1,3)
+			edges=np.sort(np.concatenate((triangles[:,[0,1]],triangles[:,[1,2]],triangles[:,[2,0]])),axis=1)
+			edges,count=np.unique(edges,axis=0,return_counts=True)
+			self.assertTrue(np.all(count==2))
+			self.assertAlmostEqual(np.sum(area(output)),np.sum(area(polydata)),places=5)
+			self.assertTrue(np.all(area(output)>0))
+
+			#edges shorter than the maximum length, with fewer points than the uniform subdivision giving the same length
+			points=vtk_to_numpy(output.GetPoints().GetData()).astype(np.float64)
+			self.assertLessEqual(np.max(np.linalg.norm(points[edges[:,0]]-points[edges[:,1]],axis=1)),length)
+			inputpoints=vtk_to_numpy(polydata.GetPoints().GetData()).astype(np.float64)
+			inputtriangles=vtk_to_numpy(polydata.GetPolys().GetConnectivityArray()).reshape(-1,3)
+			level=int(np.ceil(np.max(np.linalg.norm(inputpoints[inputtriangles]-inputpoints[inputtriangles[:,[1,2,0]]],axis=2))/length))
+			uniform=LinearSubdivisionFilter.LinearSubdivisionFilter()
+			uniform.SetInputData(polydata)
+			uniform.SetNumberOfSubdivisions(level)
+			uniform.Update()
+			self.assertLess(output.GetNumberOfPoints(),uniform.GetOutput().GetNumberOfPoints())
+
+		print('ok')
+
+	def test_AreaWeighted(self):
+		print('')
+		print('Testing area weighted statistics',end=' ... ')
+		sys.stdout.flush()
+
+		#A: the plane z=x over the unit square, with points much denser near x=0
+		#B: the plane z=0, so the distances A->B are x (linear on each triangle)
+		directory=tempfile.mkdtemp()
+		try:
+			for name,resolution,warp in (('A',20,lambda points: np.stack((points[:,0]**2,points[:,1],points[:,0]**2),axis=1)),('B',4,lambda points: 3*points-[1,1,0])):
+				plane=vtk.vtkPlaneSource()
+				plane.SetResolution(resolution,resolution)
+				plane.SetCenter(0.5,0.5,0)
+				triangles=vtk.vtkTriangleFilter()
+				triangles.SetInputConnection(plane.GetOutputPort())
+				triangles.Update()
+				polydata=triangles.GetOutput()
+				points=vtk_to_numpy(polydata.GetPoints().GetData()).astype(np.float64)
+				polydata.GetPoints().SetData(numpy_to_vtk(warp(points),deep=1))
+				writer=vtk.vtkPolyDataWriter()
+				writer.SetFileName(os.path.join(directory,name+'.vtk'))
+				writer.SetInputData(polydata)
+				writer.Write()
+
+			valmet=ShapeStatistics.StatisticsLogic()
+			valmet.Set('A',os.path.join(directory,'A.vtk'))
+			valmet.Set('B',os.path.join(directory,'B.vtk'))
+
+			#the statistics of the surface: mean of x on the square 0.5, mean of x^2 1/3
+			for stats_engine in ('exact','histogram'):
+				stats=valmet.ComputeValues(signed=False,bins=1000,stats_engine=stats_engine,area_weighted=True)['A->B']
+				vertex=valmet.ComputeValues(signed=False,bins=1000,stats_engine=stats_engine)['A->B']
+				self.assertTrue(stats['area_weighted'])
+				self.assertAlmostEqual(np.sum(stats['histogram']),np.sqrt(2))
+				self.assertAlmostEqual(stats['mean'],0.5,places=2)
+				self.assertAlmostEqual(stats['msd'],1/3.0,places=2)
+				self.assertAlmostEqual(stats['median'],0.5,places=1)
+				self.assertLess(vertex['mean'],0.4)
+		finally:
+			shutil.rmtree(directory)
+
+		#equal weights give the statistics of the vertices
+		distances=[np.random.RandomState(0).normal(size=1001),np.random.RandomState(1).normal(size=500)]
+		weights=[np.full(1001,2.0),np.full(500,2.0)]
+		self.assertTrue(np.allclose(valmet.ExactStatistics(distances,weights),valmet.ExactStatistics(distances)))
+
+		print('ok')
+
+	def test_SubdivisionPipeline(self):
+		print('')
+		print('Testing in memory subdivision',end=' ... ')
+		sys.stdout.flush()
+
+		valmet=ShapeStatistics.StatisticsLogic()
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+		valmet.linearSample(2)
+
+		subdivfilter=LinearSubdivisionFilter.LinearSubdivisionFilter()
+		subdivfilter.SetInputData(valmet.A_shape)
+		subdivfilter.SetNumberOfSubdivisions(2)
+		subdivfilter.Update()
+		self.assertTrue(np.array_equal(vtk_to_numpy(valmet.getPolydata('A').GetPoints().GetData()),vtk_to_numpy(subdivfilter.GetOutput().GetPoints().GetData())))
+		self.assertNotEqual(valmet.getKey('A'),valmet.A_file_key)
+
+		#the distances are computed from the points of the subdivided shapes
+		stats=valmet.ComputeValues(signed=True)
+		self.assertEqual(len(stats['A->B']['distances'][0]),subdivfilter.GetOutput().GetNumberOfPoints())
+
+		#the subdivided shapes are saved with the results
+		directory=tempfile.mkdtemp()
+		try:
+			path=os.path.join(directory,'stats.npz')
+			valmet.SaveStatsAsNPZ(path,list(stats.values()),shapes={'A':valmet.getPolydata('A'),'B':valmet.getPolydata('B')})
+			shapes=valmet.LoadShapes(path)
+			self.assertEqual(sorted(shapes.keys()),['A','B'])
+			for ID in ('A','B'):
+				self.assertTrue(np.array_equal(vtk_to_numpy(shapes[ID].GetPoints().GetData()),vtk_to_numpy(valmet.getPolydata(ID).GetPoints().GetData())))
+				self.assertTrue(np.array_equal(vtk_to_numpy(shapes[ID].GetPolys().GetConnectivityArray()),vtk_to_numpy(valmet.getPolydata(ID).GetPolys().GetConnectivityArray())))
+			self.assertEqual(valmet.LoadStats(path)[0]['mean'],stats['A->B']['mean'])
+
+			valmet.SaveStatsAsNPZ(path,list(stats.values()))
+			self.assertEqual(valmet.LoadShapes(path),dict())
+		finally:
+			shutil.rmtree(directory)
+
+		#adaptive subdivision: only the triangles with long edges are divided, the level is ignored
+		key=valmet.getKey('A')
+		valmet.linearSample(2,max_edge_length=1.0)
+		subdivfilter=LinearSubdivisionFilter.LinearSubdivisionFilter()
+		subdivfilter.SetInputData(valmet.A_shape)
+		subdivfilter.SetMaximumEdgeLength(1.0)
+		subdivfilter.Update()
+		self.assertTrue(np.array_equal(vtk_to_numpy(valmet.getPolydata('A').GetPoints().GetData()),vtk_to_numpy(subdivfilter.GetOutput().GetPoints().GetData())))
+		self.assertNotEqual(valmet.getKey('A'),key)
+		stats=valmet.ComputeValues(signed=True)
+		self.assertEqual(len(stats['A->B']['distances'][0]),subdivfilter.GetOutput().GetNumberOfPoints())
+
+		#level 1: the shapes read from the files
+		valmet.linearSample(1)
+		self.assertIs(valmet.getPolydata('A'),valmet.A_shape)
+		self.assertEqual(valmet.getKey('A'),valmet.A_file_key)
+
+		print('ok')
+
+	def test_StatisticsServer(self):
+		print('')
+		print('Testing statistics server',end=' ... ')
+		sys.stdout.flush()
+
+		directory=tempfile.mkdtemp()
+		try:
+			server=ShapeStatisticsServer.StatisticsServer(os.path.join(directory,'server'),idle_timeout=60)
+			thread=threading.Thread(target=server.Serve)
+			thread.start()
+
+			client=ShapeStatisticsServer.StatisticsClient(os.path.join(directory,'server'))
+			for i in range(100):
+				state=client.Ping()
+				if state is not None:
+					break
+				time.sleep(0.1)
+			self.assertEqual(state['pid'],os.getpid())
+			self.assertEqual(state['jobs'],0)
+
+			#a second server of the directory returns at once, without replacing the token or the socket of the first one
+			self.assertFalse(ShapeStatisticsServer.StatisticsServer(os.path.join(directory,'server'),idle_timeout=60).Serve())
+			self.assertIsNotNone(client.Ping())
+
+			#same results as the CLI, the shapes stay loaded in the server
+			valmet=ShapeStatistics.StatisticsLogic()
+			valmet.Set('A','./File_A.vtk')
+			valmet.Set('B','./File_B.vtk')
+			expected=valmet.ComputeValues(signed=False,stats_engine='exact')
+			job={'fileA':os.path.abspath('./File_A.vtk'),'fileB':os.path.abspath('./File_B.vtk'),'bins':256,'signed':False,
+				'correspondence':False,'stats_engine':'exact','save_path':os.path.join(directory,'stats.npz')}
+			for i in range(2):
+				result=client.Compute(job)
+				self.assertEqual(result['status'],'ok')
+				for stats in result['results']:
+					self.assertAlmostEqual(stats['mean'],expected[stats['mode']]['mean'])
+					self.assertAlmostEqual(stats['median'],expected[stats['mode']]['median'])
+			saved=valmet.LoadStats(job['save_path'])
+			self.assertTrue(np.array_equal(saved[0]['distances'][0],expected['A->B']['distances'][0]))
+			self.assertEqual(client.Ping()['jobs'],2)
+
+			#errors are reported in the result
+			result=client.Compute(dict(job,fileA=os.path.join(directory,'missing.vtk')))
+			self.assertEqual(result['status'],'failed')
+			self.assertEqual(server.Process({'command':'ping','token':'wrong'})['status'],'failed')
+
+			client.Shutdown()
+			thread.join(10.0)
+			self.assertFalse(thread.is_alive())
+			self.assertIsNone(client.Ping())
+			self.assertRaises(IOError,client.Compute,job)
+
+			#server started in its own process
+			self.assertTrue(client.Start(wait=60.0))
+			self.assertNotEqual(client.Ping()['pid'],os.getpid())
+			self.assertEqual(client.Compute(job)['status'],'ok')
+			client.Shutdown()
+
+			#the server stops when it is idle
+			server=ShapeStatisticsServer.StatisticsServer(os.path.join(directory,'server'),idle_timeout=0.5)
+			thread=threading.Thread(target=server.Serve)
+			thread.start()
+			thread.join(10.0)
+			self.assertFalse(thread.is_alive())
+
+			#directories that other users could access, or a link to another directory, are refused
+			self.assertEqual(stat.S_IMODE(os.stat(os.path.join(directory,'server')).st_mode),0o700)
+			os.chmod(os.path.join(directory,'server'),0o755)
+			self.assertRaises(IOError,ShapeStatisticsServer.StatisticsServer(os.path.join(directory,'server')).Serve)
+			self.assertIsNone(client.Ping())
+			os.chmod(os.path.join(directory,'server'),0o700)
+			os.symlink(os.path.join(directory,'server'),os.path.join(directory,'link'))
+			self.assertRaises(IOError,ShapeStatisticsServer.StatisticsServer(os.path.join(directory,'link')).Serve)
+			self.assertIsNone(ShapeStatisticsServer.StatisticsClient(os.path.join(directory,'link')).Ping())
+		finally:
+			shutil.rmtree(directory)
+
+		print('ok')
+
+	def test_ImportTime(self):
+		print('')
+		print('Testing ShapeStatistics import time',end=' ... ')
+		sys.stdout.flush()
+
+		#time of an import in a new interpreter (best of 3 runs) and the heavy modules it loads
+		def import_time(module):
+			script=("import sys,time\nsys.path.append('../../')\nstart=time.time()\nimport "+module+"\nprint(time.time()-start)\n"
+				"print(' '.join(name for name in sys.modules if name in ('vtk','vtkmodules.all','scipy','matplotlib') or name.startswith('vtkmodules.vtk')))")
+			runs=[subprocess.check_output([sys.executable,'-c',script]).decode('utf-8').splitlines() for i in range(3)]
+			return min(float(run[0]) for run in runs),runs[0][1].split() if len(runs[0]) > 1 else []
+
+		#only the vtk modules needed to read the shapes are imported, the others when they are used
+		duration,modules=import_time('ShapeStatistics')
+		self.assertEqual(modules,['vtkmodules.vtkCommonCore'])
+
+		#import budget: less than half of the import of vtk alone
+		vtk_duration,vtk_modules=import_time('vtk')
+		self.assertLess(duration,vtk_duration/2)
+
+		print('ok (%.3fs, vtk %.3fs)' % (duration,vtk_duration))
+
+	def test_ResultCache(self):
+		print('')
+		print('Testing result cache',end=' ... ')
+		sys.stdout.flush()
+
+		directory=tempfile.mkdtemp()
+		try:
+			cache=os.path.join(directory,'cache')
+			shutil.copy('./File_A.vtk',os.path.join(directory,'A.vtk'))
+
+			valmet=ShapeStatistics.StatisticsLogic()
+			valmet.SetResultCache(cache)
+			valmet.Set('A',os.path.join(directory,'A.vtk'))
+			valmet.Set('B','./File_B.vtk')
+			expected=valmet.ComputeValues(signed=True,stats_engine='exact')
+			self.assertEqual(len(os.listdir(os.path.join(cache,'results'))),1)
+
+			#the same computation is read from memory, then from disk by another logic, nothing is computed
+			def fail(*args,**kwargs):
+				raise AssertionError('computed again')
+			for logic in (valmet,ShapeStatistics.StatisticsLogic()):
+				logic.SetResultCache(cache)
+				logic.Set('A',os.path.join(directory,'A.vtk'))
+				logic.Set('B','./File_B.vtk')
+				logic.Histogram=fail
+				cached=logic.ComputeValues(signed=True,stats_engine='exact')
+				self.assertEqual(list(cached.keys()),list(expected.keys()))
+				for mode,stats in expected.items():
+					self.assertEqual(cached[mode]['mean'],stats['mean'])
+					self.assertEqual(cached[mode]['histogram'],stats['histogram'])
+					for dist,cached_dist in zip(stats['distances'],cached[mode]['distances']):
+						self.assertTrue(np.array_equal(dist,cached_dist))
+				#the values returned can be modified without changing the cache
+				del cached['A->B']['distances']
+				self.assertIn('distances',logic.ComputeValues(signed=True,stats_engine='exact')['A->B'])
+			del valmet.Histogram
+
+			#other parameters or other contents are computed
+			valmet.ComputeValues(signed=False,stats_engine='exact')
+			self.assertEqual(len(os.listdir(os.path.join(cache,'results'))),2)
+			valmet.linearSample(1,max_edge_length=1.0)
+			valmet.ComputeValues(signed=False,stats_engine='exact')
+			self.assertEqual(len(os.listdir(os.path.join(cache,'results'))),3)
+			valmet.linearSample(1)
+			with open(os.path.join(directory,'A.vtk'),'a') as vtkfile:
+				vtkfile.write('\n')
+			os.utime(os.path.join(directory,'A.vtk'),(0,0))
+			valmet.Set('A',os.path.join(directory,'A.vtk'))
+			valmet.ComputeValues(signed=True,stats_engine='exact')
+			self.assertEqual(len(os.listdir(os.path.join(cache,'results'))),4)
+
+			#the least recently used files are removed above the size of the cache
+			valmet.SetResultCache(cache,max_size=1)
+			valmet.ComputeValues(signed=True,bins=128,stats_engine='exact')
+			self.assertEqual(os.listdir(os.path.join(cache,'results')),[])
+
+			#shared by concurrent processes
+			job={'fileA':'./File_A.vtk','fileB':'./File_B.vtk','bins':256,'signed':True,'correspondence':False,
+				'stats_engine':'exact','result_cache':cache}
+			results=valmet.ComputeBatch([job]*4,workers=2)
+			self.assertTrue(all(result['status'] == 'ok' for result in results))
+			self.assertTrue(all(result['results'][0]['mean'] == expected['A->B']['mean'] for result in results))
+			self.assertEqual(len([name for name in os.listdir(os.path.join(cache,'results')) if not name.startswith('.tmp')]),1)
+		finally:
+			shutil.rmtree(directory)
+
+		print('ok')
+
+	def test_RebinValues(self):
+		print('')
+		print('Testing histograms computed again from the distances',end=' ... ')
+		sys.stdout.flush()
+
+		valmet=ShapeStatistics.StatisticsLogic()
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+
+		#same values as the ones computed with the number of bins
+		for parameters in (dict(signed=True),dict(signed=False,correspondence=True),dict(signed=True,correspondence=True),
+			dict(signed=False,stats_engine='exact'),dict(signed=True,area_weighted=True)):
+			expected=valmet.ComputeValues(bins=100,**parameters)
+			rebinned=valmet.RebinValues(valmet.ComputeValues(bins=256,**parameters),100)
+			self.assertEqual(list(rebinned.keys()),list(expected.keys()))
+			for mode,stats in expected.items():
+				for key,value in stats.items():
+					if key != 'distances':
+						self.assertTrue(np.array_equal(rebinned[mode][key],value),(parameters,mode,key))
+
+		#from the results saved by the CLI
+		directory=tempfile.mkdtemp()
+		try:
+			path=os.path.join(directory,'stats.npz')
+			valmet.SaveStatsAsNPZ(path,list(valmet.ComputeValues(bins=256,signed=True).values()))
+			loaded=dict((stats['mode'],stats) for stats in valmet.LoadStats(path))
+			self.assertEqual(valmet.RebinValues(loaded,50)['A->B & B->A']['histogram'],valmet.ComputeValues(bins=50,signed=True)['A->B & B->A']['histogram'])
+			self.assertRaises(ValueError,valmet.RebinValues,dict((stats['mode'],stats) for stats in valmet.LoadStats(path,distances=False)),50)
+		finally:
+			shutil.rmtree(directory)
+
+		print('ok')
+
+	def test_IncrementalDistances(self):
+		print('')
+		print('Testing the incremental distances after a local edit',end=' ... ')
+		sys.stdout.flush()
+
+		directory=tempfile.mkdtemp()
+		try:
+			#A with a bump around one of its points
+			shape=ShapeStatistics.ReadPolyData('./File_A.vtk')
+			points=vtk_to_numpy(shape.GetPoints().GetData()).copy()
+			radius=np.linalg.norm(points-points[0],axis=1)
+			bump=radius < np.percentile(radius,3)
+			points[bump]+=0.05*(points[bump]-np.mean(points,axis=0))
+			editedA=vtk.vtkPolyData()
+			editedA.DeepCopy(shape)
+			editedA.GetPoints().SetData(numpy_to_vtk(points,deep=1))
+
+			#B with a hole, the remaining points being numbered again
+			shape=ShapeStatistics.ReadPolyData('./File_B.vtk')
+			points=vtk_to_numpy(shape.GetPoints().GetData())
+			triangles=ShapeStatistics._TrianglesToNumpy(shape.GetPolys())
+			radius=np.linalg.norm(np.mean(points[triangles],axis=1)-points[5],axis=1)
+			kept=triangles[radius > np.percentile(radius,2)]
+			hole=vtk.vtkPolyData()
+			hole.SetPoints(shape.GetPoints())
+			hole.SetPolys(ShapeStatistics._CellArray(np.arange(0,kept.size+1,3),kept.ravel().astype(np.int64)))
+			clean=vtk.vtkCleanPolyData()
+			clean.SetInputData(hole)
+			clean.PointMergingOff()
+			clean.Update()
+
+			files={'A':os.path.join(directory,'A.vtk'),'B':os.path.join(directory,'B.vtk')}
+			for ID,polydata in (('A',editedA),('B',clean.GetOutput())):
+				writer=vtk.vtkPolyDataWriter()
+				writer.SetFileName(files[ID])
+				writer.SetInputData(polydata)
+				writer.Write()
+
+			for ID in ('A','B'):
+				for parameters in (dict(signed=True),dict(signed=False,stats_engine='exact')):
+					valmet=ShapeStatistics.StatisticsLogic()
+					valmet.SetIncremental(True)
+					valmet.Set('A','./File_A.vtk')
+					valmet.Set('B','./File_B.vtk')
+					valmet.ComputeValues(**parameters)
+					valmet.Set(ID,files[ID])
+					incremental=valmet.ComputeValues(**parameters)
+
+					reference=ShapeStatistics.StatisticsLogic()
+					reference.Set('A',files['A'] if ID == 'A' else './File_A.vtk')
+					reference.Set('B',files['B'] if ID == 'B' else './File_B.vtk')
+					expected=reference.ComputeValues(**parameters)
+
+					for mode,stats in expected.items():
+						for key,value in stats.items():
+							if key == 'distances':
+								for dist,incremental_dist in zip(value,incremental[mode][key]):
+									self.assertTrue(np.array_equal(dist,incremental_dist),(ID,parameters,mode))
+							else:
+								self.assertEqual(incremental[mode][key],value,(ID,parameters,mode,key))
+
+					#only the distances close to the edit were computed again
+					for direction,state in valmet.previous_distances.items():
+						self.assertLess(len(state['update'][1]),len(state['distances'])/4,(ID,direction))
+
+			#the histogram of the edited direction was updated from the previous one
+			state=valmet.previous_distances['AB']
+			self.assertEqual(state['previous_histogram'][0],state['histogram'][0])
+
+			#the kept distances are released with the incremental mode
+			valmet.SetIncremental(False)
+			self.assertEqual(valmet.previous_distances,dict())
+		finally:
+			shutil.rmtree(directory)
+
+		print('ok')
+
+
+	def test_ProgressAndCancel(self):
+		print('')
+		print('Testing the progress and the cancellation of the computations',end=' ... ')
+		sys.stdout.flush()
+
+		reference=ShapeStatistics.StatisticsLogic()
+		reference.Set('A','./File_A.vtk')
+		reference.Set('B','./File_B.vtk')
+		reference.linearSample(4)
+		expected=reference.ComputeValues(signed=True)
+
+		#the progress is reported between the chunks, up to 1
+		valmet=ShapeStatistics.StatisticsLogic()
+		valmet.Set('A','./File_A.vtk')
+		valmet.Set('B','./File_B.vtk')
+		valmet.linearSample(4)
+		valmet.threads=2
+		progress=list()
+		valmet.SetProgressCallback(progress.append)
+		valmet.ComputeValues(signed=True)
+		self.assertGreater(len(progress),10)
+		self.assertEqual(progress,sorted(progress))
+		self.assertEqual(progress[-1],1.0)
+
+		#cancelled between two chunks
+		def cancel(value):
+			progress.append(value)
+			if value > 0.3:
+				valmet.Cancel()
+		progress=list()
+		valmet.SetProgressCallback(cancel)
+		self.assertRaises(ShapeStatistics.ComputationCancelled,valmet.ComputeValues,signed=True)
+		self.assertLess(progress[-1],0.5)
+		self.assertRaises(ShapeStatistics.ComputationCancelled,valmet.ComputeHausdorf)
+
+		#the logic can compute again
+		valmet.SetProgressCallback(None)
+		self.assertEqual(valmet.ComputeValues(signed=True)['A->B & B->A']['histogram'],expected['A->B & B->A']['histogram'])
+
+		#jobs of the server cancelled by the client, or when the client closes the connection
+		directory=tempfile.mkdtemp()
+		try:
+			server=ShapeStatisticsServer.StatisticsServer(os.path.join(directory,'server'),idle_timeout=60)
+			thread=threading.Thread(target=server.Serve)
+			thread.start()
+			client=ShapeStatisticsServer.StatisticsClient(os.path.join(directory,'server'))
+			for i in range(100):
+				if client.Ping() is not None:
+					break
+				time.sleep(0.1)
+
+			job={'fileA':os.path.abspath('./File_A.vtk'),'fileB':os.path.abspath('./File_B.vtk'),'bins':256,'signed':True,
+				'correspondence':False,'stats_engine':'histogram','subdivisions':20}
+			server_job=ShapeStatisticsServer.ServerJob(client,job)
+			server_job.start()
+			while server_job.GetProgress() == 0.0 and server_job.is_alive():
+				time.sleep(0.05)
+			self.assertGreater(server_job.GetProgress(),0.0)
+			#percentage, as the progress of a CLI node
+			self.assertLessEqual(server_job.GetProgress(),100.0)
+			#the jobs of the other clients are not cancelled
+			self.assertFalse(client.Cancel('other')['cancelled'])
+			time.sleep(0.5)
+			self.assertTrue(server_job.is_alive())
+			server_job.Cancel()
+			server_job.join(30.0)
+			self.assertEqual(server_job.GetStatusString(),'Cancelled')
+
+			#a job cancelled before the server receives it does not run
+			self.assertFalse(client.Cancel('early')['cancelled'])
+			self.assertEqual(client.Compute(job,'early')['status'],'cancelled')
+			self.assertEqual(client.Cancel(None)['status'],'failed')
+
+			connection=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+			connection.connect(os.path.join(directory,'server','socket'))
+			with open(os.path.join(directory,'server','token'),'r') as tokenfile:
+				request={'command':'compute','job':job,'token':tokenfile.read()}
+			connection.sendall((json.dumps(request)+'\n').encode('utf-8'))
+			while not client.Ping()['busy']:
+				time.sleep(0.05)
+			connection.close()
+			for i in range(300):
+				if not client.Ping()['busy']:
+					break
+				time.sleep(0.1)
+			self.assertFalse(client.Ping()['busy'])
+
+			#the next job is not cancelled, its progress is sent with its result
+			progress=[]
+			self.assertEqual(client.Compute(dict(job,subdivisions=5),progress=progress.append)['status'],'ok')
+			self.assertTrue(progress)
+			self.assertEqual(progress,sorted(progress))
+			self.assertTrue(all(0.0 <= value <= 1.0 for value in progress))
+
+			client.Shutdown()
+			thread.join(10.0)
+		finally:
+			shutil.rmtree(directory)
+
+		print('ok')
+
+
 
 def str2bool(v):
 	
@@ -8,7 +8,9 @@ from slicer.ScriptedLoadableModule import *
 import csv
 import json
 import numpy as np
+from vtk.util.numpy_support import numpy_to_vtk
 import ShapeStatistics
+import ShapeStatisticsServer
 
 #Debug line, permit to modify ShapeStatistics
 #without relaunching Slicer
@@ -92,6 +94,8 @@ class ShapeDistanceAnalyzerWidget(ScriptedLoadableModuleWidget):
         self.comboBox_distanceType=self.logic.get('comboBox_distanceType')
         self.comboBox_correspondence=self.logic.get('comboBox_correspondence')
         self.spinBox_sampling=self.logic.get('spinBox_sampling')
+        self.doubleSpinBox_edgeLength=self.logic.get('doubleSpinBox_edgeLength')
+        self.checkBox_useServer=self.logic.get('checkBox_useServer')
 
         #Translation
         self.horizontalSlider_translation=self.logic.get('horizontalSlider_translation')
@@ -134,6 +138,16 @@ class ShapeDistanceAnalyzerWidget(ScriptedLoadableModuleWidget):
         self.spinBox_sampling.setMaximum(50)
         self.spinBox_sampling.setValue(0)
 
+        #adaptive subdivision (0: the sampling level is used)
+        self.doubleSpinBox_edgeLength.setMinimum(0)
+        self.doubleSpinBox_edgeLength.setMaximum(1000)
+        self.doubleSpinBox_edgeLength.setDecimals(3)
+        self.doubleSpinBox_edgeLength.setValue(0)
+        self.doubleSpinBox_edgeLength.setSpecialValueText('Off')
+
+        #the ShapeStatistics server is only used if it is checked, the choice is kept in the settings
+        self.checkBox_useServer.setChecked(str(slicer.app.userSettings().value('ShapeDistanceAnalyzer/UseServer','false')).lower() == 'true')
+
         #Translation
         self.horizontalSlider_translation.setMinimum(0)
         self.horizontalSlider_translation.setMaximum(400)
@@ -168,6 +182,7 @@ class ShapeDistanceAnalyzerWidget(ScriptedLoadableModuleWidget):
         self.pathLineEdit_fileB.connect('currentPathChanged(const QString)', self.onLoadFileB)
 
         #Parameters
+        self.spinBox_bins.connect('valueChanged(int)',self.onBinsChanged)
  
         #Translation
         self.horizontalSlider_translation.connect('valueChanged(int)',self.onTranslation)
@@ -191,6 +206,7 @@ class ShapeDistanceAnalyzerWidget(ScriptedLoadableModuleWidget):
         self.pathLineEdit_fileB.disconnect('currentPathChanged(const QString)', self.onLoadFileB)
 
         #Parameters
+        self.spinBox_bins.disconnect('valueChanged(int)',self.onBinsChanged)
  
         #Translation
         self.horizontalSlider_translation.disconnect('valueChanged(int)',self.onTranslation)
@@ -293,25 +309,20 @@ class ShapeDistanceAnalyzerWidget(ScriptedLoadableModuleWidget):
             self.pathLineEdit_fileB.setCurrentPath(' ')
 
     #Action to do when compute button is pushed
+    #during a computation, the button cancels it
     def onCompute(self):
+        if self.logic.isComputing():
+            print('Cancelling ...')
+            self.logic.cancelStats()
+            return
+
         print('Computing ...')
+        #the shapes are subdivided by the statistics CLI, in memory
         sampling_level=self.spinBox_sampling.value
+        max_edge_length=self.doubleSpinBox_edgeLength.value
 
-        #sampling
-        if sampling_level>0:
-            fileA=self.pathLineEdit_fileA.currentPath
-            fileB=self.pathLineEdit_fileB.currentPath
-
-            self.logic.samplePolydatas(fileA,fileB,sampling_level)
-
-            self.checkThreadTimer=qt.QTimer()
-            self.checkThreadTimer.connect('timeout()', self.onCheckSampling)
-            self.checkThreadTimer.start(100)
-
-            self.pushButton_compute.setText('Sampling ...')
-            self.pushButton_compute.setDisable(True)
-            #self.pushButton_compute.Disable(True)
-            return
+        self.logic.use_server=self.checkBox_useServer.checked
+        slicer.app.userSettings().setValue('ShapeDistanceAnalyzer/UseServer',self.logic.use_server)
 
         #Getting parameters
         nb_bins=self.spinBox_bins.value
@@ -332,25 +343,28 @@ class ShapeDistanceAnalyzerWidget(ScriptedLoadableModuleWidget):
         #self.logic.stats.Set('B',fileB_path)
 
         #computing
-        self.pushButton_compute.setText("Computing ...")
-        self.pushButton_compute.setDisable(True)
-        self.logic.computeStats(nb_bins,signed,correspondence)
+        self.pushButton_compute.setText("Cancel (0%)")
+        self.logic.computeStats(nb_bins,signed,correspondence,subdivisions=max(sampling_level,1),max_edge_length=max_edge_length)
 
         self.checkThreadTimer=qt.QTimer()
         self.checkThreadTimer.connect('timeout()', self.onCheckCompute)
         self.checkThreadTimer.start(100)
         return
 
+    #Action to do when the number of bins change: the histograms and the statistics of the results
+    #are computed again from their distances, the distances are not computed again
+    def onBinsChanged(self,nb_bins):
+        if not self.logic.rebin(nb_bins):
+            return
+
+        mode=self.comboBox_mode.currentText
+        self.showResultsLabels(mode)
+        self.logic.generate2DVisualisationNodes(mode)
+
     #Action to do when the mode change
     def onModeChanged(self,mode):
-        self.deleteResultsLabels()
-
         #show statistics labels
-        self.result_labels=self.logic.formatStats(mode)
-        for i in range(len(self.result_labels)):
-            label = self.result_labels[i]
-            self.gridLayout_results.addWidget(label[0],i+1,1)
-            self.gridLayout_results.addWidget(label[1],i+1,2)
+        self.showResultsLabels(mode)
 
         #configure color parameters
         mini,maxi=self.logic.getMinAndMax(mode)
@@ -453,74 +467,49 @@ class ShapeDistanceAnalyzerWidget(ScriptedLoadableModuleWidget):
             slicer.util.delayDisplay("Exploration saved")
             print('Done!')
 
-    def onCheckSampling(self):
-        stateA=self.logic.samplingA.GetStatusString()
-        stateB=self.logic.samplingB.GetStatusString()
-        if stateA=='Running'or stateA=='Scheduled' or stateB=='Running'or stateB=='Scheduled':
-            print('Sampling File A:',stateA)
-            print('Sampling File B:',stateB)
-        else:
-            print('Sampling done!')
-            self.checkThreadTimer.stop()
-            self.checkThreadTimer.disconnect('timeout()', self.onCheckSampling)
-
-            #Getting parameters
-            nb_bins=self.spinBox_bins.value
-
-            signed=False
-            if self.comboBox_distanceType.currentText == 'Signed Distance':
-                signed=True
-
-            correspondence=False
-            if self.comboBox_correspondence.currentText == 'Yes':
-                correspondence=True
-
-
-            fileA_path=self.logic.fileA_out
-            fileB_path=self.logic.fileB_out
-
-            self.logic.stats.Set('A',fileA_path)
-            self.logic.stats.Set('B',fileB_path)
-
-            #computing
-            self.pushButton_compute.setText("Computing ...")
-            self.logic.computeStats(nb_bins,signed,correspondence)
-
-            self.checkThreadTimer=qt.QTimer()
-            self.checkThreadTimer.connect('timeout()', self.onCheckCompute)
-            self.checkThreadTimer.start(100)
-            return
-
     def onCheckCompute(self):
         state=self.logic.cli_stats.GetStatusString()
         
         if state=='Running'or state=='Scheduled' :
-            print('Computing:',state)
+            #progress reported by the CLI (or the server) between the chunks of points
+            progress=self.logic.getProgress()
+            self.pushButton_compute.setText("Cancel (%d%%)" % int(100*progress))
+
+            #show the approximate statistics until the exact ones are computed
+            preview=self.logic.getPreview()
+            if preview is not None:
+                self.onPreview(preview)
         else:
 
             print('Computing:',state)
             self.checkThreadTimer.stop()
             self.checkThreadTimer.disconnect('timeout()', self.onCheckCompute)
+            self.logic.stopPreview()
+
+            if state=='Cancelled':
+                self.pushButton_compute.setText("Compute")
+                #show the last exact results again instead of the approximate ones
+                mode=self.comboBox_mode.currentText
+                if mode in self.logic.stats_dict:
+                    self.showResultsLabels(mode)
+                    self.logic.generate2DVisualisationNodes(mode)
+                else:
+                    self.deleteResultsLabels()
+                    self.logic.delete2DVisualisationNodes()
+                return
 
             results_file=self.logic.cli_param["outputStatisticsJSON"]
             #print(results_file)
-            with open(results_file,'r') as json_data:
-                results = json.load(json_data)
+            results = self.logic.stats.LoadStats(results_file)
+            #subdivided shapes, saved with the results by the CLI
+            shapes = self.logic.stats.LoadShapes(results_file)
 
-
-            # with open(results_file, 'rb') as csvfile:
-            #     reader=csv.DictReader(csvfile)
-            #     self.logic.stats_dict=dict()
             self.logic.stats_dict=dict()
             for res in results:
-                for key,value in res.items():
-                    if type(value)==type(list()):
-                        res[key]=np.array(value)
                 self.logic.stats_dict[res['mode']]=res
 
             #Config interface
             self.pushButton_compute.setText("Compute")
-            self.pushButton_compute.setEnable(True)
             self.pushButton_save.setEnabled(True)
 
             self.comboBox_mode.disconnect('currentIndexChanged(const QString)',self.onModeChanged)
@@ -536,8 +525,8 @@ class ShapeDistanceAnalyzerWidget(ScriptedLoadableModuleWidget):
             self.comboBox_mode.connect('currentIndexChanged(const QString)',self.onModeChanged)
 
             #show results
-            self.logic.show('A',self.logic.fileA_out,color=(1,0,0))
-            self.logic.show('B',self.logic.fileB_out,color=(0,0,1))
+            self.logic.show('A',self.logic.fileA_out,color=(1,0,0),polydata=shapes.get('A'))
+            self.logic.show('B',self.logic.fileB_out,color=(0,0,1),polydata=shapes.get('B'))
             self.AddDisplayNodeChangedObserver('Shape A')
             self.AddDisplayNodeChangedObserver('Shape B')
             self.onTranslation(self.horizontalSlider_translation.value)
@@ -547,6 +536,21 @@ class ShapeDistanceAnalyzerWidget(ScriptedLoadableModuleWidget):
             self.logic.generate2DVisualisationNodes(mode)
             print('Done!')
 
+    #show the histograms and the statistics computed on a sample of the points
+    #the distances are not known for every point, so the shapes are not colored: they keep
+    #the colors of the last exact results, which are still used when the mode or the colors change
+    def onPreview(self,results):
+        self.logic.preview_dict=results
+
+        mode=self.comboBox_mode.currentText
+        if mode not in results:
+            mode=list(results.keys())[0]
+
+        self.showResultsLabels(mode)
+
+        self.logic.generate2DVisualisationNodes(mode)
+        print('Preview:',results[mode]['sample_size'],'points of',results[mode]['number_of_points'])
+
     def onDisplayNodeModified(self,obj,event):
         colorNode = obj.GetDisplayNode().GetColorNode()
         if colorNode is not None:
@@ -577,6 +581,15 @@ class ShapeDistanceAnalyzerWidget(ScriptedLoadableModuleWidget):
                 pass
         self.result_labels=[[]]
 
+    #show the labels of the statistics of the mode in the result section
+    def showResultsLabels(self,mode):
+        self.deleteResultsLabels()
+        self.result_labels=self.logic.formatStats(mode)
+        for i in range(len(self.result_labels)):
+            label = self.result_labels[i]
+            self.gridLayout_results.addWidget(label[0],i+1,1)
+            self.gridLayout_results.addWidget(label[1],i+1,2)
+
     def AddDisplayNodeChangedObserver(self,name):
         shapenode=slicer.mrmlScene.GetFirstNodeByName(name)
         #Observer
@@ -592,7 +605,30 @@ class ShapeDistanceAnalyzerLogic(ScriptedLoadableModuleLogic):
     def __init__(self, interface):
         self.interface = interface
 
+        #the shapes are parsed once, then read from the cache by the module and the CLI
+        self.mesh_cache=ShapeStatistics.MeshCache(os.path.join(slicer.app.temporaryPath,'SDA_mesh_cache'))
+        #the statistics of a pair compared again with the same parameters are read from the cache
+        self.result_cache_directory=os.path.join(slicer.app.temporaryPath,'SDA_result_cache')
+
         self.stats=ShapeStatistics.StatisticsLogic()
+        self.stats.mesh_cache=self.mesh_cache
+
+        #approximate statistics shown while the CLI computes the exact ones
+        self.preview_stats=ShapeStatistics.StatisticsLogic()
+        self.preview_stats.mesh_cache=self.mesh_cache
+        self.preview=None
+        self.preview_step=0
+        #approximate statistics shown by the labels and the plots instead of stats_dict, which keeps
+        #the last exact results (the distances of every point of the shown shapes, used to color them)
+        self.preview_dict=None
+
+        #use_server: the statistics are computed by the ShapeStatistics server, which keeps the shapes loaded between
+        #the computations, instead of a new CLI process (the CLI is used if the server cannot be started)
+        #off by default, set from the module settings when a computation starts
+        self.server=ShapeStatisticsServer.StatisticsClient()
+        self.use_server=False
+        #running computation (CLI node or server job)
+        self.cli_stats=None
 
         self.generateLUT()
 
@@ -612,10 +648,16 @@ class ShapeDistanceAnalyzerLogic(ScriptedLoadableModuleLogic):
     #        If not, absolute distances are computed
     #correspondence: True or False, specify if a point to point correspondence should be used to compute the distances.
     #        If not, closest point distances are computed 
+    #area_weighted: True or False, specify if the points are weighted by the area of the surface around them
+    #        (statistics of the surfaces, without sampling the shapes)
+    #subdivisions: number of divisions of each edge of the shapes, subdivided in memory by the CLI (1: no subdivision)
+    #        the subdivided shapes are returned with the results
+    #max_edge_length: adaptive subdivision instead, the triangles are only divided until their edges are shorter
+    #        than this length (0: uniform subdivision)
     #results:
     #initialise self.stats_dict, it contains the results for each mode (A->B / B->A / A->B & B->A) 
     # if correspondence = True and signed = False, only one mode is computed (A<->B)
-    def computeStats(self,nb_bins,signed,correspondence):
+    def computeStats(self,nb_bins,signed,correspondence,area_weighted=False,subdivisions=1,max_edge_length=0):
 
         shapestats = slicer.modules.shapestatistics
 
@@ -628,9 +670,99 @@ class ShapeDistanceAnalyzerLogic(ScriptedLoadableModuleLogic):
         self.cli_param["NumberOfBins"] = nb_bins
         self.cli_param["Signed"]=signed
         self.cli_param["Correspondence"]=correspondence
+        self.cli_param["AreaWeighted"]=area_weighted
+        self.cli_param["Subdivisions"]=subdivisions
+        self.cli_param["MaximumEdgeLength"]=max_edge_length
+        #the distances of the pair are computed in one thread: each thread needs its own vtk locator,
+        #which costs memory and build time (see StatisticsLogic.GetLocators)
+        self.cli_param["Threads"]=1
+        self.cli_param["MeshCacheDirectory"]=self.mesh_cache.directory
+        self.cli_param["ResultCacheDirectory"]=self.result_cache_directory
+
+        #binary results: the distances are not parsed from text
+        self.cli_param["outputStatisticsJSON"]= os.path.join(slicer.app.temporaryPath, 'SDA_statistics_result.npz')
+
+        use_server=self.use_server
+        if use_server and not self.server.Start(python=self.getPythonLauncher()):
+            print('The ShapeStatistics server could not be started, the CLI is used')
+            use_server=False
+
+        if use_server:
+            #same job as the CLI, self.cli_stats gives its state as a CLI node
+            #incremental: after an edit of a shape, the server only computes again the distances changed by the edit
+            job={'fileA':fileA_path,'fileB':fileB_path,'bins':nb_bins,'signed':signed,'correspondence':correspondence,
+                'stats_engine':'histogram','engine':'vtk','area_weighted':area_weighted,'subdivisions':subdivisions,'max_edge_length':max_edge_length,
+                'threads':1,'mesh_cache':self.mesh_cache.directory,'result_cache':self.result_cache_directory,
+                'incremental':True,'save_path':self.cli_param["outputStatisticsJSON"]}
+            self.cli_stats=ShapeStatisticsServer.ServerJob(self.server,job)
+            self.cli_stats.start()
+        else:
+            self.cli_stats=slicer.cli.run(shapestats, None, self.cli_param, wait_for_completion=False)
 
-        self.cli_param["outputStatisticsJSON"]= os.path.join(slicer.app.temporaryPath, 'SDA_statistics_result.json')
-        self.cli_stats=slicer.cli.run(shapestats, None, self.cli_param, wait_for_completion=False)
+        #the approximate statistics are not weighted
+        if area_weighted:
+            self.stopPreview()
+        else:
+            self.startPreview(nb_bins,signed,correspondence,subdivisions,max_edge_length)
+
+    #return the command running the python scripts with the python of Slicer, used to start the server
+    def getPythonLauncher(self):
+        for name in ('PythonSlicer','PythonSlicer.exe'):
+            launcher=os.path.join(slicer.app.slicerHome,'bin',name)
+            if os.path.exists(launcher):
+                return launcher
+        return sys.executable
+
+    #function to compute the histograms and the statistics of the results again with another number of bins,
+    #from their distances (see StatisticsLogic.RebinValues), in a few milliseconds: the distances are not computed again
+    #return False if there are no results with all the distances (not computed yet, or approximate statistics)
+    def rebin(self,nb_bins):
+        if not self.stats_dict or any('distances' not in stats or 'sample_size' in stats for stats in self.stats_dict.values()):
+            return False
+        self.stats_dict=self.stats.RebinValues(self.stats_dict,nb_bins)
+        return True
+
+    #return True if a computation started by computeStats is running
+    def isComputing(self):
+        return self.cli_stats is not None and self.cli_stats.GetStatusString() in ('Scheduled','Running')
+
+    #return the progress (0 to 1) of the running computation
+    #(the <filter-progress> of the CLI, or the progress of the server job)
+    def getProgress(self):
+        #the CLI node and the server job give a percentage
+        return self.cli_stats.GetProgress()/100.0
+
+    #cancel the running computation: the CLI is stopped, or the server job stops after its current chunk of points
+    def cancelStats(self):
+        self.stopPreview()
+        self.cli_stats.Cancel()
+
+    #function to compute approximate statistics on samples of the points (1% then 10%) in a background thread
+    #while the exact ones are computed by the CLI (see getPreview), from the shapes subdivided the same way
+    def startPreview(self,nb_bins,signed,correspondence,subdivisions=1,max_edge_length=0):
+        self.stopPreview()
+
+        self.preview_step=0
+        self.preview=ShapeStatistics.ProgressiveStatistics(self.preview_stats,self.fileA_out,self.fileB_out,subdivisions=subdivisions,max_edge_length=max_edge_length,
+            bins=nb_bins,signed=signed,correspondence=correspondence,fractions=(0.01,0.1),exact=False)
+        self.preview.start()
+
+    #function to stop the approximate statistics computation
+    def stopPreview(self):
+        if self.preview is not None:
+            self.preview.Cancel()
+            self.preview=None
+        self.preview_dict=None
+
+    #return the approximate statistics computed since the last call, None if there are none
+    def getPreview(self):
+        if self.preview is None:
+            return None
+        step,results=self.preview.GetResults()
+        if step == self.preview_step:
+            return None
+        self.preview_step=step
+        return results
 
         
 
@@ -661,7 +793,7 @@ class ShapeDistanceAnalyzerLogic(ScriptedLoadableModuleLogic):
         label_dict['iqr_q1']='IQR_Q1'
         label_dict['iqr_q3']='IQR_Q3'
 
-        results=self.stats_dict[mode]
+        results=self.getShownStats(mode)
 
         QLabel_array=list()
         for key in value_order:
@@ -678,10 +810,22 @@ class ShapeDistanceAnalyzerLogic(ScriptedLoadableModuleLogic):
             else:
                 value=round(value,4)
 
+            #approximate values are shown with their confidence interval
+            if key in results.get('confidence_intervals',{}):
+                lower,upper=results['confidence_intervals'][key]
+                value='~'+str(value)+' ['+str(round(lower,4))+', '+str(round(upper,4))+']'
+
             QLabel_array.append([qt.QLabel(label+':'),qt.QLabel(value)])
 
         return QLabel_array
     
+    #return the statistics of the mode shown by the labels and the plots: the approximate ones
+    #during a computation (if they have this mode), the exact ones otherwise
+    def getShownStats(self,mode):
+        if self.preview_dict is not None and mode in self.preview_dict:
+            return self.preview_dict[mode]
+        return self.stats_dict[mode]
+
     #return the minimum distamce and the maximum distance for the selected mode
     def getMinAndMax(self,mode):
         mini = self.stats_dict[mode]['minimum']
@@ -825,8 +969,8 @@ class ShapeDistanceAnalyzerLogic(ScriptedLoadableModuleLogic):
 
     #function that returns the histogram and the edge of the selected mode in a VTKFloat array
     def getHistogramAsVTKFloatArray(self,mode):
-        hist=self.stats_dict[mode]['histogram']
-        edge=self.stats_dict[mode]['edge_mean']
+        hist=self.getShownStats(mode)['histogram']
+        edge=self.getShownStats(mode)['edge_mean']
 
         vtkhist=self.generateVTKFloatArrayFromNumpy(hist)
         vtkedge=self.generateVTKFloatArrayFromNumpy(edge)
@@ -841,11 +985,11 @@ class ShapeDistanceAnalyzerLogic(ScriptedLoadableModuleLogic):
     #function to show in slicer mrml scene the shape identified by ID
     #the color parameter define the color of the shape
     #shape is translated in the x axis by posX
-    def show(self,ID,file,color=(1,1,1),posX=0):
-        reader=vtk.vtkPolyDataReader()
-        reader.SetFileName(file)
-        reader.Update()
-        polydata=reader.GetOutput()
+    #only the geometry is read: the normals are computed and the distances are shown as scalars
+    #polydata: shape already in memory (e.g. subdivided by the CLI), the file is not read
+    def show(self,ID,file,color=(1,1,1),posX=0,polydata=None):
+        if polydata is None:
+            polydata=ShapeStatistics.ReadPolyData(file,geometry_only=True,cache=self.mesh_cache)
 
         if ID == 'A':
             name=self.shapeA_name
@@ -1087,34 +1231,6 @@ class ShapeDistanceAnalyzerLogic(ScriptedLoadableModuleLogic):
         self.disableScalarView(self.shapeB_name)
 
 
-    #------------------------------------------------------#    
-    #           LinearSubdivision cli Functions            #
-    #------------------------------------------------------#
-
-    def samplePolydatas(self,fileA,fileB,sampling_level):
-        sampler = slicer.modules.linearsubdivision
-
-        directory ,filename = os.path.split(fileA)
-        name ,ext =os.path.splitext(filename)
-        self.fileA_out=slicer.app.temporaryPath + '/' + name +'out'+ext
-
-        self.eval_paramA = {}
-        self.eval_paramA["input"] = fileA
-        self.eval_paramA["output"] = self.fileA_out
-        self.eval_paramA["subdivisions"] = sampling_level
-        self.samplingA=slicer.cli.run(sampler, None, self.eval_paramA, wait_for_completion=False)
-
-        directory ,filename = os.path.split(fileB)
-        name ,ext =os.path.splitext(filename)
-        self.fileB_out=slicer.app.temporaryPath + '/' + name +'out'+ext
-
-        self.eval_paramB = {}
-        self.eval_paramB["input"] = fileB
-        self.eval_paramB["output"] = self.fileB_out
-        self.eval_paramB["subdivisions"] = sampling_level
-        self.samplingB=slicer.cli.run(sampler, None, self.eval_paramB, wait_for_completion=False)
-
-
     #------------------------------------------------------#    
     #                  Utility Functions                   #
     #------------------------------------------------------#
@@ -1143,13 +1259,9 @@ class ShapeDistanceAnalyzerLogic(ScriptedLoadableModuleLogic):
 
     #function that convert a 1 dimensional numpy array into a VTKFloat array
     def generateVTKFloatArrayFromNumpy(self,np_array):
-        size = np_array.size
+        np_float = np.ascontiguousarray(np_array,dtype=np.float32).ravel()
 
-        vtk_float = vtk.vtkFloatArray()
-        vtk_float.SetNumberOfComponents(1)
-        for i in range(size):
-            
-            vtk_float.InsertNextTuple([np_array[i]])
+        vtk_float = numpy_to_vtk(np_float,deep=1,array_type=vtk.VTK_FLOAT)
         return vtk_float
 
     #delete, if it exist, a node identified by his name
@@ -1159,15 +1271,9 @@ class ShapeDistanceAnalyzerLogic(ScriptedLoadableModuleLogic):
             slicer.mrmlScene.RemoveNode(node)
 
     def IsCorrespondencePossible(self,pathA,pathB):
-        readerA=vtk.vtkPolyDataReader()
-        readerA.SetFileName(pathA)
-        readerA.Update()
-        nb_points_A=readerA.GetOutput().GetPoints().GetNumberOfPoints()
-
-        readerB=vtk.vtkPolyDataReader()
-        readerB.SetFileName(pathB)
-        readerB.Update()
-        nb_points_B=readerB.GetOutput().GetPoints().GetNumberOfPoints()
+        nb_points_A=ShapeStatistics.ReadPolyData(pathA,geometry_only=True,cache=self.mesh_cache).GetPoints().GetNumberOfPoints()
+
+        nb_points_B=ShapeStatistics.ReadPolyData(pathB,geometry_only=True,cache=self.mesh_cache).GetPoints().GetNumberOfPoints()
 
         return nb_points_A==nb_points_B
             
@@ -1,39 +1,446 @@
 from __future__ import print_function
 import numpy as np
 
-import vtk
-from vtk.util.numpy_support import vtk_to_numpy
-#import sys
-#sys.path.append('Resources/LinearSubdivisionFilter')
-#import LinearSubdivisionFilter
-
+try:
+	from vtkmodules.util.numpy_support import vtk_to_numpy, numpy_to_vtk, numpy_to_vtkIdTypeArray
+except ImportError:
+	from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk, numpy_to_vtkIdTypeArray
+import os
+import sys
 import csv
 import json
+import threading
+import multiprocessing
+import collections
+import itertools
+import re
+import warnings
+import importlib
+import hashlib
+import shutil
+import tempfile
+import time
+import weakref
+
+#the subdivision filter is a resource of the module, next to this file (imported by linearSample)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'Resources','LinearSubdivisionFilter'))
+
+#vtk module of each vtk class used here
+_VTK_MODULES={
+	'vtkPoints':'vtkCommonCore','vtkIdTypeArray':'vtkCommonCore','vtkDoubleArray':'vtkCommonCore',
+	'vtkPolyData':'vtkCommonDataModel','vtkCellArray':'vtkCommonDataModel','vtkStaticPointLocator':'vtkCommonDataModel',
+	'vtkImplicitPolyDataDistance':'vtkFiltersCore','vtkPolyDataNormals':'vtkFiltersCore','vtkTriangleFilter':'vtkFiltersCore',
+	'vtkSelectEnclosedPoints':'vtkFiltersModeling',
+	'vtkPolyDataReader':'vtkIOLegacy'}
+
+#namespace of the vtk classes used here (vtk.vtkPolyData, ...), each class is imported from its vtk module
+#the first time it is used: importing vtk loads every vtk module, which was most of the start time of the CLI
+#the whole vtk package is imported for the other classes and by vtk versions without vtkmodules
+class _VTKClasses:
+	def __getattr__(self,name):
+		if name.startswith('__'):
+			raise AttributeError(name)
+		try:
+			module=importlib.import_module('vtkmodules.'+_VTK_MODULES[name])
+		except (KeyError,ImportError):
+			module=importlib.import_module('vtk')
+		value=getattr(module,name)
+		setattr(self,name,value)
+		return value
+
+vtk=_VTKClasses()
+
+#scipy is only used to find the closest vertices faster
+#it is imported the first time it is used, see _KDTree
+cKDTree=None
+
+#closest point engine based on vtkImplicitPolyDataDistance, the object used by vtkDistancePolyDataFilter
+#it computes the distance of the points one by one using a cell locator
+class VTKDistanceEngine:
+	#the locator keeps some state during its queries, each thread needs its own locator
+	thread_safe=False
+
+	def __init__(self,polydata):
+		self.locator=vtk.vtkImplicitPolyDataDistance()
+		self.locator.SetInput(polydata)
+
+	#return the signed distances (negative inside the shape) from points (numpy array n x 3) to the shape
+	def Evaluate(self,points):
+		distances=vtk.vtkDoubleArray()
+		self.locator.FunctionValue(numpy_to_vtk(np.ascontiguousarray(points)),distances)
+		return vtk_to_numpy(distances)
+
+#closest point engine computing the distances of blocks of points at once with numpy
+#the triangles are grouped in a tree (consecutive triangles in Morton order of their centroids), each node
+#of the tree is bounded by a slab (a thin box around the mean plane of its triangles, limited by a disk
+#centered on one of its vertices), which gives a lower bound of the distance to its triangles much closer
+#to the distance than a bounding sphere, and the distance to this vertex gives an upper bound of the distance to the shape.
+#the tree is examined level by level, keeping the nodes whose lower bound is below the smallest upper bound,
+#then the triangles of the remaining leaves whose lower bound is below it are compared, so the distances are exact.
+#the sign follows vtkImplicitPolyDataDistance (same normals, negative inside the shape)
+#the engine is not registered in DISTANCE_ENGINES: its queries are less than twice as fast as the vtk engine
+#and its tree takes ten times longer to build than the vtk locator (see test_KDTreeEngineTime),
+#register it with DISTANCE_ENGINES['kdtree']=KDTreeDistanceEngine to use it
+class KDTreeDistanceEngine:
+	#the engine is only read during the queries, one engine is shared by all the threads
+	thread_safe=True
+
+	#maximum number of triangles of the leaves and number of children of the other nodes of the tree
+	max_leaf_size=8
+	branching=4
+
+	#number of points processed at once
+	block_size=1024
+
+	#closest points closer than tolerance (in barycentric coordinates) to an edge or a vertex
+	#use the interpolated point normals to get the sign, as in vtkImplicitPolyDataDistance
+	tolerance=1e-12
+
+	def __init__(self,polydata):
+		triangles=vtk.vtkTriangleFilter()
+		triangles.PassVertsOff()
+		triangles.PassLinesOff()
+		triangles.SetInputData(polydata)
+		triangles.Update()
+
+		#same normals as vtkImplicitPolyDataDistance
+		normals=vtk.vtkPolyDataNormals()
+		normals.SetInputData(triangles.GetOutput())
+		normals.ComputePointNormalsOn()
+		normals.ComputeCellNormalsOn()
+		normals.SplittingOff()
+		normals.ConsistencyOn()
+		normals.AutoOrientNormalsOff()
+		normals.Update()
+		surface=normals.GetOutput()
+
+		self.points=vtk_to_numpy(surface.GetPoints().GetData()).astype(np.float64)
+		self.triangles=_TrianglesToNumpy(surface.GetPolys())
+		self.point_normals=vtk_to_numpy(surface.GetPointData().GetNormals()).astype(np.float64)
+		self.cell_normals=vtk_to_numpy(surface.GetCellData().GetNormals()).astype(np.float64)
+		if len(self.triangles) == 0:
+			raise ValueError('The shape has no triangles')
+
+		#the bounds and the triangles are stored field by field (one contiguous array per coordinate)
+		#so that the fields of the examined nodes are gathered with take
+		count=len(self.triangles)
+		vertices=self.points[self.triangles]
+		a=vertices[:,0]
+		ab=vertices[:,1]-a
+		ac=vertices[:,2]-a
+		bc=vertices[:,2]-vertices[:,1]
+		areas=np.cross(ab,ac)
+		centroids=np.mean(vertices,axis=1)
+		radii=np.max(np.linalg.norm(vertices-centroids[:,np.newaxis,:],axis=2),axis=1)
+		#rounding errors of the bounds, relative to the size of the triangles
+		margin=1e-9*radii
+		#slabs of the triangles: center, plane, thickness and radius, see Bounds
+		self.bounds=np.ascontiguousarray(np.column_stack((centroids,_UnitVectors(areas),margin,radii+margin)).T)
+		#edges of the triangles and their dot products, see ClosestTriangles
+		d00=np.einsum('ij,ij->i',ab,ab)
+		d01=np.einsum('ij,ij->i',ab,ac)
+		d11=np.einsum('ij,ij->i',ac,ac)
+		self.edges=np.ascontiguousarray(np.column_stack((a,ab,ac,bc,d00,d01,d11,np.einsum('ij,ij->i',bc,bc),d00*d11-d01*d01)).T)
+
+		#complete tree with the smallest leaves holding at most max_leaf_size triangles: the triangles
+		#(in Morton order) are padded with copies of the last one, the nodes containing only copies are never examined
+		depth=0
+		while self.max_leaf_size*self.branching**depth < count:
+			depth+=1
+		self.leaf_size=-(-count//self.branching**depth)
+		size=self.leaf_size*self.branching**depth
+		order=_MortonOrder(centroids)
+		order=np.concatenate((order,np.full(size-count,order[-1])))
+		self.leaves=order.reshape(-1,self.leaf_size)
+
+		#slabs of the nodes of each level (level 0: root), computed from the coordinates of the corners
+		corners=[np.ascontiguousarray(vertices[order,:,axis]).reshape(-1) for axis in range(3)]
+		areas=areas[order]
+		self.levels=list()
+		for level in range(depth+1):
+			nodes=self.branching**level
+			xyz=[coordinates.reshape(nodes,-1) for coordinates in corners]
+			low=np.column_stack([np.min(coordinates,axis=1) for coordinates in xyz])
+			high=np.column_stack([np.max(coordinates,axis=1) for coordinates in xyz])
+			middle=(low+high)/2
+			planes=_UnitVectors(np.sum(areas.reshape(nodes,-1,3),axis=1))
+			#center of the node: its vertex closest to the middle of its bounding box (a point of the shape)
+			offsets=[coordinates-middle[:,axis,np.newaxis] for axis,coordinates in enumerate(xyz)]
+			closest=np.argmin(offsets[0]*offsets[0]+offsets[1]*offsets[1]+offsets[2]*offsets[2],axis=1)
+			centers=np.column_stack([coordinates[np.arange(nodes),closest] for coordinates in xyz])
+			offsets=[coordinates-centers[:,axis,np.newaxis] for axis,coordinates in enumerate(xyz)]
+			squares=offsets[0]*offsets[0]+offsets[1]*offsets[1]+offsets[2]*offsets[2]
+			heights=np.abs(offsets[0]*planes[:,0,np.newaxis]+offsets[1]*planes[:,1,np.newaxis]+offsets[2]*planes[:,2,np.newaxis])
+			lateral=np.sqrt(np.maximum(squares-heights*heights,0))
+			margin=1e-9*np.linalg.norm(high-low,axis=1)
+			thickness=np.max(heights,axis=1)+margin
+			#the lower bound of the nodes containing only copies of the last triangle is inf
+			thickness[np.arange(nodes)*(size//nodes) >= count]=-np.inf
+			self.levels.append(np.ascontiguousarray(np.column_stack((centers,planes,thickness,np.max(lateral,axis=1)+margin)).T))
+
+	#return the signed distances (negative inside the shape) from points (numpy array n x 3) to the shape
+	def Evaluate(self,points):
+		points=np.asarray(points,dtype=np.float64)
+		dist=np.empty(len(points))
+		for start,stop in _Chunks(len(points),self.block_size):
+			dist[start:stop]=self.EvaluateBlock(points[start:stop])
+		return dist
+
+	def EvaluateBlock(self,points):
+		x,y,z=[np.ascontiguousarray(points[:,axis]) for axis in range(3)]
+
+		#nodes (of the current level) of each point which may contain its closest triangle:
+		#their lower bound is below the upper bound of the squared distance given by the centers of the nodes,
+		#the last level is made of the triangles of the remaining leaves
+		owners=np.arange(len(points))
+		nodes=np.zeros(len(points),dtype=np.intp)
+		upper=np.full(len(points),np.inf)
+		for level in range(1,len(self.levels)+1):
+			if level < len(self.levels):
+				owners=np.repeat(owners,self.branching)
+				nodes=(nodes[:,np.newaxis]*self.branching+np.arange(self.branching)).ravel()
+				bounds=self.levels[level]
+			else:
+				owners=np.repeat(owners,self.leaf_size)
+				nodes=self.leaves.take(nodes,axis=0).ravel()
+				bounds=self.bounds
+			lower,centers=self.Bounds(x.take(owners),y.take(owners),z.take(owners),bounds,nodes)
+			np.minimum.at(upper,owners,centers)
+			keep=np.flatnonzero(lower<=upper.take(owners))
+			owners=owners.take(keep)
+			nodes=nodes.take(keep)
+		triangles=self.ClosestTriangles(x,y,z,owners,nodes)
+
+		vertices=self.points[self.triangles[triangles]]
+		weights,dist2=_ClosestPointOnTriangles(points,vertices[:,0],vertices[:,1],vertices[:,2])
+
+		#normal at the closest point: cell normal inside the triangle,
+		#interpolated point normals on an edge or a vertex
+		normals=self.cell_normals[triangles]
+		on_edge=np.any(np.abs(weights)<self.tolerance,axis=1)
+		normals[on_edge]=np.einsum('ij,ijk->ik',weights[on_edge],self.point_normals[self.triangles[triangles[on_edge]]])
+
+		closest=np.einsum('ij,ijk->ik',weights,vertices)
+		dist=np.sqrt(dist2)
+		inside=np.einsum('ij,ij->i',normals,closest-points) > 0
+		np.negative(dist,out=dist,where=inside)
+
+		return dist
+
+	#return lower bounds of the squared distances between the points (coordinates x, y, z) and the nodes
+	#(one node per point, bounds holds the fields of the nodes of their level): the distance to the slab
+	#of the node (distance to its plane minus its thickness, combined with the distance in this plane
+	#to the disk containing its triangles), and the squared distances to the centers of the nodes
+	@staticmethod
+	def Bounds(x,y,z,bounds,nodes):
+		cx,cy,cz,nx,ny,nz,thickness,radii=[field.take(nodes) for field in bounds]
+		cx-=x
+		cy-=y
+		cz-=z
+		heights=cx*nx
+		heights+=cy*ny
+		heights+=cz*nz
+		np.abs(heights,out=heights)
+		cx*=cx
+		cy*=cy
+		cz*=cz
+		cx+=cy
+		cx+=cz
+		lateral=heights*heights
+		np.subtract(cx,lateral,out=lateral)
+		np.maximum(lateral,0,out=lateral)
+		np.sqrt(lateral,out=lateral)
+		lateral-=radii
+		np.maximum(lateral,0,out=lateral)
+		heights-=thickness
+		np.maximum(heights,0,out=heights)
+		heights*=heights
+		lateral*=lateral
+		heights+=lateral
+		return heights,cx
+
+	#return the closest triangle of each point among the triangles of its pairs (owners, triangles)
+	#owners must be sorted and contain every point
+	def ClosestTriangles(self,x,y,z,owners,triangles):
+		ax,ay,az,abx,aby,abz,acx,acy,acz,bcx,bcy,bcz,d00,d01,d11,dbc,denom=[field.take(triangles) for field in self.edges]
+		apx=x.take(owners)-ax
+		apy=y.take(owners)-ay
+		apz=z.take(owners)-az
+		d20=apx*abx+apy*aby+apz*abz
+		d21=apx*acx+apy*acy+apz*acz
+
+		#distance to the plane when its projection is inside the triangle (barycentric coordinates v, w)
+		with np.errstate(divide='ignore',invalid='ignore'):
+			v=(d11*d20-d01*d21)/denom
+			w=(d00*d21-d01*d20)/denom
+		inside=(v>=0)&(w>=0)&(v+w<=1)
+		rx=apx-v*abx-w*acx
+		ry=apy-v*aby-w*acy
+		rz=apz-v*abz-w*acz
+		plane=rx*rx+ry*ry+rz*rz
+
+		#distance to the closest edge otherwise
+		t=np.clip(np.divide(d20,d00,out=np.zeros_like(d20),where=d00>0),0,1)
+		rx=apx-t*abx
+		ry=apy-t*aby
+		rz=apz-t*abz
+		dist2=rx*rx+ry*ry+rz*rz
+		t=np.clip(np.divide(d21,d11,out=np.zeros_like(d21),where=d11>0),0,1)
+		rx=apx-t*acx
+		ry=apy-t*acy
+		rz=apz-t*acz
+		np.minimum(dist2,rx*rx+ry*ry+rz*rz,out=dist2)
+		bpx=apx-abx
+		bpy=apy-aby
+		bpz=apz-abz
+		t=bpx*bcx+bpy*bcy+bpz*bcz
+		t=np.clip(np.divide(t,dbc,out=np.zeros_like(t),where=dbc>0),0,1)
+		rx=bpx-t*bcx
+		ry=bpy-t*bcy
+		rz=bpz-t*bcz
+		np.minimum(dist2,rx*rx+ry*ry+rz*rz,out=dist2)
+		dist2=np.where(inside,plane,dist2)
+
+		#first pair reaching the minimum of its owner
+		starts=np.flatnonzero(np.r_[True,owners[1:]!=owners[:-1]])
+		minimum=np.repeat(np.minimum.reduceat(dist2,starts),np.diff(np.r_[starts,len(owners)]))
+		reached=np.flatnonzero(dist2==minimum)
+		first=reached[np.r_[True,owners.take(reached[1:])!=owners.take(reached[:-1])]]
+		return triangles.take(first)
+
+#closest point engines that can be used by StatisticsLogic (see StatisticsLogic.SetEngine)
+DISTANCE_ENGINES=collections.OrderedDict([('vtk',VTKDistanceEngine)])
+
+#raised by the computations of a StatisticsLogic cancelled by its Cancel method
+class ComputationCancelled(Exception):
+	pass
+
+#least recently used cache of the distance locators built on the shapes
+#a locator (closest point engine, see DISTANCE_ENGINES) is identified by the key of its shape
+#(see StatisticsLogic.Set) and the name of its engine
+#max_memory: approximate memory (in bytes) that the cached locators can use,
+#the least recently used locators are released when it is exceeded
+class LocatorCache:
+	def __init__(self,max_memory=1024**3):
+		self.max_memory=max_memory
+		self.locators=collections.OrderedDict()
+		self.memory=0
+
+	#return the locator associated to key, it is built on polydata if it is not cached
+	def Get(self,key,polydata,engine='vtk'):
+		locator=self.Find(key,engine)
+		if locator is None:
+			locator=DISTANCE_ENGINES[engine](polydata)
+			self.Add(key,polydata,locator,engine)
+		return locator
+
+	#return the locator associated to key if it is cached, None otherwise
+	def Find(self,key,engine='vtk'):
+		key=(engine,key)
+		if key not in self.locators:
+			return None
+		locator,size=self.locators.pop(key)
+		self.locators[key]=(locator,size)
+		return locator
+
+	#return the approximate memory (in bytes) used by a locator built on polydata:
+	#the locator holds a triangulated copy of the shape, its normals and a search structure
+	@staticmethod
+	def Size(polydata):
+		return 3*polydata.GetActualMemorySize()*1024
+
+	#add the locator built on polydata, associated to key (replacing the one already cached if any)
+	def Add(self,key,polydata,locator,engine='vtk'):
+		key=(engine,key)
+		if key in self.locators:
+			old_locator,old_size=self.locators.pop(key)
+			self.memory-=old_size
+		size=self.Size(polydata)
+		self.locators[key]=(locator,size)
+		self.memory+=size
+
+		#the locator just added is always kept, even if it exceeds the memory cap alone
+		while self.memory>self.max_memory and len(self.locators)>1:
+			old_key,(old_locator,old_size)=self.locators.popitem(last=False)
+			self.memory-=old_size
+
+	#release all the cached locators
+	def Clear(self):
+		self.locators.clear()
+		self.memory=0
 
 class StatisticsLogic:
 	def __init__(self):
 		self.A_path=None
+		self.A_file_key=None
+		self.A_key=None
 
 		self.B_path=None
+		self.B_file_key=None
+		self.B_key=None
+
+		#locators are shared between A->B, B->A and the following computations
+		#on the same shapes (e.g. a template compared to a population)
+		self.locator_cache=LocatorCache()
+		self.engine='vtk'
+
+		#distances are computed and reduced by chunks of chunk_size points
+		self.chunk_size=1000000
+
+		#number of threads used to compute the distances of a pair (0: one per core)
+		self.threads=1
+		self.lock=threading.Lock()
+
+		#directory where the distances are mapped on disk (see SetDistancesDirectory)
+		self.distances_directory=None
+
+		#on disk cache of the shapes read by Set (see SetMeshCache)
+		self.mesh_cache=None
+
+		#cache of the values computed by ComputeValues (see SetResultCache)
+		self.result_cache=None
+
+		#number of divisions of each edge of the shapes used to compute the distances (see linearSample)
+		self.sampling_level=1
+		#maximum length of the edges of the adaptively subdivided shapes, 0: uniform subdivision (see linearSample)
+		self.max_edge_length=0
+
+		#distances of each closest point direction ('AB', 'BA') and the shapes they were computed from,
+		#kept to only compute again the distances changed by an edit of the shapes (see SetIncremental)
+		self.incremental=False
+		self.previous_distances=dict()
+
+		#progress of the distances computations, as the fraction of the points done (see SetProgressCallback)
+		#reported between the chunks, where the cancellation is checked too (see Cancel)
+		self.progress_callback=None
+		self.progress_done=0
+		self.progress_total=0
+		self.cancelled=threading.Event()
+		#the chunks have at most 1/progress_steps of the points, so the progress is reported regularly
+		self.progress_steps=100
 
 
 	#load a .vtk file
 	#the ID parameter define if the file is loaded as the A shape or the B shape
-	#create a polydata reader in self.A_reader or self.B_reader
+	#the shape is read by ReadPolyData (only its geometry is needed) in self.A_shape or self.B_shape
+	#the shape is identified by a key (path, modification time and size of the file)
+	#used to find its cached locator
 	def Set(self,ID,file_path):
-		reader=vtk.vtkPolyDataReader()
-		reader.SetFileName(file_path)
-		reader.Update()
+		shape=ReadPolyData(file_path,geometry_only=True,cache=self.mesh_cache)
 
 		if ID =='A':
 			self.A_path=file_path
-			self.A_reader=reader
-			self.A_polydata=self.A_reader.GetOutput()
+			self.A_file_key=_FileKey(file_path)
+			self.A_key=self.A_file_key
+			self.A_shape=shape
+			self.A_polydata=self.A_shape
 
 		if ID =='B':
 			self.B_path=file_path
-			self.B_reader=reader
-			self.B_polydata=self.B_reader.GetOutput()
+			self.B_file_key=_FileKey(file_path)
+			self.B_key=self.B_file_key
+			self.B_shape=shape
+			self.B_polydata=self.B_shape
 
 	#function that return the polydata assocciated to shape identified by ID
 	def getPolydata(self,ID):
@@ -43,6 +450,55 @@ class StatisticsLogic:
 		if ID =='B':
 			return self.B_polydata
 
+	#function that return the key identifying the polydata of the shape ID
+	def getKey(self,ID):
+		if ID =='A':
+			return self.A_key
+
+		if ID =='B':
+			return self.B_key
+
+	#return the locator used to compute the distances to the shape identified by ID
+	#it is only built if the shape is not already in self.locator_cache
+	def GetLocator(self,ID):
+		with self.lock:
+			return self.locator_cache.Get(self.getKey(ID),self.getPolydata(ID),self.engine)
+
+	#return at most count locators of the shape identified by ID, one for each thread computing distances
+	#a thread safe locator is shared by all the threads, otherwise each thread gets its own copy
+	#(the copies are cached as the locator itself). the copies use at most half of the memory
+	#of the cache, so they do not release the locators of the other shapes: fewer threads are used
+	#for large shapes. the missing copies are built outside the lock
+	def GetLocators(self,ID,count):
+		if DISTANCE_ENGINES[self.engine].thread_safe:
+			return [self.GetLocator(ID)]*count
+		with self.lock:
+			engine=self.engine
+			polydata=self.getPolydata(ID)
+			count=max(1,min(count,self.locator_cache.max_memory//(2*LocatorCache.Size(polydata))))
+			keys=[self.getKey(ID) if copy == 0 else (self.getKey(ID),('copy',copy)) for copy in range(count)]
+			locators=[self.locator_cache.Find(key,engine) for key in keys]
+
+		for copy,key in enumerate(keys):
+			if locators[copy] is None:
+				locators[copy]=DISTANCE_ENGINES[engine](polydata)
+				with self.lock:
+					self.locator_cache.Add(key,polydata,locators[copy],engine)
+		return locators
+
+	#return the number of threads used to compute the distances (self.threads, 0: one per core)
+	def GetThreads(self):
+		if self.threads <= 0:
+			return multiprocessing.cpu_count()
+		return self.threads
+
+	#set the closest point engine used to compute the distances (see DISTANCE_ENGINES)
+	#'vtk': vtkImplicitPolyDataDistance
+	def SetEngine(self,engine):
+		if engine not in DISTANCE_ENGINES:
+			raise ValueError('Unknown closest point engine', engine)
+		self.engine=engine
+
 	#return True if both file A and file B have been set
 	#and if the computation is ready to be launched
 	#return False otherwise
@@ -55,8 +511,8 @@ class StatisticsLogic:
 	#return True if the 2 shapes have the same number of point
 	def IsCorrespondencePossible(self):
 		try:
-			nbr_points_A=self.A_reader.GetOutput().GetPoints().GetNumberOfPoints()
-			nbr_points_B=self.B_reader.GetOutput().GetPoints().GetNumberOfPoints()
+			nbr_points_A=self.A_shape.GetPoints().GetNumberOfPoints()
+			nbr_points_B=self.B_shape.GetPoints().GetNumberOfPoints()
 
 			if nbr_points_A == nbr_points_B:
 				return True
@@ -65,54 +521,338 @@ class StatisticsLogic:
 		except:
 			return False
 
-	def linearSample(self,sampling_level):
-		if sampling_level==1:
-			self.A_polydata = self.A_reader.GetOutput()
-			self.B_polydata = self.B_reader.GetOutput()
+	#subdivide both shapes in memory with the linear subdivision filter (sampling_level divisions of each edge)
+	#the distances are then computed from the points of the subdivided shapes, no file is written
+	#sampling_level<=1: the shapes read by Set are used
+	#max_edge_length>0: adaptive subdivision instead, every triangle is only divided until its edges are
+	#shorter than max_edge_length (see LinearSubdivisionFilter.SetMaximumEdgeLength), sampling_level is ignored
+	#the level is kept for the following computations, the shapes are only subdivided again if they changed
+	def linearSample(self,sampling_level,max_edge_length=0):
+		self.sampling_level=sampling_level
+		self.max_edge_length=max_edge_length
+		if max_edge_length>0:
+			subdivision=('edge_length',max_edge_length)
+		else:
+			subdivision=('subdivision',sampling_level)
+
+		if sampling_level<=1 and max_edge_length<=0:
+			self.A_polydata = self.A_shape
+			self.B_polydata = self.B_shape
+			self.A_key = self.A_file_key
+			self.B_key = self.B_file_key
+
+		elif self.A_polydata is not self.A_shape and self.A_key == self.A_file_key+subdivision and \
+			self.B_polydata is not self.B_shape and self.B_key == self.B_file_key+subdivision:
+			#already subdivided at this level
+			pass
 
 		else:
 			print('')
 			print('Sampling polydata ...',end=' ')
+			import LinearSubdivisionFilter
 			self.A_sampler=LinearSubdivisionFilter.LinearSubdivisionFilter()
-			self.A_sampler.SetInputData(self.A_reader.GetOutput())
+			self.A_sampler.SetInputData(self.A_shape)
 			self.A_sampler.SetNumberOfSubdivisions(sampling_level)
+			self.A_sampler.SetMaximumEdgeLength(max_edge_length or None)
 			self.A_sampler.Update()
 			self.A_polydata = self.A_sampler.GetOutput()
+			self.A_key = self.A_file_key+subdivision
 
 			self.B_sampler=LinearSubdivisionFilter.LinearSubdivisionFilter()
-			self.B_sampler.SetInputData(self.B_reader.GetOutput())
+			self.B_sampler.SetInputData(self.B_shape)
 			self.B_sampler.SetNumberOfSubdivisions(sampling_level)
+			self.B_sampler.SetMaximumEdgeLength(max_edge_length or None)
 			self.B_sampler.Update()
 			self.B_polydata = self.B_sampler.GetOutput()
+			self.B_key = self.B_file_key+subdivision
 			print('Done')
 
 	
 	#compute distances between A and B using the closest point method
-	#the vtk object vtkDistancePolyDataFilter is used to compute the distances
+	#the cached locator of the target shape (closest point engine selected with SetEngine,
+	#vtkImplicitPolyDataDistance as used by vtkDistancePolyDataFilter by default)
+	#is used to compute the distances
+	#the points are processed by chunks of self.chunk_size points, written in the array
+	#returned by NewDistances (mapped on disk if a distances directory is set)
 	#inverse=False : A->B ,inverse=True : B->A
-	#return a numpy array 
+	#return a numpy array (float64)
 	def ClosestPoint(self,signed=True,inverse=False):
-		distancefilter=vtk.vtkDistancePolyDataFilter()
-
+		dist, minimum, maximum = self.ClosestPointAndRange(signed=signed,inverse=inverse)
+		return dist
+
+	#same as ClosestPoint, the minimum and the maximum distances are computed chunk
+	#by chunk along with the distances, instead of another pass over the distances
+	#in incremental mode (see SetIncremental), only the distances of the points which could
+	#have changed since the previous computation of the direction are computed
+	#return a numpy array (float64), the minimum and the maximum distances
+	def ClosestPointAndRange(self,signed=True,inverse=False):
 		if inverse:
-			distancefilter.SetInputData(1,self.getPolydata('A'))
-			distancefilter.SetInputData(0,self.getPolydata('B'))
+			source,target='B','A'
 		else:
-			distancefilter.SetInputData(0,self.getPolydata('A'))
-			distancefilter.SetInputData(1,self.getPolydata('B'))
+			source,target='A','B'
 
-		distancefilter.SetSignedDistance(signed)
-		distancefilter.Update()
+		points = vtk_to_numpy(self.getPolydata(source).GetPoints().GetData())
+		dist = self.NewDistances('closest_point_'+source+target,len(points))
 
-		datavtkfloat=distancefilter.GetOutput().GetPointData().GetScalars()
-		dist = vtk_to_numpy(datavtkfloat)
+		previous = self.previous_distances.get(source+target) if self.incremental else None
+		unchanged = None
+		if previous is not None and previous['signed'] == signed and previous['engine'] == self.engine:
+			unchanged = self.UnchangedPoints(previous,self.getPolydata(source),self.getPolydata(target))
+
+		update = None
+		if unchanged is None:
+			minimum, maximum = self.EvaluateDistances(points,dist,target,signed)
+		else:
+			kept, match = unchanged
+			dist[kept] = previous['distances'][match[kept]]
+			self.ReportProgress(np.count_nonzero(kept))
+			changed = np.flatnonzero(~kept)
+			changed_dist = np.empty(len(changed))
+			if len(changed):
+				self.EvaluateDistances(points[changed],changed_dist,target,signed)
+				dist[changed] = changed_dist
+			minimum = min(np.min(dist[start:stop]) for start,stop in _Chunks(len(dist),self.chunk_size))
+			maximum = max(np.max(dist[start:stop]) for start,stop in _Chunks(len(dist),self.chunk_size))
+
+			#distances removed from and added to the previous ones (see DirectedHistogram)
+			previous_kept = np.zeros(len(previous['distances']),dtype=bool)
+			previous_kept[match[kept]] = True
+			update = (previous['distances'][~previous_kept], changed_dist)
+
+		if self.incremental:
+			self.previous_distances[source+target] = {'source':self.getPolydata(source),'target':self.getPolydata(target),
+				'distances':dist,'signed':signed,'engine':self.engine,'update':update,
+				'previous_histogram':previous.get('histogram') if update is not None else None,'histogram':None}
+
+		return dist, minimum, maximum
+
+	#compute the distances from points to the shape target into dist, by chunks of self.chunk_size points
+	#at most (and at most 1/self.progress_steps of the points, see ReportProgress, called after each chunk)
+	#with several threads (see GetThreads), the chunks are shared between the threads,
+	#each one writing the distances of its chunks at their place in dist
+	#return the minimum and the maximum distances
+	def EvaluateDistances(self,points,dist,target,signed=True):
+		threads = min(self.GetThreads(),len(points))
+		chunk_size = min(self.chunk_size,max(-(-len(points)//self.progress_steps),1024))
+		if threads > 1:
+			#several chunks per thread so that the threads finish at the same time
+			chunk_size = min(chunk_size,-(-len(points)//(4*threads)))
+		chunks = _Chunks(len(points),chunk_size)
+		locators = self.GetLocators(target,max(threads,1))
+
+		ranges = list()
+		errors = list()
+		chunks_iterator = iter(chunks)
+		chunks_lock = threading.Lock()
+		def compute(locator):
+			minimum = np.inf
+			maximum = -np.inf
+			try:
+				while not errors:
+					with chunks_lock:
+						start,stop = next(chunks_iterator,(None,None))
+					if start is None:
+						break
+
+					chunk = locator.Evaluate(points[start:stop])
+
+					if not signed:
+						np.abs(chunk,out=chunk)
+
+					dist[start:stop] = chunk
+					minimum = min(minimum,np.min(chunk))
+					maximum = max(maximum,np.max(chunk))
+					self.ReportProgress(stop-start)
+			except Exception as e:
+				errors.append(e)
+			ranges.append((minimum,maximum))
+
+		workers = [threading.Thread(target=compute,args=(locator,)) for locator in locators[1:]]
+		for worker in workers:
+			worker.start()
+		compute(locators[0])
+		for worker in workers:
+			worker.join()
+		if errors:
+			raise errors[0]
+
+		minimum = min(minimum for minimum,maximum in ranges)
+		maximum = max(maximum for minimum,maximum in ranges)
 
-		return dist.tolist()
+		return minimum, maximum
+
+	#compare the shapes of a direction with the ones its previous distances were computed from (see SetIncremental)
+	#the points of source are matched by position with the previous ones, and the triangles of target
+	#changed by the edit are found, with their neighbours (their point normals, giving the sign, changed too)
+	#a matched point keeps its previous distance if no changed triangle, previous or new, is closer
+	#than this distance (tested with the bounding spheres of the triangles, see _NearSpheres)
+	#return a mask of the points of source keeping their previous distance and the index of their previous point,
+	#None if the shapes can not be compared (cells other than triangles, points of target at the same position)
+	def UnchangedPoints(self,previous,source,target):
+		previous_points = vtk_to_numpy(previous['source'].GetPoints().GetData())
+		points = vtk_to_numpy(source.GetPoints().GetData())
+		match = _MatchPoints(previous_points,points)[0]
+		kept = match >= 0
+
+		if target is previous['target']:
+			return kept, match
+
+		previous_triangles = _Triangles(previous['target'])
+		triangles = _Triangles(target)
+		if previous_triangles is None or triangles is None:
+			return None
+		previous_target_points = vtk_to_numpy(previous['target'].GetPoints().GetData()).astype(np.float64)
+		target_points = vtk_to_numpy(target.GetPoints().GetData()).astype(np.float64)
+		target_match, target_ids, unique = _MatchPoints(previous_target_points,target_points)
+		if not unique:
+			return None
+
+		#triangles as the position ids of their points, starting from the smallest one (same orientation)
+		n = len(previous_target_points)
+		previous_keys = _TriangleKeys(previous_triangles,target_ids[:n])
+		keys = _TriangleKeys(triangles,target_ids[n:])
+		rows = np.concatenate((previous_keys,keys)).view(np.dtype((np.void,3*keys.itemsize))).ravel()
+		groups, inverse = np.unique(rows,return_inverse=True)
+		inverse = inverse.ravel()
+		changed_groups = np.bincount(inverse[:len(previous_keys)],minlength=len(groups)) != np.bincount(inverse[len(previous_keys):],minlength=len(groups))
+		changed_positions = np.zeros(len(target_ids),dtype=bool)
+		changed_positions[previous_keys[changed_groups[inverse[:len(previous_keys)]]]] = True
+		changed_positions[keys[changed_groups[inverse[len(previous_keys):]]]] = True
+		if not np.any(changed_positions):
+			return kept, match
+
+		vertices = np.concatenate((previous_target_points[previous_triangles[np.any(changed_positions[previous_keys],axis=1)]],
+			target_points[triangles[np.any(changed_positions[keys],axis=1)]]))
+		centers = np.mean(vertices,axis=1)
+		radii = np.max(np.linalg.norm(vertices-centers[:,np.newaxis,:],axis=2),axis=1)
+
+		candidates = np.flatnonzero(kept)
+		near = _NearSpheres(points[candidates],previous['distances'][match[candidates]],centers,radii)
+		kept[candidates[near]] = False
+
+		return kept, match
+
+	#compute the A->B and the B->A closest point distances in one step
+	#the locators of both shapes are prepared once, then both directions are computed
+	#one after the other, each one using all the threads
+	#return the A->B distances, the B->A distances and the (minimum, maximum) range of both
+	def SymmetricClosestPoint(self,signed=True):
+		threads = max(self.GetThreads(),1)
+		self.GetLocators('A',threads)
+		self.GetLocators('B',threads)
+
+		results = [self.ClosestPointAndRange(signed=signed,inverse=inverse) for inverse in (False,True)]
+
+		(distab, minab, maxab), (distba, minba, maxba) = results
+
+		return distab, distba, (min(minab,minba), max(maxab,maxba))
 	
+	#compute only the Hausdorff distances between A and B (maximum of the absolute distances),
+	#much faster than ComputeValues when the other statistics are not needed
+	#closest point: the directed distances are computed with DirectedHausdorf (early break)
+	#correspondence: the distances between the corresponding points are all computed
+	#seed: seed of the random order of the points, None gives a different order at each call
+	#return a dictionnary containing, for each mode ('A->B', 'B->A' and 'A->B & B->A' or 'A<->B'),
+	#the 'hausdorf' distance, the 'point_id' of the vertex attaining it, the 'shape' of this vertex
+	#and the number of 'evaluated_points'
+	def ComputeHausdorf(self,correspondence=False,seed=None):
+		self.linearSample(self.sampling_level,self.max_edge_length)
+
+		stats_dict=dict()
+		if correspondence:
+			self.StartProgress(self.getPolydata('A').GetNumberOfPoints())
+			dist = self.CorrespondenceDistance(signed=False)
+			point_id = int(np.argmax(dist))
+			stats_dict['A<->B'] = {'hausdorf':dist[point_id],'point_id':point_id,'shape':'A','evaluated_points':len(dist)}
+		else:
+			random=np.random.RandomState(seed)
+			self.StartProgress(self.getPolydata('A').GetNumberOfPoints()+self.getPolydata('B').GetNumberOfPoints())
+			for source,target in (('A','B'),('B','A')):
+				hausdorf, point_id, evaluated = self.DirectedHausdorf(source,target,random)
+				stats_dict[source+'->'+target] = {'hausdorf':hausdorf,'point_id':point_id,'shape':source,'evaluated_points':evaluated}
+
+			symmetric = max(stats_dict['A->B'],stats_dict['B->A'],key=lambda stats_values:stats_values['hausdorf'])
+			symmetric = dict(symmetric)
+			symmetric['evaluated_points'] = stats_dict['A->B']['evaluated_points']+stats_dict['B->A']['evaluated_points']
+			stats_dict['A->B & B->A'] = symmetric
+
+		for mode,stats_values in stats_dict.items():
+			stats_values['mode']=mode
+			stats_values['corresponding_points_exist']=correspondence
+
+		return stats_dict
+
+	#compute the directed Hausdorff distance from the shape source to the shape target
+	#(maximum of the closest point distances of the source points) with an early break strategy:
+	#the distance to the closest vertex of the target is an upper bound of the closest point distance,
+	#the points are processed by blocks in a random order and the points whose upper bound cannot
+	#beat the current maximum are skipped
+	#random: numpy RandomState giving the order of the points
+	#return the distance, the id of the source point attaining it and the number of points evaluated
+	def DirectedHausdorf(self,source,target,random=np.random):
+		points = vtk_to_numpy(self.getPolydata(source).GetPoints().GetData())
+		if len(points) == 0:
+			return 0.0, -1, 0
+
+		upper = self.VertexDistances(points,target)
+		locator = self.GetLocator(target)
+
+		#the point with the largest upper bound gives the first maximum
+		point_id = int(np.argmax(upper))
+		maximum = abs(locator.Evaluate(points[point_id:point_id+1])[0])
+		evaluated = 1
+
+		candidates = random.permutation(len(points))
+		candidates = candidates[upper[candidates] > maximum]
+		#the progress counts the points evaluated or skipped
+		self.ReportProgress(len(points)-len(candidates))
+
+		#small blocks first, the maximum is updated more often while many points are left
+		block = 64
+		while len(candidates) > 0:
+			ids = candidates[:block]
+			dist = np.abs(locator.Evaluate(points[ids]))
+			evaluated += len(ids)
+
+			i = np.argmax(dist)
+			if dist[i] > maximum:
+				maximum = dist[i]
+				point_id = int(ids[i])
+
+			remaining = len(candidates)
+			candidates = candidates[block:]
+			candidates = candidates[upper[candidates] > maximum]
+			block = min(2*block,self.chunk_size)
+			self.ReportProgress(remaining-len(candidates))
+
+		return maximum, point_id, evaluated
+
+	#compute the distances from points (numpy array n x 3) to the closest vertex of the surface
+	#of the shape identified by ID (vertices of its polygons and strips)
+	#it is an upper bound of the closest point distances of the points
+	#return a numpy array
+	def VertexDistances(self,points,ID):
+		polydata = self.getPolydata(ID)
+		vertices = vtk_to_numpy(polydata.GetPoints().GetData())[_SurfacePointIds(polydata)]
+
+		cKDTree=_KDTree()
+		if cKDTree is not None:
+			return cKDTree(vertices,balanced_tree=False,compact_nodes=False).query(points)[0]
+
+		vertices_polydata = vtk.vtkPolyData()
+		vertices_polydata.SetPoints(vtk.vtkPoints())
+		vertices_polydata.GetPoints().SetData(numpy_to_vtk(np.ascontiguousarray(vertices),deep=1))
+		locator = vtk.vtkStaticPointLocator()
+		locator.SetDataSet(vertices_polydata)
+		locator.BuildLocator()
+		return np.array([np.linalg.norm(point-vertices[locator.FindClosestPoint(point)]) for point in points])
+
 	#compute distances between A and B assuming that the two shapes have corresponding points
 	#the vtk object vtkSelectEnclosedPoints is used to give a sign for each distance
+	#(negative inside the other shape)
+	#the points are processed by chunks, as in ClosestPoint
 	#inverse=False : A->B ,inverse=True : B->A
-	#return a numpy array 
+	#return a numpy array (float64)
 	def CorrespondenceDistance(self,signed=False,inverse=False,tolerance=0.000000001):
 
 		A = self.getPolydata('A')
@@ -125,12 +865,19 @@ class StatisticsLogic:
 		B = B.GetData()
 		B = vtk_to_numpy(B)
 
-		dist = A-B
-		dist = np.linalg.norm(dist,axis=1)
+		if inverse:
+			dist = self.NewDistances('correspondence_BA',len(A))
+		else:
+			dist = self.NewDistances('correspondence_AB',len(A))
+
+		for start,stop in _Chunks(len(A),self.chunk_size):
+			#the distances are given as float64, as the closest point distances
+			dist[start:stop] = np.linalg.norm(A[start:stop]-B[start:stop],axis=1)
+			self.ReportProgress(stop-start)
 
 
 		if not signed:
-			return dist.tolist()
+			return dist
 
 		else:
 			enclosed_points=vtk.vtkSelectEnclosedPoints()
@@ -144,14 +891,113 @@ class StatisticsLogic:
 			enclosed_points.SetTolerance(tolerance)
 			enclosed_points.Update()
 
-			for i in range(len(dist)):
-				if enclosed_points.IsInside(i):
-					dist[i]=-dist[i]
+			#the inside/outside flags (same values as IsInside) are read at once
+			#to negate the distances of all the points inside the surface
+			inside = enclosed_points.GetOutput().GetPointData().GetArray('SelectedPoints')
+			inside = vtk_to_numpy(inside) != 0
+			for start,stop in _Chunks(len(A),self.chunk_size):
+				np.negative(dist[start:stop],out=dist[start:stop],where=inside[start:stop])
 		    
 			
 
-		return dist.tolist()
+		return dist
+
+	#return a new float64 array of size n to store the distances identified by name
+	#if self.distances_directory is set, the array is a .npy file mapped in memory,
+	#created in this directory (unique name), so the distances do not need to fit in memory.
+	#the file is removed at once: the mapping keeps its content until the array is released.
+	#where a mapped file cannot be removed (Windows), it is removed when the array is released
+	def NewDistances(self,name,n):
+		if self.distances_directory is None:
+			return np.empty(n,dtype=np.float64)
+
+		descriptor,file_path=tempfile.mkstemp(prefix=name+'_',suffix='.npy',dir=self.distances_directory)
+		os.close(descriptor)
+		try:
+			dist=np.lib.format.open_memmap(file_path,mode='w+',dtype=np.float64,shape=(n,))
+		except:
+			_RemoveFile(file_path)
+			raise
+		try:
+			os.remove(file_path)
+		except OSError:
+			weakref.finalize(dist,_RemoveFile,file_path)
+		return dist
+
+	#set the directory where the distances are stored in .npy files mapped in memory
+	#directory=None: the distances are kept in memory
+	def SetDistancesDirectory(self,directory):
+		if directory is not None and not os.path.isdir(directory):
+			os.makedirs(directory)
+		self.distances_directory=directory
 	
+	#set the directory of the on disk cache of the shapes read by Set (see MeshCache)
+	#max_size: size (in bytes) of the cache, the least recently used shapes are removed above it
+	#(None: default size of MeshCache)
+	#directory=None: the shapes are parsed at each Set
+	def SetMeshCache(self,directory,max_size=None):
+		if directory is None:
+			self.mesh_cache=None
+		else:
+			self.mesh_cache=MeshCache(directory,max_size=max_size)
+
+	#cache the values computed by ComputeValues in directory (in memory and on disk, see ResultCache)
+	#so the same pair compared again with the same parameters, by this logic or another process, is not computed again
+	#the values are not cached when the distances are mapped on disk (see SetDistancesDirectory)
+	#directory=None: no cache
+	def SetResultCache(self,directory,max_size=None):
+		if directory is None:
+			self.result_cache=None
+		else:
+			self.result_cache=ResultCache(directory,max_size=max_size)
+
+	#set the function called with the fraction (0 to 1) of the points done during the distances computations
+	#it is called between the chunks, from the threads computing the distances
+	#callback=None: the progress is not reported
+	def SetProgressCallback(self,callback):
+		self.progress_callback=callback
+
+	#start the progress of a computation of the distances of total points
+	def StartProgress(self,total):
+		with self.lock:
+			self.progress_done=0
+			self.progress_total=total
+		self.ReportProgress(0)
+
+	#count points whose distances are done and report the progress
+	#raise a ComputationCancelled if the computation was cancelled
+	def ReportProgress(self,count):
+		if self.cancelled.is_set():
+			self.cancelled.clear()
+			raise ComputationCancelled('The computation was cancelled')
+		with self.lock:
+			self.progress_done+=count
+			progress=self.GetProgress()
+		if self.progress_callback is not None:
+			self.progress_callback(progress)
+
+	#return the fraction (0 to 1) of the points done by the current computation
+	def GetProgress(self):
+		if self.progress_total <= 0:
+			return 0.0
+		return min(float(self.progress_done)/self.progress_total,1.0)
+
+	#stop the running computation: the threads computing the distances stop after their current chunk
+	#(so the cores are freed at once) and the computation raises a ComputationCancelled
+	#the logic can then be used for other computations
+	def Cancel(self):
+		self.cancelled.set()
+
+	#incremental=True: the closest point distances of each direction are kept with the shapes they were
+	#computed from, and when a shape is set again after a local edit, only the distances of the points
+	#which could have changed are computed again (see UnchangedPoints), the other ones are copied
+	#the histograms (and the statistics of the 'histogram' engine) are then updated from the changed distances
+	#incremental=False: the kept distances are released
+	def SetIncremental(self,incremental):
+		self.incremental=incremental
+		if not incremental:
+			self.previous_distances=dict()
+
 	#compute the histogram between A and B according to the given parameters
 	#mode=0: A->B, mode=1: B->A, mode=2: A->B and B->A
 	#set 3 attributes:
@@ -162,14 +1008,20 @@ class StatisticsLogic:
 	#  -the histogram array (bins elements)
 	#  -the edge array associated (bins+1 elements)
 	#  -a list containing the distances array used (contains only 1 array in mode 0 and 1 and 2 arrays in mode 2)
-	def Histogram(self,signed=True,bins=256,correspondence=False):
+	def Histogram(self,signed=True,bins=256,correspondence=False,weights=None):
 		if self.A_path and self.B_path:
+			if correspondence and not signed:
+				self.StartProgress(self.getPolydata('A').GetNumberOfPoints())
+			else:
+				self.StartProgress(self.getPolydata('A').GetNumberOfPoints()+self.getPolydata('B').GetNumberOfPoints())
 			hist_dict=dict()
 			distances=dict()
+			#weights of the points of each mode (see AreaWeights), None: every point counts once
+			weight=lambda mode,i: weights[mode][i] if weights else None
 			if correspondence :
 				if signed == False:
 					dist = self.CorrespondenceDistance(signed=signed)
-					hist , edge = np.histogram(dist,bins=bins)
+					hist , edge = np.histogram(dist,bins=bins,weights=weight('A<->B',0))
 					hist_dict['A<->B'] = hist
 					distances['A<->B'] = [dist] 
 
@@ -181,8 +1033,8 @@ class StatisticsLogic:
 					maxi=np.max([np.max(distab),np.max(distba)])
 					mini=np.min([np.min(distab),np.min(distba)])
 
-					histab,edge=np.histogram(distab,bins=bins,range=(mini,maxi))
-					histba,edge=np.histogram(distba,bins=bins,range=(mini,maxi))
+					histab,edge=np.histogram(distab,bins=bins,range=(mini,maxi),weights=weight('A->B',0))
+					histba,edge=np.histogram(distba,bins=bins,range=(mini,maxi),weights=weight('B->A',0))
 
 					hist_dict['A->B'] = histab 
 					hist_dict['B->A'] = histba
@@ -193,14 +1045,11 @@ class StatisticsLogic:
 
 					
 			else:
-				distab = self.ClosestPoint(signed=signed,inverse=False)
-				distba = self.ClosestPoint(signed=signed,inverse=True)
-
-				maxi=np.max([np.max(distab),np.max(distba)])
-				mini=np.min([np.min(distab),np.min(distba)])
+				distab, distba, (mini,maxi) = self.SymmetricClosestPoint(signed=signed)
 
-				histab,edge=np.histogram(distab,bins=bins,range=(mini,maxi))
-				histba,edge=np.histogram(distba,bins=bins,range=(mini,maxi))
+				histab=self.DirectedHistogram('AB',distab,bins,(mini,maxi),weight('A->B',0))
+				histba=self.DirectedHistogram('BA',distba,bins,(mini,maxi),weight('B->A',0))
+				edge=np.histogram_bin_edges(distab[:0],bins=bins,range=(mini,maxi))
 
 				hist_dict['A->B'] = histab 
 				hist_dict['B->A'] = histba
@@ -211,6 +1060,40 @@ class StatisticsLogic:
 
 			return hist_dict, edge, distances
 
+	#return the histogram of the closest point distances dist of the direction ('AB' or 'BA')
+	#in incremental mode (see SetIncremental), when the previous histogram of the direction has the same bins
+	#and range, it is updated with the distances changed since then instead of being computed again
+	def DirectedHistogram(self,direction,dist,bins,value_range,weights=None):
+		state=self.previous_distances.get(direction)
+		if state is None or state['distances'] is not dist or weights is not None:
+			return np.histogram(dist,bins=bins,range=value_range,weights=weights)[0]
+
+		previous=state['previous_histogram']
+		if previous is not None and previous[0] == (bins,value_range):
+			removed,added=state['update']
+			hist=previous[1]-np.histogram(removed,bins=bins,range=value_range)[0]+np.histogram(added,bins=bins,range=value_range)[0]
+		else:
+			hist=np.histogram(dist,bins=bins,range=value_range)[0]
+		state['histogram']=((bins,value_range),hist)
+		return hist
+
+	#weights of the points giving statistics of the surfaces instead of the vertices: each point
+	#is weighted by the area of the surface around it (see _PointAreas), so irregular meshes
+	#do not need to be resampled (subdivided) to get uniform surface statistics
+	#return a dictionnary containing, for each mode, the list of the weights of its distances arrays
+	#(the corresponding points of A and B get the mean of their areas)
+	def AreaWeights(self):
+		areaA = _PointAreas(self.getPolydata('A'))
+		areaB = _PointAreas(self.getPolydata('B'))
+
+		weights=dict()
+		weights['A->B'] = [areaA]
+		weights['B->A'] = [areaB]
+		weights['A->B & B->A'] = [areaA,areaB]
+		if len(areaA) == len(areaB):
+			weights['A<->B'] = [(areaA+areaB)/2]
+		return weights
+
 	#compute the mean of each bin dscribed by self.edge
 	#return 1 numpy array
 	def EdgeMean(self):
@@ -304,34 +1187,183 @@ class StatisticsLogic:
 
 		return IQR,IQR_Q1,IQR_Q3
 
+	#compute exactly the quantiles of the distances (list of arrays, considered as one set of values)
+	#quantiles: list of values between 0 and 1.0, all computed in one call
+	#the order statistics needed are selected with one partition of the values (O(n), no sort)
+	#and linearly interpolated in between (same convention as numpy.percentile)
+	#the values are copied in an array given by NewDistances, so they are partitioned on disk
+	#if a distances directory is set
+	#return a numpy array containing one value per quantile
+	def Quantiles(self,distances,quantiles):
+		data = self.NewDistances('quantiles',sum(np.size(dist) for dist in distances))
+		start = 0
+		for dist in distances:
+			data[start:start+np.size(dist)] = np.ravel(dist)
+			start += np.size(dist)
+
+		position = np.asarray(quantiles,dtype=float)*(data.size-1)
+		lower = np.floor(position).astype(int)
+		upper = np.minimum(lower+1,data.size-1)
+
+		data.partition(np.union1d(lower,upper))
+
+		weight = position-lower
+		return data[lower]*(1-weight)+data[upper]*weight
+
+	#compute exactly the weighted quantiles of the distances (list of arrays) with their weights
+	#(list of arrays of the same sizes): the values are sorted and linearly interpolated
+	#between the cumulated weights (same convention as Quantiles when all the weights are equal)
+	#return a numpy array containing one value per quantile
+	def WeightedQuantiles(self,distances,weights,quantiles):
+		data = np.concatenate([np.ravel(dist) for dist in distances])
+		weights = np.concatenate([np.ravel(weight) for weight in weights]).astype(np.float64)
+
+		order = np.argsort(data,kind='stable')
+		data = data[order]
+		weights = weights[order]
+
+		cumulated = np.cumsum(weights)-weights
+		if cumulated[-1] <= 0:
+			return self.Quantiles([data],quantiles)
+		return np.interp(quantiles,cumulated/cumulated[-1],data)
+
+	#compute the statistic values exactly from the distances (list of arrays) instead of the histogram
+	#the sums are computed by chunks, so no temporary array of the size of the distances is created
+	#weights: optional list of the weights of the distances (see AreaWeights)
+	#return minimum, maximum, mean, sigma, MSD, MAD, median, IQR, IQR_Q1, IQR_Q3
+	def ExactStatistics(self,distances,weights=None):
+		distances = [np.asarray(dist) for dist in distances]
+		if weights is not None:
+			return self.WeightedExactStatistics(distances,weights)
+		N = sum(dist.size for dist in distances)
+
+		minimum, IQR_Q1, median, IQR_Q3, maximum = self.Quantiles(distances,[0,0.25,0.5,0.75,1.0])
+
+		chunks = [dist[start:stop] for dist in distances for start,stop in _Chunks(dist.size,self.chunk_size)]
+
+		mean = sum(np.sum(chunk,dtype=np.float64) for chunk in chunks)/N
+		variance = sum(np.sum((chunk-mean)**2) for chunk in chunks)/N
+		sigma = np.sqrt(variance)
+
+		MSD = sum(np.sum(np.square(chunk,dtype=np.float64)) for chunk in chunks)/N
+		MAD = sum(np.sum(np.abs(chunk),dtype=np.float64) for chunk in chunks)/N
+
+		IQR = IQR_Q3-IQR_Q1
+
+		return minimum, maximum, mean, sigma, MSD, MAD, median, IQR, IQR_Q1, IQR_Q3
+
+	#compute the statistic values exactly from the distances weighted by weights (see ExactStatistics)
+	#minimum and maximum are the extreme distances, whatever their weights
+	#return minimum, maximum, mean, sigma, MSD, MAD, median, IQR, IQR_Q1, IQR_Q3
+	def WeightedExactStatistics(self,distances,weights):
+		weights = [np.asarray(weight,dtype=np.float64) for weight in weights]
+
+		minimum = min(np.min(dist) for dist in distances)
+		maximum = max(np.max(dist) for dist in distances)
+		IQR_Q1, median, IQR_Q3 = self.WeightedQuantiles(distances,weights,[0.25,0.5,0.75])
+
+		chunks = [(dist[start:stop],weight[start:stop]) for dist,weight in zip(distances,weights) for start,stop in _Chunks(dist.size,self.chunk_size)]
+		W = sum(np.sum(weight) for chunk,weight in chunks)
+
+		mean = sum(np.dot(chunk,weight) for chunk,weight in chunks)/W
+		variance = sum(np.dot((chunk-mean)**2,weight) for chunk,weight in chunks)/W
+		sigma = np.sqrt(variance)
+
+		MSD = sum(np.dot(np.square(chunk,dtype=np.float64),weight) for chunk,weight in chunks)/W
+		MAD = sum(np.dot(np.abs(chunk),weight) for chunk,weight in chunks)/W
+
+		IQR = IQR_Q3-IQR_Q1
+
+		return minimum, maximum, mean, sigma, MSD, MAD, median, IQR, IQR_Q1, IQR_Q3
+
 	#compute the histogram and the statistic values associated
 	#mode=0: A->B, mode=1: B->A, mode=2: A->B and B->A
+	#stats_engine='histogram': statistics are computed from the histogram (accurate to the bin width)
+	#stats_engine='exact': statistics are computed exactly from the distances
+	#area_weighted=True: the points are weighted by the area of the surface around them (see AreaWeights),
+	#the histograms (sums of areas) and the statistics are the ones of the surfaces
+	#the values already computed for the same shapes and parameters are read from the result cache if any (see SetResultCache)
 	#return a dictionnary containing all the values
-	def ComputeValues(self,signed=True,bins=256,correspondence=False):
+	def ComputeValues(self,signed=True,bins=256,correspondence=False,stats_engine='histogram',area_weighted=False):
+		if stats_engine not in ('histogram','exact'):
+			raise ValueError("stats_engine should be 'histogram' or 'exact'", stats_engine)
 
-		self.A_polydata = self.A_reader.GetOutput()
-		self.B_polydata = self.B_reader.GetOutput()
+		self.linearSample(self.sampling_level,self.max_edge_length)
 
-		hist_dict,edge,distances=self.Histogram(signed=signed,bins=bins,correspondence=correspondence)
+		key=None
+		if self.result_cache is not None and self.distances_directory is None:
+			key=self.result_cache.Key((self.A_path,self.B_path),signed=signed,bins=bins,correspondence=correspondence,stats_engine=stats_engine,
+				area_weighted=area_weighted,subdivisions=self.sampling_level,max_edge_length=self.max_edge_length,engine=self.engine)
+			stats_dict=self.result_cache.Get(key)
+			if stats_dict is not None:
+				return stats_dict
 
+		weights=self.AreaWeights() if area_weighted else None
+
+		hist_dict,edge,distances=self.Histogram(signed=signed,bins=bins,correspondence=correspondence,weights=weights)
+
+		stats_dict=self.Statistics(hist_dict,edge,distances,signed=signed,bins=bins,correspondence=correspondence,stats_engine=stats_engine,weights=weights)
+
+		if key is not None:
+			self.result_cache.Put(key,stats_dict)
+
+		return stats_dict
+
+	#compute the histograms and the statistic values of stats_dict (as returned by ComputeValues) again
+	#with another number of bins, from the distances kept in stats_dict: the distances are not computed again
+	#the histograms have the same range as the ones of ComputeValues (all the distances of the pair)
+	#area weighted values: the weights are computed from the shapes set, which should be the ones of stats_dict
+	#return a dictionnary containing all the values, as ComputeValues
+	def RebinValues(self,stats_dict,bins):
+		if any('distances' not in stats for stats in stats_dict.values()):
+			raise ValueError('The distances are needed to compute the histograms again')
+		first=next(iter(stats_dict.values()))
+		signed=bool(first['signed_distances'])
+		correspondence=bool(first['corresponding_points_exist'])
+		stats_engine=first['statistics_engine']
+		weights=self.AreaWeights() if first.get('area_weighted') else None
+		weight=lambda mode,i: weights[mode][i] if weights else None
+
+		distances=dict((mode,list(stats['distances'])) for mode,stats in stats_dict.items())
+		mini=min(np.min(dist) for dist_list in distances.values() for dist in dist_list)
+		maxi=max(np.max(dist) for dist_list in distances.values() for dist in dist_list)
+
+		hist_dict=dict()
+		for mode,dist_list in distances.items():
+			for i in range(len(dist_list)):
+				hist,edge=np.histogram(dist_list[i],bins=bins,range=(mini,maxi),weights=weight(mode,i))
+				hist_dict[mode]=hist if i == 0 else hist_dict[mode]+hist
+
+		return self.Statistics(hist_dict,edge,distances,signed=signed,bins=bins,correspondence=correspondence,stats_engine=stats_engine,weights=weights)
+
+	#compute the statistic values of each mode from its histogram and its distances
+	#(as returned by Histogram or SampleHistogram), and the weights of the distances if any
+	#return a dictionnary containing all the values
+	def Statistics(self,hist_dict,edge,distances,signed=True,bins=256,correspondence=False,stats_engine='histogram',weights=None):
 		stats_dict=dict()
 		for mode in hist_dict.keys():
 			self.hist=hist_dict[mode]
 			self.edge=edge
 			self.edgemean = self.EdgeMean()
 
-			minimum, maximum = self.MinAndMax()
+			if stats_engine == 'exact':
+				minimum, maximum, mean, sigma, MSD, MAD, median, IQR, IQR_Q1, IQR_Q3 = self.ExactStatistics(distances[mode],weights[mode] if weights else None)
 
-			Hausdorf = self.Hausdorf(minimum,maximum)
+				Hausdorf = self.Hausdorf(minimum,maximum)
 
-			mean,sigma =self.MeanAndSigma()
+			else:
+				minimum, maximum = self.MinAndMax()
+
+				Hausdorf = self.Hausdorf(minimum,maximum)
 
-			MSD = self.MSD()
-			MAD = self.MAD()
+				mean,sigma =self.MeanAndSigma()
 
-			median = self.Median()
+				MSD = self.MSD()
+				MAD = self.MAD()
 
-			IQR,IQR_Q1,IQR_Q3=self.IQR()
+				median = self.Median()
+
+				IQR,IQR_Q1,IQR_Q3=self.IQR()
 
 			stats_values=dict()
 			stats_values['distances']=distances[mode]
@@ -339,6 +1371,8 @@ class StatisticsLogic:
 			stats_values['mode']=mode
 			stats_values['signed_distances']=signed
 			stats_values['number_of_bins']=bins
+			stats_values['statistics_engine']=stats_engine
+			stats_values['area_weighted']=weights is not None
 			stats_values['histogram']=self.hist.tolist()
 			stats_values['edge']=self.edge.tolist()
 			stats_values['edge_mean']=self.edgemean.tolist()
@@ -360,6 +1394,241 @@ class StatisticsLogic:
 
 		return stats_dict
 
+	#compute the histograms as Histogram, only from the distances of a stratified random sample
+	#of the points of each shape (see _StratifiedSample)
+	#fraction: size of the samples, as a fraction of the number of points
+	#random: numpy RandomState used to draw the samples
+	#return the histograms, the edges and the distances of the sampled points
+	def SampleHistogram(self,signed=True,bins=256,correspondence=False,fraction=0.01,random=np.random):
+		A = vtk_to_numpy(self.getPolydata('A').GetPoints().GetData())
+		B = vtk_to_numpy(self.getPolydata('B').GetPoints().GetData())
+
+		hist_dict=dict()
+		distances=dict()
+		if correspondence:
+			#the same points are sampled in both shapes
+			sample = _StratifiedSample(len(A),fraction,random)
+			distab = np.linalg.norm(A[sample]-B[sample],axis=1)
+			distba = distab.copy()
+
+			if signed:
+				for dist,points,surface in ((distab,A,'B'),(distba,B,'A')):
+					sample_points=vtk.vtkPoints()
+					sample_points.SetData(numpy_to_vtk(np.ascontiguousarray(points[sample]),deep=1))
+					sample_polydata=vtk.vtkPolyData()
+					sample_polydata.SetPoints(sample_points)
+
+					enclosed_points=vtk.vtkSelectEnclosedPoints()
+					enclosed_points.SetInputData(sample_polydata)
+					enclosed_points.SetSurfaceData(self.getPolydata(surface))
+					enclosed_points.SetTolerance(0.000000001)
+					enclosed_points.Update()
+
+					inside = vtk_to_numpy(enclosed_points.GetOutput().GetPointData().GetArray('SelectedPoints')) != 0
+					np.negative(dist,out=dist,where=inside)
+			else:
+				hist , edge = np.histogram(distab,bins=bins)
+				hist_dict['A<->B'] = hist
+				distances['A<->B'] = [distab]
+				return hist_dict, edge, distances
+		else:
+			distab = self.GetLocator('B').Evaluate(A[_StratifiedSample(len(A),fraction,random)])
+			distba = self.GetLocator('A').Evaluate(B[_StratifiedSample(len(B),fraction,random)])
+			if not signed:
+				np.abs(distab,out=distab)
+				np.abs(distba,out=distba)
+
+		mini=min(np.min(distab),np.min(distba))
+		maxi=max(np.max(distab),np.max(distba))
+
+		histab,edge=np.histogram(distab,bins=bins,range=(mini,maxi))
+		histba,edge=np.histogram(distba,bins=bins,range=(mini,maxi))
+
+		hist_dict['A->B'] = histab
+		hist_dict['B->A'] = histba
+		hist_dict['A->B & B->A'] = histab +histba
+		distances['A->B'] = [distab]
+		distances['B->A'] = [distba]
+		distances['A->B & B->A'] = [distab,distba]
+
+		return hist_dict, edge, distances
+
+	#compute approximate statistic values from a stratified random sample of the points (see SampleHistogram)
+	#the values of each mode get confidence intervals (see ConfidenceIntervals) and the keys
+	#'approximate' (True), 'sample_size' and 'number_of_points' (size of the sampled population)
+	#seed: seed of the random samples, None gives different samples at each call
+	#return a dictionnary containing all the values, as ComputeValues
+	def SampleValues(self,signed=True,bins=256,correspondence=False,stats_engine='histogram',fraction=0.01,z=1.96,seed=None):
+		if stats_engine not in ('histogram','exact'):
+			raise ValueError("stats_engine should be 'histogram' or 'exact'", stats_engine)
+
+		self.linearSample(self.sampling_level,self.max_edge_length)
+
+		hist_dict,edge,distances=self.SampleHistogram(signed=signed,bins=bins,correspondence=correspondence,fraction=fraction,random=np.random.RandomState(seed))
+
+		stats_dict=self.Statistics(hist_dict,edge,distances,signed=signed,bins=bins,correspondence=correspondence,stats_engine=stats_engine)
+
+		points={'A':self.A_polydata.GetNumberOfPoints(),'B':self.B_polydata.GetNumberOfPoints()}
+		for mode,stats_values in stats_dict.items():
+			if mode in ('A->B','A<->B'):
+				N=points['A']
+			elif mode == 'B->A':
+				N=points['B']
+			else:
+				N=points['A']+points['B']
+
+			stats_values['approximate']=True
+			stats_values['sample_size']=sum(np.size(dist) for dist in distances[mode])
+			stats_values['number_of_points']=N
+			stats_values['confidence_intervals']=self.ConfidenceIntervals(distances[mode],N,z=z)
+
+		return stats_dict
+
+	#compute the confidence intervals of the statistic values estimated from a sample of the distances
+	#distances: list of arrays, the sample; N: number of points of the whole population
+	#z: z-score of the intervals (1.96: 95% intervals)
+	#mean, msd and mad: normal approximation with the finite population correction
+	#sigma: normal approximation of the standard deviation of a sample standard deviation
+	#median, iqr_q1 and iqr_q3: order statistics around the rank of the quantile (distribution free)
+	#minimum and maximum are only bounded on one side by the sample, they have no interval
+	#return a dictionnary of (lower, upper) intervals
+	def ConfidenceIntervals(self,distances,N,z=1.96):
+		sample = np.sort(np.concatenate([np.ravel(dist) for dist in distances]))
+		n = sample.size
+
+		correction = np.sqrt(max(0.0,1.0-float(n)/N)) if N > 1 else 0.0
+		intervals = dict()
+		for key,values in (('mean',sample),('msd',np.square(sample)),('mad',np.abs(sample))):
+			mean = np.mean(values)
+			error = z*np.std(values)/np.sqrt(n)*correction
+			intervals[key] = (mean-error,mean+error)
+
+		sigma = np.std(sample)
+		error = z*sigma/np.sqrt(2.0*max(n-1,1))*correction
+		intervals['sigma'] = (max(0.0,sigma-error),sigma+error)
+
+		for key,quantile in (('iqr_q1',0.25),('median',0.5),('iqr_q3',0.75)):
+			error = z*np.sqrt(n*quantile*(1-quantile))*correction
+			lower = int(max(0,np.floor(n*quantile-error)))
+			upper = int(min(n-1,np.ceil(n*quantile+error)))
+			intervals[key] = (sample[lower],sample[upper])
+
+		intervals['iqr'] = (max(0.0,intervals['iqr_q3'][0]-intervals['iqr_q1'][1]),intervals['iqr_q3'][1]-intervals['iqr_q1'][0])
+
+		return intervals
+
+	#compute the statistic values progressively: first from stratified random samples of
+	#increasing sizes (see SampleValues), then exactly from all the points (see ComputeValues)
+	#fractions: sizes of the samples, as fractions of the number of points
+	#exact: if False, the exact values are not computed
+	#return a generator giving the dictionnary of values of each step
+	def ProgressiveValues(self,signed=True,bins=256,correspondence=False,stats_engine='histogram',fractions=(0.01,0.1),exact=True,z=1.96,seed=None):
+		random=np.random.RandomState(seed)
+		for fraction in fractions:
+			yield self.SampleValues(signed=signed,bins=bins,correspondence=correspondence,stats_engine=stats_engine,fraction=fraction,z=z,seed=random.randint(2**31-1))
+		if exact:
+			yield self.ComputeValues(signed=signed,bins=bins,correspondence=correspondence,stats_engine=stats_engine)
+
+	#read a manifest describing a batch of shape pairs to compare
+	#the manifest is either a CSV file (with a header) or a JSON file (list of objects)
+	#each entry needs a 'fileA' and a 'fileB' field and can override the 'bins', 'signed',
+	#'correspondence', 'stats_engine', 'engine', 'area_weighted', 'subdivisions', 'max_edge_length'
+	#and 'hausdorf' parameters, the given values are used otherwise.
+	#threads: number of threads used to compute the distances of each pair (see _ComputeBatchJob)
+	#relative paths are relative to the manifest directory
+	#return a list of jobs (dictionaries) to give to ComputeBatch
+	def ReadManifest(self,file_path,bins=256,signed=False,correspondence=False,stats_engine='histogram',engine='vtk',area_weighted=False,
+		subdivisions=1,max_edge_length=0,hausdorf=False,threads=1):
+		if os.path.splitext(file_path)[1].lower() == '.json':
+			with open(file_path,'r') as jsonfile:
+				entries = json.load(jsonfile)
+		else:
+			with open(file_path,'r') as csvfile:
+				entries = list(csv.DictReader(csvfile))
+
+		directory = os.path.dirname(os.path.abspath(file_path))
+
+		jobs=list()
+		for entry in entries:
+			job=dict()
+			job['fileA']=os.path.join(directory,entry['fileA'])
+			job['fileB']=os.path.join(directory,entry['fileB'])
+			job['bins']=int(entry.get('bins') or bins)
+			job['signed']=_ToBool(entry.get('signed'),signed)
+			job['correspondence']=_ToBool(entry.get('correspondence'),correspondence)
+			job['stats_engine']=entry.get('stats_engine') or stats_engine
+			job['engine']=entry.get('engine') or engine
+			job['area_weighted']=_ToBool(entry.get('area_weighted'),area_weighted)
+			job['subdivisions']=int(entry.get('subdivisions') or subdivisions)
+			job['max_edge_length']=float(entry.get('max_edge_length') or max_edge_length)
+			job['hausdorf']=_ToBool(entry.get('hausdorf'),hausdorf)
+			job['threads']=threads
+			jobs.append(job)
+
+		return jobs
+
+	#compute the statistics of every job (see ReadManifest) using a pool of worker processes
+	#workers=0 uses one worker per core, workers=1 computes everything in the current process
+	#a failing pair does not stop the batch: its result has status 'failed' and an 'error' message
+	#the per vertex distances are not kept to keep the result set small
+	#the progress is the fraction of the jobs done, a cancelled batch (see Cancel) stops when the next job is done
+	#return a list containing one result dictionary per job, in the same order as jobs
+	def ComputeBatch(self,jobs,workers=0):
+		if workers <= 0:
+			workers = multiprocessing.cpu_count()
+		workers = min(workers,len(jobs))
+
+		#the progress counts the jobs done
+		self.StartProgress(len(jobs))
+		if workers <= 1:
+			results = list()
+			for job in jobs:
+				results.append(_ComputeBatchJob(job))
+				self.ReportProgress(1)
+			return results
+
+		#give several consecutive jobs to the same worker, so shapes shared
+		#by consecutive pairs are loaded once, while keeping workers balanced
+		chunksize = max(1,len(jobs)//(4*workers))
+
+		pool = multiprocessing.Pool(workers)
+		try:
+			results = list()
+			for result in pool.imap(_ComputeBatchJob,jobs,chunksize):
+				results.append(result)
+				self.ReportProgress(1)
+		except:
+			#cancelled: the workers are stopped at once
+			pool.terminate()
+			raise
+		finally:
+			pool.close()
+			pool.join()
+
+		return results
+
+	#flatten the results of ComputeBatch to get one dictionary per pair and per mode
+	#these dictionaries can be saved using SaveStatsAsCSV or SaveStatsAsJSON
+	def FlattenBatchResults(self,results):
+		rows=list()
+		for result in results:
+			pair=dict()
+			pair['fileA']=result['fileA']
+			pair['fileB']=result['fileB']
+			pair['status']=result['status']
+
+			if result['status'] != 'ok':
+				pair['error']=result['error']
+				rows.append(pair)
+				continue
+
+			for stats in result['results']:
+				row=dict(pair)
+				row.update(stats)
+				rows.append(row)
+
+		return rows
+
 	#Save in a CSV file (file_path), all the dictionaries of the list dict_list
 	#each dictionary should come from the ComputeValues function.
 	def SaveStatsAsCSV(self,file_path,dict_list):
@@ -370,12 +1639,23 @@ class StatisticsLogic:
 			pass
 
 		with open(file_path,'w') as csvfile:
-			fieldnames = dict_list[0].keys()
+			#dictionaries can have different keys (e.g. failed pairs of a batch)
+			fieldnames = list()
+			for stats in dict_list:
+				for key in stats.keys():
+					if key not in fieldnames:
+						fieldnames.append(key)
 			writer = csv.DictWriter(csvfile, fieldnames=fieldnames, lineterminator='\n')
 
 			writer.writeheader()
 			for stats in dict_list:
-				writer.writerow(stats)
+				row=dict()
+				for key,value in stats.items():
+					#arrays (e.g. distances) are only converted into lists here
+					if isinstance(value,(list,np.ndarray)):
+						value=json.dumps(value,default=_ToSerializable)
+					row[key]=value
+				writer.writerow(row)
 
 	#Save in a JSON file (file_path), all the dictionaries of the list dict_list
 	#each dictionary should come from the ComputeValues function.
@@ -387,7 +1667,58 @@ class StatisticsLogic:
 			pass
 
 		with open(file_path,'w') as jsonfile:
-			json.dump(dict_list,jsonfile,indent=4)
+			#arrays (e.g. distances) are only converted into lists here
+			json.dump(dict_list,jsonfile,indent=4,default=_ToSerializable)
+
+	#Save in a binary NPZ file (file_path), all the dictionaries of the list dict_list
+	#each dictionary should come from the ComputeValues function.
+	#the archive contains a small JSON 'summary' (all the values except the distances)
+	#and one uncompressed array per distances array, named in the 'distances' field of the summary
+	#an array shared by several modes (e.g. A->B and A->B & B->A) is only saved once
+	#shapes: optional dictionary of polydatas (e.g. {'A':...,'B':...} the subdivided shapes) whose points
+	#and polygons are saved with the results (see LoadShapes), so they do not have to be written and read again
+	def SaveStatsAsNPZ(self,file_path,dict_list,shapes=None):
+		#np.savez would add the extension if it is missing
+		with open(file_path,'wb') as npzfile:
+			_WriteNPZ(npzfile,dict_list,shapes)
+
+	#Load the dictionaries saved by SaveStatsAsNPZ or SaveStatsAsJSON in file_path
+	#the distances (and the other lists) are returned as numpy arrays
+	#distances=False: only the summary is read and the 'distances' field is removed
+	#return a list of dictionaries
+	def LoadStats(self,file_path,distances=True):
+		if os.path.splitext(file_path)[1].lower() == '.npz':
+			dict_list=_ReadNPZ(file_path,distances)
+		else:
+			with open(file_path,'r') as jsonfile:
+				dict_list=json.load(jsonfile)
+			for stats in dict_list:
+				if 'distances' in stats:
+					stats['distances']=[np.array(dist) for dist in stats['distances']]
+
+		for stats in dict_list:
+			if not distances:
+				stats.pop('distances',None)
+			for key,value in stats.items():
+				if isinstance(value,list) and key != 'distances':
+					stats[key]=np.array(value)
+
+		return dict_list
+
+	#Load the shapes saved with the results by SaveStatsAsNPZ in file_path
+	#return a dictionary of polydatas (points and polygons only), empty if no shape was saved
+	def LoadShapes(self,file_path):
+		shapes=dict()
+		with np.load(file_path) as archive:
+			for name in archive.files:
+				if name.startswith('shape_') and name.endswith('_points'):
+					ID=name[len('shape_'):-len('_points')]
+					polydata=vtk.vtkPolyData()
+					polydata.SetPoints(vtk.vtkPoints())
+					polydata.GetPoints().SetData(numpy_to_vtk(archive[name]))
+					polydata.SetPolys(_CellArray(archive['shape_'+ID+'_offsets'],archive['shape_'+ID+'_connectivity']))
+					shapes[ID]=polydata
+		return shapes
 
 	#test stats functions with a normal law
 	def test(self,mu=0,sig=1,bins=1000):
@@ -427,3 +1758,804 @@ class StatisticsLogic:
 		print('IQR_Q1:\t\t',IQR_Q1)
 		print('IQR_Q3:\t\t',IQR_Q3)
 
+
+#read a legacy .vtk polydata file
+#the ASCII files made of POINTS and POLYGONS sections (the usual surface meshes) are parsed with numpy
+#and the polydata is built on the parsed arrays without copying them, the other files
+#(binary, other cells, field data...) are read with vtkPolyDataReader
+#geometry_only: the point and cell data sections (POINT_DATA, CELL_DATA) are ignored, otherwise
+#a file containing them is read with vtkPolyDataReader
+#cache: MeshCache where the geometry is looked for before parsing the file, and stored after
+#(only used if geometry_only is True)
+#return a vtkPolyData
+def ReadPolyData(file_path,geometry_only=False,cache=None):
+	if cache is not None and geometry_only:
+		polydata=cache.Get(file_path)
+		if polydata is not None:
+			return polydata
+
+	polydata=_ParseLegacyPolyData(file_path,geometry_only)
+	if polydata is None:
+		reader=vtk.vtkPolyDataReader()
+		reader.SetFileName(file_path)
+		reader.Update()
+		polydata=reader.GetOutput()
+
+	if cache is not None and geometry_only:
+		cache.Put(file_path,polydata)
+	return polydata
+
+#on disk cache of the geometry (points and cells) of the shapes read by ReadPolyData
+#a shape is stored in a directory named by the hash of the content of its file, the points and the
+#offsets and connectivity of each type of cells are saved in .npy files which are mapped in memory
+#(copy on write) when the shape is read again, so a shape shared by many pairs is only parsed once
+#the hash of a file is stored in a reference named by its path, modification time and size,
+#so the file is only hashed when it changes
+#the entries are written in temporary directories which are then renamed, so several processes
+#can share the cache. The least recently used entries are removed when the cache exceeds max_size
+#(in bytes). Needs a VTK with the offsets and connectivity cell arrays (VTK 9).
+class MeshCache:
+	#default size of the cache (in bytes)
+	max_size=4*1024**3
+
+	cells=('verts','lines','polys','strips')
+
+	def __init__(self,directory,max_size=None):
+		self.directory=directory
+		if max_size is not None:
+			self.max_size=max_size
+		for subdirectory in ('meshes','references'):
+			path=os.path.join(directory,subdirectory)
+			if not os.path.isdir(path):
+				try:
+					os.makedirs(path)
+				except OSError:
+					if not os.path.isdir(path):
+						raise
+		self.enabled=hasattr(vtk.vtkCellArray(),'GetConnectivityArray')
+
+	#return the polydata of the file cached, None if it is not in the cache
+	def Get(self,file_path):
+		if not self.enabled:
+			return None
+		path=os.path.join(self.directory,'meshes',self.ContentHash(file_path))
+		if not os.path.isdir(path):
+			return None
+		try:
+			points=np.load(os.path.join(path,'points.npy'),mmap_mode='c')
+			cells=dict()
+			for name in self.cells:
+				if os.path.exists(os.path.join(path,name+'_offsets.npy')):
+					cells[name]=_CellArray(np.load(os.path.join(path,name+'_offsets.npy'),mmap_mode='c'),
+						np.load(os.path.join(path,name+'_connectivity.npy'),mmap_mode='c'))
+			#the entry is marked as recently used (explicit time: the file system clock is too coarse to order two reads)
+			now=time.time_ns()
+			os.utime(path,ns=(now,now))
+		except (IOError,OSError,ValueError):
+			#entry removed by another process
+			return None
+
+		polydata=vtk.vtkPolyData()
+		polydata.SetPoints(vtk.vtkPoints())
+		polydata.GetPoints().SetData(numpy_to_vtk(points))
+		polydata.SetVerts(cells.get('verts'))
+		polydata.SetLines(cells.get('lines'))
+		polydata.SetPolys(cells.get('polys'))
+		polydata.SetStrips(cells.get('strips'))
+		return polydata
+
+	#store the geometry of polydata, read from the file, in the cache
+	def Put(self,file_path,polydata):
+		if not self.enabled or polydata.GetPoints() is None:
+			return
+		path=os.path.join(self.directory,'meshes',self.ContentHash(file_path))
+		if os.path.isdir(path):
+			return
+
+		temporary=tempfile.mkdtemp(dir=os.path.join(self.directory,'meshes'),prefix='.tmp')
+		try:
+			np.save(os.path.join(temporary,'points.npy'),vtk_to_numpy(polydata.GetPoints().GetData()))
+			for name,cells in zip(self.cells,(polydata.GetVerts(),polydata.GetLines(),polydata.GetPolys(),polydata.GetStrips())):
+				if cells is not None and cells.GetNumberOfCells() > 0:
+					np.save(os.path.join(temporary,name+'_offsets.npy'),vtk_to_numpy(cells.GetOffsetsArray()))
+					np.save(os.path.join(temporary,name+'_connectivity.npy'),vtk_to_numpy(cells.GetConnectivityArray()))
+			os.rename(temporary,path)
+		except OSError:
+			#stored by another process at the same time
+			if not os.path.isdir(path):
+				raise
+		finally:
+			shutil.rmtree(temporary,ignore_errors=True)
+
+		self.Evict()
+
+	#return the hash of the content of the file, hashed once per file version
+	def ContentHash(self,file_path):
+		return _ContentHash(os.path.join(self.directory,'references'),file_path)
+
+	#remove the least recently used entries until the cache fits in max_size
+	def Evict(self):
+		meshes=os.path.join(self.directory,'meshes')
+		entries=list()
+		for name in os.listdir(meshes):
+			path=os.path.join(meshes,name)
+			if name.startswith('.tmp') or not os.path.isdir(path):
+				continue
+			try:
+				size=sum(os.path.getsize(os.path.join(path,array)) for array in os.listdir(path))
+				entries.append((os.stat(path).st_mtime_ns,size,path))
+			except OSError:
+				continue
+
+		total=sum(size for mtime,size,path in entries)
+		for mtime,size,path in sorted(entries):
+			if total <= self.max_size:
+				break
+			shutil.rmtree(path,ignore_errors=True)
+			total-=size
+
+#cache of the statistic values computed by StatisticsLogic.ComputeValues (see SetResultCache)
+#an entry is identified by the contents of the two shapes and the parameters of the computation
+#the last entries used are kept in memory (max_memory bytes of distances), all the entries on disk,
+#one NPZ file each in directory/results, the least recently used files being removed above max_size bytes
+#the files are written under a temporary name then renamed, so several processes can share the directory
+class ResultCache:
+	#default size of the cache on disk and in memory (in bytes)
+	max_size=4*1024**3
+	max_memory=512*1024**2
+
+	#changed when the values computed for the same parameters change
+	version=1
+
+	def __init__(self,directory,max_size=None,max_memory=None):
+		self.directory=directory
+		if max_size is not None:
+			self.max_size=max_size
+		if max_memory is not None:
+			self.max_memory=max_memory
+		for subdirectory in ('results','references'):
+			path=os.path.join(directory,subdirectory)
+			if not os.path.isdir(path):
+				try:
+					os.makedirs(path)
+				except OSError:
+					if not os.path.isdir(path):
+						raise
+
+		self.entries=collections.OrderedDict()
+		self.memory=0
+		self.lock=threading.Lock()
+
+	#return the key of the values computed between the files (content hashes) with the given parameters
+	def Key(self,file_paths,**parameters):
+		hashes=[_ContentHash(os.path.join(self.directory,'references'),file_path) for file_path in file_paths]
+		return hashlib.sha1(repr((self.version,hashes,sorted(parameters.items()))).encode('utf-8')).hexdigest()
+
+	#return the values cached for key (a copy of the dictionary of each mode), None if they are not in the cache
+	def Get(self,key):
+		with self.lock:
+			if key in self.entries:
+				stats_dict,size=self.entries.pop(key)
+				self.entries[key]=(stats_dict,size)
+				return _CopyStats(stats_dict)
+
+		path=os.path.join(self.directory,'results',key+'.npz')
+		try:
+			dict_list=_ReadNPZ(path)
+			#the entry is marked as recently used (explicit time: the file system clock is too coarse to order two reads)
+			now=time.time_ns()
+			os.utime(path,ns=(now,now))
+		except (IOError,OSError,ValueError):
+			#not computed yet or removed by another process
+			return None
+
+		stats_dict=collections.OrderedDict((stats['mode'],stats) for stats in dict_list)
+		self.Remember(key,stats_dict)
+		return _CopyStats(stats_dict)
+
+	#store the values computed for key, in memory and on disk
+	def Put(self,key,stats_dict):
+		stats_dict=_CopyStats(stats_dict)
+		self.Remember(key,stats_dict)
+
+		path=os.path.join(self.directory,'results',key+'.npz')
+		handle,temporary=tempfile.mkstemp(dir=os.path.join(self.directory,'results'),prefix='.tmp',suffix='.npz')
+		try:
+			with os.fdopen(handle,'wb') as npzfile:
+				_WriteNPZ(npzfile,list(stats_dict.values()))
+			os.replace(temporary,path)
+		finally:
+			if os.path.exists(temporary):
+				os.remove(temporary)
+
+		self.Evict()
+
+	#keep the values in memory, the least recently used ones are released above max_memory
+	def Remember(self,key,stats_dict):
+		arrays=dict((id(dist),dist) for stats in stats_dict.values() for dist in stats.get('distances',()))
+		size=sum(np.asarray(dist).nbytes for dist in arrays.values())
+		with self.lock:
+			if key in self.entries:
+				self.memory-=self.entries.pop(key)[1]
+			self.entries[key]=(stats_dict,size)
+			self.memory+=size
+			while self.memory>self.max_memory and len(self.entries)>1:
+				old_key,(old_stats_dict,old_size)=self.entries.popitem(last=False)
+				self.memory-=old_size
+
+	#remove the least recently used files until the cache fits in max_size
+	def Evict(self):
+		results=os.path.join(self.directory,'results')
+		entries=list()
+		for name in os.listdir(results):
+			if name.startswith('.tmp'):
+				continue
+			try:
+				stat=os.stat(os.path.join(results,name))
+				entries.append((stat.st_mtime_ns,stat.st_size,os.path.join(results,name)))
+			except OSError:
+				continue
+
+		total=sum(size for mtime,size,path in entries)
+		for mtime,size,path in sorted(entries):
+			if total <= self.max_size:
+				break
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+			total-=size
+
+	#release the values kept in memory (the files are kept)
+	def Clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.memory=0
+
+#compute the progressive statistic values (see StatisticsLogic.ProgressiveValues) of two shape files
+#in a background thread, so an interface can show the approximate values while they are refined
+#valmet: StatisticsLogic used by the thread (its locators are kept for the next computations)
+#subdivisions, max_edge_length: the shapes are subdivided in memory first (see linearSample), as for the exact values
+#the other parameters are given to ProgressiveValues
+#the last values computed are given by GetResults, Cancel stops the computation after the current step
+class ProgressiveStatistics(threading.Thread):
+	def __init__(self,valmet,fileA,fileB,subdivisions=1,max_edge_length=0,**parameters):
+		threading.Thread.__init__(self)
+		self.daemon=True
+
+		self.valmet=valmet
+		self.files={'A':fileA,'B':fileB}
+		self.subdivisions=subdivisions
+		self.max_edge_length=max_edge_length
+		self.parameters=parameters
+
+		self.lock=threading.Lock()
+		self.results=None
+		self.step=0
+		self.error=None
+		self.cancelled=threading.Event()
+
+	def run(self):
+		try:
+			for ID,file_path in self.files.items():
+				if getattr(self.valmet,ID+'_file_key') != _FileKey(file_path):
+					self.valmet.Set(ID,file_path)
+			self.valmet.linearSample(self.subdivisions,self.max_edge_length)
+
+			for stats_dict in self.valmet.ProgressiveValues(**self.parameters):
+				if self.cancelled.is_set():
+					break
+				with self.lock:
+					self.results=stats_dict
+					self.step+=1
+		except ComputationCancelled:
+			pass
+		except Exception as e:
+			self.error=e
+
+	#return the number of steps done and the values of the last one (None before the first one)
+	def GetResults(self):
+		with self.lock:
+			return self.step, self.results
+
+	#stop the computation, the distances being computed stop after their current chunk
+	def Cancel(self):
+		self.cancelled.set()
+		if self.is_alive():
+			self.valmet.Cancel()
+
+#return the hash of the content of the file, hashed once per file version: the hash is written in the
+#directory references, in a file named from the path, the modification time and the size of the file
+def _ContentHash(references,file_path):
+	key=repr(_FileKey(file_path)).encode('utf-8')
+	reference=os.path.join(references,hashlib.sha1(key).hexdigest())
+	try:
+		with open(reference,'r') as referencefile:
+			return referencefile.read()
+	except IOError:
+		pass
+
+	content_hash=hashlib.sha1()
+	with open(file_path,'rb') as vtkfile:
+		for block in iter(lambda: vtkfile.read(1024**2),b''):
+			content_hash.update(block)
+	content_hash=content_hash.hexdigest()
+
+	handle,temporary=tempfile.mkstemp(dir=references,prefix='.tmp')
+	with os.fdopen(handle,'w') as referencefile:
+		referencefile.write(content_hash)
+	os.replace(temporary,reference)
+	return content_hash
+
+#write the dictionaries of dict_list and the shapes in the open file npzfile (see StatisticsLogic.SaveStatsAsNPZ)
+def _WriteNPZ(npzfile,dict_list,shapes=None):
+	summary=list()
+	arrays=collections.OrderedDict()
+	names=dict()
+	for i in range(len(dict_list)):
+		stats=dict(dict_list[i])
+		if 'distances' in stats:
+			stats_names=list()
+			for j in range(len(stats['distances'])):
+				dist=stats['distances'][j]
+				if id(dist) not in names:
+					names[id(dist)]='distances_%d_%d' % (i,j)
+					arrays[names[id(dist)]]=np.asarray(dist)
+				stats_names.append(names[id(dist)])
+			stats['distances']=stats_names
+		summary.append(stats)
+
+	if shapes is not None:
+		for ID,polydata in shapes.items():
+			polys=polydata.GetPolys()
+			arrays['shape_'+ID+'_points']=vtk_to_numpy(polydata.GetPoints().GetData())
+			arrays['shape_'+ID+'_offsets']=vtk_to_numpy(polys.GetOffsetsArray())
+			arrays['shape_'+ID+'_connectivity']=vtk_to_numpy(polys.GetConnectivityArray())
+
+	summary=json.dumps(summary,default=_ToSerializable)
+	np.savez(npzfile,summary=np.array(summary),**arrays)
+
+#read the dictionaries saved by _WriteNPZ in file_path, the values are the ones of the JSON summary
+#and the distances numpy arrays (an array shared by several modes is only read once)
+#distances=False: the distances are not read (the 'distances' field gives the names of the arrays)
+#return a list of dictionaries
+def _ReadNPZ(file_path,distances=True):
+	#the arrays of the archive are only read when they are accessed
+	with np.load(file_path) as archive:
+		dict_list=json.loads(str(archive['summary']))
+		if distances:
+			arrays=dict()
+			for stats in dict_list:
+				if 'distances' in stats:
+					for name in stats['distances']:
+						if name not in arrays:
+							arrays[name]=archive[name]
+					stats['distances']=[arrays[name] for name in stats['distances']]
+	return dict_list
+
+#return a copy of the values of each mode of stats_dict, so the cached values are not modified
+#(the distances arrays are shared)
+def _CopyStats(stats_dict):
+	return collections.OrderedDict((mode,dict(stats)) for mode,stats in stats_dict.items())
+
+#return the cKDTree class of scipy, imported at the first call, None if scipy is not available
+def _KDTree():
+	global cKDTree
+	if cKDTree is None:
+		try:
+			from scipy.spatial import cKDTree
+		except ImportError:
+			cKDTree=False
+	return cKDTree or None
+
+#convert a manifest value (bool, int or string) into a boolean
+#return default if the value is not set
+def _ToBool(value,default=False):
+	if value is None or value == '':
+		return default
+	if isinstance(value,str):
+		return value.strip().lower() in ('yes','true','t','1')
+	return bool(value)
+
+#convert the numpy arrays and values contained in the results into python objects
+#used as default function to serialize the results
+def _ToSerializable(value):
+	if isinstance(value,np.ndarray):
+		return value.tolist()
+	if isinstance(value,np.generic):
+		return value.item()
+	raise TypeError('Object of type %s is not serializable' % type(value).__name__)
+
+#return the point ids of the triangles of a vtkCellArray containing only triangles (numpy array n x 3)
+def _TrianglesToNumpy(cells):
+	if hasattr(cells,'GetConnectivityArray'):
+		return vtk_to_numpy(cells.GetConnectivityArray()).reshape(-1,3)
+	return vtk_to_numpy(cells.GetData()).reshape(-1,4)[:,1:]
+
+#return the vectors (numpy array n x 3) divided by their norm (0 for the null vectors)
+def _UnitVectors(vectors):
+	norms=np.linalg.norm(vectors,axis=1)[:,np.newaxis]
+	return np.divide(vectors,norms,out=np.zeros_like(vectors),where=norms>0)
+
+#return the order of the points (numpy array n x 3) along a Morton curve (10 bits per coordinate),
+#consecutive points in this order are close to each other
+def _MortonOrder(points):
+	low=np.min(points,axis=0)
+	span=np.max(np.max(points,axis=0)-low)
+	cells=np.zeros(points.shape,dtype=np.int64) if span == 0 else ((points-low)*(1023/span)).astype(np.int64)
+	codes=np.zeros(len(points),dtype=np.int64)
+	for bit in range(10):
+		for axis in range(3):
+			codes|=((cells[:,axis]>>bit)&1)<<(3*bit+axis)
+	return np.argsort(codes,kind='stable')
+
+#return the point ids of the triangles of a polydata (numpy array n x 3), None if it has other cells
+def _Triangles(polydata):
+	polys=polydata.GetPolys()
+	if polydata.GetNumberOfCells() != polys.GetNumberOfCells() or (polys.GetNumberOfCells() and polys.GetMaxCellSize() != 3):
+		return None
+	return _TrianglesToNumpy(polys)
+
+#match the points new (numpy array n x 3) with the points old at exactly the same position
+#return the index of the point of old matching each point of new (-1 if there is none, or if
+#several points of old or of new are at this position), the position ids of the points of old
+#followed by the ones of new (same id: same position) and False if several points of old or of new are at the same position
+def _MatchPoints(old,new):
+	rows=np.ascontiguousarray(np.concatenate((old,new)),dtype=np.float64).view(np.dtype((np.void,24))).ravel()
+	groups,first,ids=np.unique(rows,return_index=True,return_inverse=True)
+	ids=ids.ravel()
+	old_counts=np.bincount(ids[:len(old)],minlength=len(groups))
+	new_counts=np.bincount(ids[len(old):],minlength=len(groups))
+	new_ids=ids[len(old):]
+	match=np.where((old_counts[new_ids] == 1) & (new_counts[new_ids] == 1),first[new_ids],-1)
+	return match, ids, max(np.max(old_counts,initial=0),np.max(new_counts,initial=0)) <= 1
+
+#return the triangles (numpy array n x 3 of point ids) as the position ids of their points (see _MatchPoints),
+#rotated to start from the smallest one, so the same triangle with the same orientation gets the same row
+def _TriangleKeys(triangles,ids):
+	keys=ids[triangles]
+	order=(np.argmin(keys,axis=1)[:,np.newaxis]+np.arange(3))%3
+	return np.ascontiguousarray(np.take_along_axis(keys,order,axis=1))
+
+#return a mask of the points which could be closer than their distance (absolute value) to a triangle
+#in one of the spheres (centers, radii): the distance from a point to a triangle is at least the distance
+#to the center of its bounding sphere minus the radius (so a few farther points may be included)
+def _NearSpheres(points,distances,centers,radii):
+	if len(centers) == 0 or len(points) == 0:
+		return np.zeros(len(points),dtype=bool)
+	points=np.asarray(points,dtype=np.float64)
+	tolerance=1e-9*(1+np.max(np.abs(centers))+np.max(radii))
+
+	cKDTree=_KDTree()
+	if cKDTree is not None:
+		gaps=cKDTree(centers).query(points)[0]-np.max(radii)
+	else:
+		gaps=np.empty(len(points))
+		for start,stop in _Chunks(len(points),max(1,2**20//len(centers))):
+			gaps[start:stop]=np.min(np.linalg.norm(points[start:stop,np.newaxis,:]-centers,axis=2)-radii,axis=1)
+	return gaps <= np.abs(distances)+tolerance
+
+#compute the closest points to the points p on the triangles (a,b,c), all given as numpy arrays n x 3
+#the closest point is the projection on the plane of the triangle if it is inside the triangle,
+#the closest point on the closest edge otherwise
+#return the barycentric coordinates of the closest points (n x 3) and the squared distances
+def _ClosestPointOnTriangles(p,a,b,c):
+	ab=b-a
+	ac=c-a
+	bc=c-b
+	ap=p-a
+	bp=p-b
+
+	d00=np.einsum('ij,ij->i',ab,ab)
+	d01=np.einsum('ij,ij->i',ab,ac)
+	d11=np.einsum('ij,ij->i',ac,ac)
+	d20=np.einsum('ij,ij->i',ap,ab)
+	d21=np.einsum('ij,ij->i',ap,ac)
+
+	with np.errstate(divide='ignore',invalid='ignore'):
+		#projection on the plane
+		denom=d00*d11-d01*d01
+		v=(d11*d20-d01*d21)/denom
+		w=(d00*d21-d01*d20)/denom
+		weights=np.stack([1-v-w,v,w],axis=1)
+		dist2=np.sum((ap-v[:,np.newaxis]*ab-w[:,np.newaxis]*ac)**2,axis=1)
+		outside=~np.all(weights>=0,axis=1)
+
+		#edges AB, AC and BC
+		tab=np.clip(d20/d00,0,1)
+		tac=np.clip(d21/d11,0,1)
+		tbc=np.clip(np.einsum('ij,ij->i',bp,bc)/np.einsum('ij,ij->i',bc,bc),0,1)
+		edges_dist2=np.stack([np.sum((ap-tab[:,np.newaxis]*ab)**2,axis=1),
+				np.sum((ap-tac[:,np.newaxis]*ac)**2,axis=1),
+				np.sum((bp-tbc[:,np.newaxis]*bc)**2,axis=1)],axis=1)
+	#degenerated edges
+	edges_dist2[np.isnan(edges_dist2)]=np.inf
+	edge=np.argmin(edges_dist2,axis=1)
+
+	zero=np.zeros_like(tab)
+	edges_weights=np.stack([np.stack([1-tab,tab,zero],axis=1),
+				np.stack([1-tac,zero,tac],axis=1),
+				np.stack([zero,1-tbc,tbc],axis=1)],axis=1)
+	weights[outside]=edges_weights[outside,edge[outside]]
+	dist2[outside]=edges_dist2[outside,edge[outside]]
+
+	return weights,dist2
+
+#numpy type of the vtkIdType values
+_ID_TYPE=np.int64 if vtk.vtkIdTypeArray().GetDataTypeSize() == 8 else np.int32
+
+#end of the line preceding a keyword in a legacy .vtk file (the numbers never start with a letter)
+_LEGACY_KEYWORD=re.compile(br'\n[ \t]*[A-Za-z]')
+
+#parse a legacy ASCII .vtk file containing only POINTS and POLYGONS sections (see ReadPolyData)
+#return the polydata, or None if the file contains anything else
+def _ParseLegacyPolyData(file_path,geometry_only):
+	with open(file_path,'rb') as vtkfile:
+		data=vtkfile.read()
+
+	header=data.split(b'\n',4)
+	if len(header) < 5 or not header[0].startswith(b'# vtk DataFile Version'):
+		return None
+	if header[2].strip().upper() != b'ASCII' or header[3].split() != [b'DATASET',b'POLYDATA']:
+		return None
+	legacy=float(header[0].split()[-1]) < 5.0
+
+	#split the rest of the file in sections: keyword line and numbers following it
+	body=b'\n'+header[4]
+	starts=[match.start()+1 for match in _LEGACY_KEYWORD.finditer(body)]+[len(body)]
+	sections=list()
+	for start,stop in zip(starts[:-1],starts[1:]):
+		line,_,numbers=body[start:stop].partition(b'\n')
+		sections.append((line.split(),numbers))
+
+	points=None
+	polys=None
+	i=0
+	while i < len(sections):
+		keyword,numbers=sections[i]
+		name=keyword[0].upper()
+		if name == b'POINTS' and len(keyword) == 3 and keyword[2] in (b'float',b'double'):
+			points=_ParseNumbers(numbers,np.float64,3*int(keyword[1]))
+			if points is None:
+				return None
+			if keyword[2] == b'float':
+				points=points.astype(np.float32)
+			points=points.reshape(-1,3)
+
+		elif name == b'POLYGONS' and len(keyword) == 3:
+			if legacy:
+				cells=_ParseNumbers(numbers,np.int64,int(keyword[2]))
+				polys=_LegacyCellArray(cells,int(keyword[1]))
+			else:
+				#OFFSETS and CONNECTIVITY sections follow
+				if i+2 >= len(sections) or sections[i+1][0][0] != b'OFFSETS' or sections[i+2][0][0] != b'CONNECTIVITY':
+					return None
+				offsets=_ParseNumbers(sections[i+1][1],np.int64,int(keyword[1]))
+				connectivity=_ParseNumbers(sections[i+2][1],np.int64,int(keyword[2]))
+				polys=_CellArray(offsets,connectivity)
+				i+=2
+			if polys is None:
+				return None
+
+		elif name in (b'POINT_DATA',b'CELL_DATA') and geometry_only:
+			break
+
+		else:
+			return None
+		i+=1
+
+	if points is None:
+		return None
+
+	polydata=vtk.vtkPolyData()
+	polydata.SetPoints(vtk.vtkPoints())
+	polydata.GetPoints().SetData(numpy_to_vtk(points))
+	if polys is not None:
+		polydata.SetPolys(polys)
+	return polydata
+
+#parse count whitespace separated numbers of type dtype
+#return a numpy array, or None if the numbers cannot be parsed
+def _ParseNumbers(numbers,dtype,count):
+	with warnings.catch_warnings():
+		warnings.simplefilter('error')
+		try:
+			values=np.fromstring(numbers,dtype=dtype,sep=' ')
+		except (ValueError,DeprecationWarning):
+			return None
+	if values.size != count:
+		return None
+	return values
+
+#build a vtkCellArray from offsets and connectivity arrays, without copying them when possible
+#return None if the arrays are not consistent
+def _CellArray(offsets,connectivity):
+	if offsets is None or connectivity is None or len(offsets) == 0 or offsets[0] != 0 or offsets[-1] != len(connectivity):
+		return None
+	cells=vtk.vtkCellArray()
+	if hasattr(cells,'SetData') and hasattr(cells,'GetConnectivityArray'):
+		cells.SetData(numpy_to_vtkIdTypeArray(offsets.astype(_ID_TYPE,copy=False)),numpy_to_vtkIdTypeArray(connectivity.astype(_ID_TYPE,copy=False)))
+	else:
+		counts=np.diff(offsets)
+		legacy=np.insert(connectivity,offsets[:-1],counts)
+		cells.SetCells(len(counts),numpy_to_vtkIdTypeArray(legacy.astype(_ID_TYPE)))
+	return cells
+
+#build a vtkCellArray of n cells from the legacy layout (number of points of each cell followed by its ids)
+#return None if the array is not consistent
+def _LegacyCellArray(cells,n):
+	if cells is None:
+		return None
+	if len(cells) > 0 and len(cells)%n == 0 and np.all(cells[::len(cells)//n] == len(cells)//n-1):
+		#cells of the same size (e.g. triangles), the usual case
+		size=len(cells)//n-1
+		connectivity=cells.reshape(n,size+1)[:,1:].ravel()
+		return _CellArray(np.arange(n+1)*size,connectivity)
+
+	offsets=np.zeros(n+1,dtype=np.int64)
+	position=0
+	for i in range(n):
+		if position >= len(cells):
+			return None
+		offsets[i+1]=offsets[i]+cells[position]
+		position+=cells[position]+1
+	if position != len(cells):
+		return None
+	keep=np.ones(len(cells),dtype=bool)
+	keep[offsets[:-1]+np.arange(n)]=False
+	return _CellArray(offsets,cells[keep])
+
+#return the ids of the points of the polygons and the strips of polydata (the points of its surface)
+def _SurfacePointIds(polydata):
+	ids=list()
+	for cells in (polydata.GetPolys(),polydata.GetStrips()):
+		if cells.GetNumberOfCells() == 0:
+			continue
+		if hasattr(cells,'GetConnectivityArray'):
+			ids.append(vtk_to_numpy(cells.GetConnectivityArray()))
+		else:
+			#legacy layout: number of points of the cell followed by its point ids
+			data=vtk_to_numpy(cells.GetData())
+			keep=np.ones(len(data),dtype=bool)
+			i=0
+			while i < len(data):
+				keep[i]=False
+				i+=data[i]+1
+			ids.append(data[keep])
+
+	used=np.zeros(polydata.GetNumberOfPoints(),dtype=bool)
+	for cell_ids in ids:
+		used[cell_ids]=True
+	return np.nonzero(used)[0]
+
+#compute the area of the surface around each point of the polydata (barycentric area): each triangle
+#gives one third of its area to each of its points, the polygons are split in fans of triangles and
+#the strips in their triangles, all at once; the points used by no polygon get a zero area
+#return a numpy array (float64)
+def _PointAreas(polydata):
+	points=vtk_to_numpy(polydata.GetPoints().GetData()).astype(np.float64)
+	areas=np.zeros(len(points))
+	for cells,fan in ((polydata.GetPolys(),True),(polydata.GetStrips(),False)):
+		if cells.GetNumberOfCells() == 0:
+			continue
+		offsets=vtk_to_numpy(cells.GetOffsetsArray()).astype(np.int64)
+		connectivity=vtk_to_numpy(cells.GetConnectivityArray())
+
+		#triangle k of a cell starting at start: (start, start+k+1, start+k+2) in a fan,
+		#(start+k, start+k+1, start+k+2) in a strip
+		count=np.maximum(np.diff(offsets)-2,0)
+		start=np.repeat(offsets[:-1],count)
+		k=np.arange(len(start))-np.repeat(np.cumsum(count)-count,count)
+		a=connectivity[start if fan else start+k]
+		b=connectivity[start+k+1]
+		c=connectivity[start+k+2]
+
+		area=np.linalg.norm(np.cross(points[b]-points[a],points[c]-points[a]),axis=1)/6
+		for ids in (a,b,c):
+			areas+=np.bincount(ids,weights=area,minlength=len(points))
+	return areas
+
+#draw a stratified random sample of fraction*n indices among n (at least one):
+#the indices are split in strata of equal sizes and one index is drawn in each stratum,
+#so the sample covers the whole shape (neighbouring points have close indices)
+#random: numpy RandomState used to draw the indices
+#return a sorted numpy array of indices
+def _StratifiedSample(n,fraction,random=np.random):
+	size = int(min(n,max(1,np.ceil(fraction*n))))
+	bounds = (np.arange(size+1)*n)//size
+	return bounds[:-1]+(random.random_sample(size)*np.diff(bounds)).astype(int)
+
+#return the (start, stop) bounds of the chunks of chunk_size elements covering n elements
+def _Chunks(n,chunk_size):
+	return [(start,min(start+chunk_size,n)) for start in range(0,n,chunk_size)]
+
+#remove a file if it exists (and can be removed)
+def _RemoveFile(file_path):
+	try:
+		os.remove(file_path)
+	except OSError:
+		pass
+
+#return the key identifying the content of a file: its absolute path, modification time and size
+def _FileKey(file_path):
+	return (os.path.abspath(file_path),os.path.getmtime(file_path),os.path.getsize(file_path))
+
+#statistics logic of a batch worker, kept between the jobs of the worker
+#so a shape shared by several pairs (e.g. a template) is only loaded once
+_batch_logic=None
+
+#compute the statistics of one batch job, in a worker process (or in the server, see ShapeStatisticsServer)
+#optional fields of the job: 'subdivisions' and 'max_edge_length' (see linearSample), 'threads', 'hausdorf' (only the Hausdorff
+#distances are computed), 'incremental' (see SetIncremental) and 'save_path' (the results, with the distances,
+#are saved as by the CLI)
+#any error is reported in the returned result instead of being raised, its 'status' is 'cancelled'
+#if the job was cancelled (see _CancelBatchJob)
+#started: _StartBatchJob was already called for this job (by the server, before the job can be cancelled)
+def _ComputeBatchJob(job,started=False):
+	valmet=_batch_logic if started else _StartBatchJob()
+
+	result=dict(job)
+	try:
+		if job.get('mesh_cache') and (valmet.mesh_cache is None or valmet.mesh_cache.directory != job['mesh_cache']):
+			valmet.SetMeshCache(job['mesh_cache'])
+		if job.get('result_cache') and (valmet.result_cache is None or valmet.result_cache.directory != job['result_cache']):
+			valmet.SetResultCache(job['result_cache'])
+
+		for ID,file_path in (('A',job['fileA']),('B',job['fileB'])):
+			if getattr(valmet,ID+'_file_key') != _FileKey(file_path):
+				valmet.Set(ID,file_path)
+
+		valmet.SetEngine(job.get('engine','vtk'))
+		valmet.threads=job.get('threads',1)
+		valmet.SetIncremental(job.get('incremental',False))
+		valmet.linearSample(job.get('subdivisions',1),job.get('max_edge_length',0))
+		if job.get('hausdorf'):
+			stats_dict=valmet.ComputeHausdorf(correspondence=job['correspondence'])
+		else:
+			stats_dict=valmet.ComputeValues(bins=job['bins'],signed=job['signed'],correspondence=job['correspondence'],stats_engine=job['stats_engine'],area_weighted=job.get('area_weighted',False))
+
+		if job.get('save_path'):
+			shapes=None
+			if job.get('subdivisions',1) > 1 or job.get('max_edge_length',0) > 0:
+				shapes={'A':valmet.getPolydata('A'),'B':valmet.getPolydata('B')}
+			if job['save_path'].lower().endswith('.npz'):
+				valmet.SaveStatsAsNPZ(job['save_path'],list(stats_dict.values()),shapes=shapes)
+			else:
+				valmet.SaveStatsAsJSON(job['save_path'],list(stats_dict.values()))
+
+		result['results']=list()
+		for mode,stats in stats_dict.items():
+			stats.pop('distances',None)
+			result['results'].append(stats)
+		result['status']='ok'
+
+	except ComputationCancelled as e:
+		result['status']='cancelled'
+		result['error']=str(e)
+
+	except Exception as e:
+		result['status']='failed'
+		result['error']='%s: %s' % (type(e).__name__,e)
+
+	return result
+
+#prepare the statistics logic of this process for a new batch job and return it: a cancellation
+#received during the previous job does not stop this one, and the progress starts from 0
+def _StartBatchJob():
+	global _batch_logic
+	if _batch_logic is None:
+		_batch_logic=StatisticsLogic()
+	_batch_logic.cancelled.clear()
+	_batch_logic.StartProgress(0)
+	return _batch_logic
+
+#return the progress (0 to 1) of the batch job computed by this process, None if no job was computed
+def _BatchJobProgress():
+	if _batch_logic is None:
+		return None
+	return _batch_logic.GetProgress()
+
+#cancel the batch job computed by this process (see StatisticsLogic.Cancel)
+def _CancelBatchJob():
+	if _batch_logic is not None:
+		_batch_logic.Cancel()
@@ -0,0 +1,440 @@
+from __future__ import print_function
+import os
+import sys
+import json
+import select
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import getpass
+import binascii
+import stat
+
+#long-lived process computing the statistics jobs sent by the CLI and the module (see StatisticsServer)
+#the shapes and their locators stay loaded between the jobs, and a job does not pay the start of
+#python and the import of vtk: the statistics logic is only imported by the server
+#the server and its clients exchange JSON lines over a unix socket, or a local TCP socket
+#where unix sockets are not available (the port is then written in the server directory)
+#every request carries the token written in the server directory, only readable by the user
+
+#server shutting down when no request is received during idle_timeout seconds
+DEFAULT_IDLE_TIMEOUT=600
+
+#the cancellations of the jobs which did not start are kept this number of seconds (see StatisticsServer.CancelJob)
+CANCELLED_JOBS_TIMEOUT=60
+
+#return the directory of the server of the current user (socket, port and token files)
+#in the runtime directory of the user if there is one, in the temporary directory otherwise
+def ServerDirectory():
+	if os.environ.get('XDG_RUNTIME_DIR'):
+		return os.path.join(os.environ['XDG_RUNTIME_DIR'],'ShapeStatistics')
+	return os.path.join(tempfile.gettempdir(),'ShapeStatistics-'+getpass.getuser())
+
+class StatisticsServer:
+	def __init__(self,directory=None,idle_timeout=DEFAULT_IDLE_TIMEOUT):
+		self.directory=directory or ServerDirectory()
+		self.idle_timeout=idle_timeout
+
+		self.socket=None
+		self.token=None
+		#lock file held while the server runs, see Bind
+		self.lockfile=None
+		self.start_time=time.time()
+		self.last_request=self.start_time
+		self.jobs=0
+		self.busy=False
+		#id of the running job, and time of the cancellation of the jobs cancelled before they run
+		self.running=None
+		self.cancelled=dict()
+		self.stopped=threading.Event()
+
+		#the jobs share the statistics logic of the process, they are computed one at a time
+		self.lock=threading.Lock()
+		#protects the running job and the cancellations, held to start or to cancel a job
+		self.state_lock=threading.Lock()
+
+	#listen to the clients until a shutdown request or idle_timeout seconds without request
+	#each connection is handled in its own thread, so the health check answers during a job
+	#return False at once if another server uses the directory
+	def Serve(self):
+		if not self.Bind():
+			return False
+		try:
+			while not self.stopped.is_set():
+				try:
+					connection,address=self.socket.accept()
+				except socket.timeout:
+					if not self.busy and time.time()-self.last_request > self.idle_timeout:
+						break
+					continue
+				thread=threading.Thread(target=self.Handle,args=(connection,))
+				thread.daemon=True
+				thread.start()
+		finally:
+			self.Close()
+		return True
+
+	#create the socket and write the files used by the clients to connect
+	#the server holds an exclusive lock on the lock file of the directory until it is closed: when several
+	#servers are started at once (e.g. by two clients), only the first one writes its token and its socket,
+	#the other ones return False
+	#raise an IOError if the directory is not a private directory of the user (see _CheckDirectory)
+	def Bind(self):
+		if not os.path.lexists(self.directory):
+			try:
+				os.makedirs(self.directory,0o700)
+				#the mode given to makedirs is reduced by the umask
+				os.chmod(self.directory,0o700)
+			except OSError:
+				#created by another server
+				if not os.path.lexists(self.directory):
+					raise
+		_CheckDirectory(self.directory)
+
+		self.lockfile=_LockFile(os.path.join(self.directory,'lock'))
+		if self.lockfile is None:
+			return False
+
+		self.token=binascii.hexlify(os.urandom(16)).decode('ascii')
+		_WriteFile(os.path.join(self.directory,'token'),self.token)
+
+		if hasattr(socket,'AF_UNIX'):
+			path=os.path.join(self.directory,'socket')
+			if os.path.exists(path):
+				os.remove(path)
+			self.socket=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+			self.socket.bind(path)
+		else:
+			self.socket=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+			self.socket.bind(('127.0.0.1',0))
+			_WriteFile(os.path.join(self.directory,'port'),str(self.socket.getsockname()[1]))
+		self.socket.listen(8)
+		#the idle time is checked every second
+		self.socket.settimeout(1.0)
+		return True
+
+	#close the socket and remove the files of the server, then release the lock of the directory
+	#(the lock file is kept: a server waiting for it could otherwise lock a removed file)
+	def Close(self):
+		self.socket.close()
+		for name in ('socket','port','token'):
+			try:
+				os.remove(os.path.join(self.directory,name))
+			except OSError:
+				pass
+		self.lockfile.close()
+		self.lockfile=None
+
+	#answer the requests of a connection, one JSON line each, until the client closes it
+	#the connection is watched during a job, which is cancelled if the client closes it (see WatchClient)
+	def Handle(self,connection):
+		connection.settimeout(None)
+		stream=connection.makefile('rwb')
+		#the progress sent by WatchClient and the response are not mixed
+		write_lock=threading.Lock()
+		try:
+			for line in stream:
+				request=json.loads(line.decode('utf-8'))
+				done=threading.Event()
+				if request.get('command') == 'compute':
+					#jobs sent without id get one, so they can still be cancelled when their client leaves
+					request.setdefault('id',NewJobId())
+					send=None
+					if request.get('progress'):
+						def send(message,done=done):
+							with write_lock:
+								#no progress after the response
+								if not done.is_set():
+									_WriteMessage(stream,message)
+					watcher=threading.Thread(target=self.WatchClient,args=(connection,request['id'],done,send))
+					watcher.daemon=True
+					watcher.start()
+				try:
+					response=self.Process(request)
+				finally:
+					done.set()
+				with write_lock:
+					_WriteMessage(stream,response)
+		except (IOError,OSError,ValueError):
+			pass
+		finally:
+			#the response to a client which closed the connection is not sent
+			try:
+				stream.close()
+			except (IOError,OSError):
+				pass
+			connection.close()
+
+	#cancel the job job_id of a connection if the client closes the connection before the response
+	#(e.g. the CLI sending the job is killed when its node is cancelled), so the cores are freed at once
+	#send: if given, called with {'status':'progress','progress':value} when the progress of the running job changes
+	def WatchClient(self,connection,job_id,done,send=None):
+		progress=None
+		while not done.wait(0.2):
+			try:
+				readable=select.select([connection],[],[],0)[0]
+				if readable and not connection.recv(1,socket.MSG_PEEK):
+					break
+				if send is not None and self.running == job_id:
+					value=sys.modules['ShapeStatistics']._BatchJobProgress()
+					if value != progress:
+						send({'status':'progress','progress':value})
+						progress=value
+			except (IOError,OSError,ValueError):
+				break
+		if not done.is_set():
+			self.CancelJob(job_id)
+
+	#cancel the job job_id: the running job stops after its current chunk of points, a job which did not
+	#start yet (waiting for the running one, or not received yet) is cancelled when it starts
+	#the jobs of the other clients are not cancelled
+	#return True if the job was running
+	def CancelJob(self,job_id):
+		with self.state_lock:
+			if self.running == job_id:
+				sys.modules['ShapeStatistics']._CancelBatchJob()
+				return True
+			#cancellations of jobs which never start are forgotten after a while
+			now=time.time()
+			for cancelled_id,cancel_time in list(self.cancelled.items()):
+				if now-cancel_time > CANCELLED_JOBS_TIMEOUT:
+					del self.cancelled[cancelled_id]
+			self.cancelled[job_id]=now
+			return False
+
+	#process a request: {'command':'ping'} (health check, with the progress of the running job),
+	#{'command':'compute','job':job,'id':job_id,'progress':bool} (job as returned by StatisticsLogic.ReadManifest, see ShapeStatistics._ComputeBatchJob,
+	#job_id chosen by the client, see NewJobId, progress to receive {'status':'progress'} messages before the response), {'command':'cancel','id':job_id} (see CancelJob) or {'command':'shutdown'}
+	#return the response dictionary, its 'status' is 'ok' or 'failed' (with an 'error' message)
+	def Process(self,request):
+		self.last_request=time.time()
+		if request.get('token') != self.token:
+			return {'status':'failed','error':'Invalid token'}
+
+		command=request.get('command')
+		if command == 'ping':
+			response={'status':'ok','pid':os.getpid(),'uptime':time.time()-self.start_time,'jobs':self.jobs,'busy':self.busy,'idle_timeout':self.idle_timeout}
+			if self.busy:
+				response['progress']=sys.modules['ShapeStatistics']._BatchJobProgress()
+			return response
+
+		if command == 'compute':
+			import ShapeStatistics
+			job_id=request.get('id')
+			with self.lock:
+				#the cancellations of the previous job are cleared before the job can be cancelled
+				with self.state_lock:
+					if self.cancelled.pop(job_id,None) is not None:
+						result=dict(request['job'],status='cancelled',error='Cancelled before it started')
+						return {'status':result['status'],'error':result['error'],'result':result}
+					ShapeStatistics._StartBatchJob()
+					self.busy=True
+					self.running=job_id
+				try:
+					result=ShapeStatistics._ComputeBatchJob(request['job'],started=True)
+				finally:
+					with self.state_lock:
+						self.busy=False
+						self.running=None
+					self.jobs+=1
+					self.last_request=time.time()
+			return {'status':result['status'],'error':result.get('error'),'result':result}
+
+		if command == 'cancel':
+			#the running job is not waited for, it holds the lock
+			if request.get('id') is None:
+				return {'status':'failed','error':'Missing job id'}
+			return {'status':'ok','cancelled':self.CancelJob(request['id'])}
+
+		if command == 'shutdown':
+			self.stopped.set()
+			return {'status':'ok'}
+
+		return {'status':'failed','error':'Unknown command: %s' % command}
+
+#client of the server of the current user
+#timeout: maximum time (seconds) to wait for a response, None waits as long as the job runs
+class StatisticsClient:
+	def __init__(self,directory=None,timeout=None):
+		self.directory=directory or ServerDirectory()
+		self.timeout=timeout
+
+	#send a request to the server and return its response
+	#progress: called with the value of the {'status':'progress'} messages received before the response
+	#raise an IOError if the server is not running, or if its directory is not a private directory of the user
+	def Request(self,request,progress=None):
+		try:
+			_CheckDirectory(self.directory)
+			with open(os.path.join(self.directory,'token'),'r') as tokenfile:
+				request=dict(request,token=tokenfile.read())
+			if os.path.exists(os.path.join(self.directory,'port')):
+				with open(os.path.join(self.directory,'port'),'r') as portfile:
+					connection=socket.create_connection(('127.0.0.1',int(portfile.read())),self.timeout)
+			else:
+				connection=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+				connection.settimeout(self.timeout)
+				connection.connect(os.path.join(self.directory,'socket'))
+		except (IOError,OSError,ValueError) as e:
+			raise IOError('ShapeStatistics server not running: %s' % e)
+
+		stream=connection.makefile('rwb')
+		try:
+			_WriteMessage(stream,request)
+			while True:
+				line=stream.readline()
+				if not line:
+					raise IOError('ShapeStatistics server closed the connection')
+				response=json.loads(line.decode('utf-8'))
+				if response.get('status') != 'progress':
+					return response
+				if progress is not None:
+					progress(response['progress'])
+		finally:
+			stream.close()
+			connection.close()
+
+	#health check: return the state of the server (pid, uptime, number of jobs, busy), None if it does not answer
+	def Ping(self,timeout=2.0):
+		client=StatisticsClient(self.directory,timeout)
+		try:
+			response=client.Request({'command':'ping'})
+		except (IOError,OSError,ValueError):
+			return None
+		return response if response.get('status') == 'ok' else None
+
+	#compute a job in the server and return its result (see ShapeStatistics._ComputeBatchJob)
+	#job_id: id used to cancel the job (see Cancel), a new one by default
+	#progress: called with the progress of the job (from 0 to 1) when it changes, sent on the same connection
+	def Compute(self,job,job_id=None,progress=None):
+		response=self.Request({'command':'compute','job':job,'id':job_id or NewJobId(),'progress':progress is not None},progress)
+		if 'result' not in response:
+			raise IOError(response.get('error'))
+		return response['result']
+
+	#cancel the job job_id, running or not started yet, its result has the status 'cancelled'
+	def Cancel(self,job_id):
+		return self.Request({'command':'cancel','id':job_id})
+
+	#ask the server to stop after the running jobs
+	def Shutdown(self):
+		return self.Request({'command':'shutdown'})
+
+	#start a server in the background if none answers, and wait until it answers
+	#python: command running the python scripts (the current interpreter by default)
+	#return True if the server answers
+	def Start(self,python=None,idle_timeout=DEFAULT_IDLE_TIMEOUT,wait=30.0):
+		if self.Ping() is not None:
+			return True
+
+		script=os.path.join(os.path.dirname(os.path.abspath(__file__)),'ShapeStatistics')
+		command=[python or sys.executable,script,'--serve','--idle-timeout',str(idle_timeout)]
+		if self.directory != ServerDirectory():
+			command+=['--server-directory',self.directory]
+		with open(os.devnull,'wb') as devnull:
+			subprocess.Popen(command,stdin=devnull,stdout=devnull,stderr=devnull,close_fds=True)
+
+		end=time.time()+wait
+		while time.time() < end:
+			if self.Ping() is not None:
+				return True
+			time.sleep(0.1)
+		return False
+
+#compute a job in the server in a background thread
+#the state is given by GetStatusString and GetProgress, as the ones of a CLI node run by slicer.cli.run
+class ServerJob(threading.Thread):
+	def __init__(self,client,job):
+		threading.Thread.__init__(self)
+		self.daemon=True
+
+		self.client=client
+		self.job=job
+		self.id=NewJobId()
+		self.result=None
+		self.error=None
+		self.status='Scheduled'
+		self.progress=0.0
+
+	def run(self):
+		self.status='Running'
+		try:
+			self.result=self.client.Compute(self.job,self.id,self.SetProgress)
+			if self.result['status'] != 'ok':
+				self.error=self.result.get('error')
+		except Exception as e:
+			self.error='%s: %s' % (type(e).__name__,e)
+		if self.result is not None and self.result['status'] == 'cancelled':
+			self.status='Cancelled'
+		else:
+			self.status='Completed' if self.error is None else 'Completed with errors'
+
+	def GetStatusString(self):
+		return self.status
+
+	def SetProgress(self,progress):
+		self.progress=progress
+
+	#return the progress of the job in percent, as the progress of a CLI node,
+	#last sent by the server with the job (no request is made)
+	def GetProgress(self):
+		if self.status != 'Running':
+			return 100.0 if self.status.startswith('Completed') else 0.0
+		return 100.0*self.progress
+
+	#stop the job after its current chunk of points, or before it starts (see StatisticsClient.Cancel)
+	def Cancel(self):
+		if self.status in ('Scheduled','Running'):
+			self.client.Cancel(self.id)
+
+#return a new id for a job sent to the server (see StatisticsServer.CancelJob)
+def NewJobId():
+	return binascii.hexlify(os.urandom(8)).decode('ascii')
+
+#open the file file_path (created if needed) and take an exclusive lock on it, released when the file is closed
+#return the open file, None if another process (or another open file) holds the lock
+def _LockFile(file_path):
+	descriptor=os.open(file_path,os.O_RDWR|os.O_CREAT,0o600)
+	lockfile=os.fdopen(descriptor,'r+')
+	try:
+		try:
+			import fcntl
+			fcntl.flock(lockfile.fileno(),fcntl.LOCK_EX|fcntl.LOCK_NB)
+		except ImportError:
+			import msvcrt
+			msvcrt.locking(lockfile.fileno(),msvcrt.LK_NBLCK,1)
+	except (IOError,OSError):
+		lockfile.close()
+		return None
+	return lockfile
+
+#raise an IOError unless directory is a directory (not a symbolic link) owned by the user and only accessible
+#by the user (mode 0700): another user could otherwise replace the socket or read the token
+#(the owner and the mode are not checked where they are not available, e.g. on Windows)
+def _CheckDirectory(directory):
+	status=os.lstat(directory)
+	if not stat.S_ISDIR(status.st_mode):
+		raise IOError('The ShapeStatistics server directory is not a directory: %s' % directory)
+	if hasattr(os,'getuid'):
+		if status.st_uid != os.getuid():
+			raise IOError('The ShapeStatistics server directory is owned by another user: %s' % directory)
+		if stat.S_IMODE(status.st_mode) != 0o700:
+			raise IOError('The ShapeStatistics server directory is accessible by other users (mode %o): %s' % (stat.S_IMODE(status.st_mode),directory))
+
+#write a file only readable by the user
+def _WriteFile(file_path,content):
+	descriptor=os.open(file_path,os.O_WRONLY|os.O_CREAT|os.O_TRUNC,0o600)
+	with os.fdopen(descriptor,'w') as outfile:
+		outfile.write(content)
+
+#write a message (one json line) to the stream of a connection
+def _WriteMessage(stream,message):
+	stream.write((json.dumps(message,default=_ToSerializable)+'\n').encode('utf-8'))
+	stream.flush()
+
+#convert the numpy arrays and values of the results into JSON values (numpy is not imported here)
+def _ToSerializable(value):
+	if hasattr(value,'tolist'):
+		return value.tolist()
+	raise TypeError('Object of type %s is not serializable' % type(value).__name__)